@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""Timing benchmarks of the optimized code paths, kept out of the unit tests.
+
+Usage:
+    python benchmarks/benchmark.py               # run all benchmarks
+    python benchmarks/benchmark.py cif vad       # run the given benchmarks
+
+The benchmarks reuse the fixtures and reference implementations of the unit tests in tests/.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import torch
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "tests"))
+sys.path.insert(0, ROOT_DIR)
+
+
+def benchmark_cif(args):
+    from funasr.models.predictor.cif import cif, cif_vectorized
+
+    hidden_size = 512
+    torch.manual_seed(0)
+    for len_time in [100, 500, 1000, 2000, 4000, 6000]:
+        hidden = torch.randn(1, len_time, hidden_size)
+        alphas = torch.rand(1, len_time) * 0.6
+        with torch.no_grad():
+            tic = time.perf_counter()
+            cif(hidden, alphas, 1.0)
+            time_loop = time.perf_counter() - tic
+            tic = time.perf_counter()
+            cif_vectorized(hidden, alphas, 1.0)
+            time_vec = time.perf_counter() - tic
+        print("cif T={}: loop {:.2f} ms, vectorized {:.2f} ms".format(len_time, time_loop * 1000, time_vec * 1000))
+
+
+def benchmark_vad(args):
+    from test_e2e_vad import build_vad_model, frame_states_loop, synthetic_chunks
+
+    model = build_vad_model()
+    time_loop, time_vectorized, time_total = 0.0, 0.0, 0.0
+    stream_state = model.NewStreamState()
+    with torch.no_grad():
+        for feats, waveform, is_final in synthetic_chunks(args.vad_seconds):
+            tic = time.perf_counter()
+            scores = model.encoder(feats, stream_state.in_cache)
+            model.DetectStream(stream_state, scores, waveform, is_final)
+            time_total += time.perf_counter() - tic
+
+            tic = time.perf_counter()
+            frame_states_loop(waveform, scores, model.vad_opts)
+            time_loop += time.perf_counter() - tic
+            tic = time.perf_counter()
+            frame_state = model.NewStreamState()
+            frame_state.ComputeDecibel(waveform)
+            frame_state.ComputeFrameProbs(scores)
+            time_vectorized += time.perf_counter() - tic
+    print("vad {}s: rtf {:.5f}, frame states loop {:.2f}s, vectorized {:.2f}s, rtf before {:.5f}".format(
+        args.vad_seconds, time_total / args.vad_seconds, time_loop, time_vectorized,
+        (time_total - time_vectorized + time_loop) / args.vad_seconds))
+
+
+def benchmark_speaker_index(args):
+    import numpy as np
+    from funasr.utils.speaker_index import SpeakerIndex
+    from test_speaker_index import random_speakers
+
+    for num_speakers in args.speaker_index_sizes:
+        keys, embeddings = random_speakers(num_speakers)
+        queries = embeddings[:100]
+        with tempfile.TemporaryDirectory() as index_dir:
+            SpeakerIndex.write(keys, embeddings, index_dir, num_partitions=int(np.sqrt(num_speakers)))
+            index = SpeakerIndex(index_dir)
+            tic = time.perf_counter()
+            index.search(queries, top_k=5)
+            time_exact = time.perf_counter() - tic
+            tic = time.perf_counter()
+            index.search(queries, top_k=5, num_probe=8)
+            time_approx = time.perf_counter() - tic
+        print("speaker index {} speakers, 100 queries: exact {:.3f}s, partitioned {:.3f}s".format(
+            num_speakers, time_exact, time_approx))
+
+
+def benchmark_sond_windowed(args):
+    import numpy as np
+    from test_sond_windowed import build_speech2diar, random_meeting
+
+    # 2 hours at 100 frames per second
+    spk_num = 4
+    profile = np.zeros((spk_num, 256), dtype=np.float32)
+    speech = random_meeting(720000, spk_num)
+    for window_size in [0, 6000]:
+        speech2diar = build_speech2diar(spk_num, window_size, window_size * 3 // 4)
+        tic = time.perf_counter()
+        speech2diar(speech, profile)
+        print("sond 2 hours, window_size {}: {:.2f}s, peak model input {} frames".format(
+            window_size, time.perf_counter() - tic, speech2diar.diar_model.max_frames))
+
+
+def benchmark_sond_postprocess(args):
+    from test_sond_postprocess import build_speech2diar, random_logits, reference_post_processing
+
+    # a 2-hour meeting has 720000 frames after upsampling
+    token_list = [str(i) for i in range(16)]
+    logits_idx, logits = random_logits(90000, 16)
+    speech2diar = build_speech2diar(token_list)
+    tic = time.perf_counter()
+    speech2diar.post_processing(logits, 4)
+    time_vectorized = time.perf_counter() - tic
+    tic = time.perf_counter()
+    reference_post_processing(logits_idx, token_list, 4, 83, 10)
+    time_reference = time.perf_counter() - tic
+    print("sond post-processing of 2 hours: vectorized {:.3f}s, frame by frame {:.3f}s".format(
+        time_vectorized, time_reference))
+
+
+def benchmark_punctuation_streaming(args):
+    import numpy as np
+    from test_punctuation_streaming import build_session
+
+    session = build_session()
+    rng = np.random.RandomState(0)
+    for num_calls in [100, 1000]:
+        tic = time.perf_counter()
+        for _ in range(num_calls):
+            session.feed(["w{}".format(x) for x in rng.randint(1, 100, 4)])
+        print("punctuation streaming {} calls: {:.2f}ms per call".format(
+            num_calls, (time.perf_counter() - tic) / num_calls * 1000))
+        session.finish()
+
+
+def benchmark_itn_memo(args):
+    import random
+    from fun_text_processing.inverse_text_normalization.inverse_normalize import InverseNormalizer
+
+    normalizer = InverseNormalizer(lang="en")
+    # ASR-like transcripts from a small vocabulary, not repeated verbatim
+    words = ("i we you they think said that the meeting is on friday at two thirty and it will cost about "
+             "twenty dollars please call me back tomorrow morning we need three more people for the project so "
+             "let us talk about it next week my email is john at gmail dot com the price went up by five percent "
+             "in january").split()
+    rng = random.Random(0)
+    corpus = [" ".join(rng.choice(words) for _ in range(rng.randint(5, 20))) for _ in range(args.itn_sentences)]
+    for memo_size in [0, 100000]:
+        normalizer.init_memo(memo_size)
+        tic = time.perf_counter()
+        for text in corpus:
+            normalizer.normalize(text)
+        num_lookups = max(normalizer.memo_hits + normalizer.memo_misses, 1)
+        print("itn memo_size {}: {:.2f} sentences/sec, hit rate {:.2%}".format(
+            memo_size, len(corpus) / (time.perf_counter() - tic), normalizer.memo_hits / num_lookups))
+
+
+def benchmark_hotword_set(args):
+    from funasr.utils.hotword_set import HotwordSet
+    from test_hotword_set import BiasModel, reference_embeddings, tokenize
+
+    torch.manual_seed(0)
+    model = BiasModel().eval()
+    hotwords = ["".join(chr(ord("a") + (i // 26 ** k) % 26) for k in range(4)) for i in range(5000)]
+    hotword_set = HotwordSet(model, tokenize)
+    tic = time.perf_counter()
+    hotword_set.update(hotwords)
+    hotword_set.embeddings()
+    build_time = time.perf_counter() - tic
+    tic = time.perf_counter()
+    for _ in range(100):
+        hotword_set.contextual_info(1)
+    cached_time = (time.perf_counter() - tic) / 100
+    tic = time.perf_counter()
+    with torch.no_grad():
+        reference_embeddings(model, hotword_set.token_ids())
+    reference_time = time.perf_counter() - tic
+    print("hotword set of 5000 hotwords: build {:.3f}s, per utterance {:.5f}s cached vs {:.3f}s packed LSTM".format(
+        build_time, cached_time, reference_time))
+
+
+def benchmark_resampler(args):
+    import torchaudio
+    from funasr.utils.wav_utils import torch_resample
+
+    # 1000 telephony utterances of 4 seconds at 8 kHz
+    utterances = [torch.randn(1, 8000 * 4) for _ in range(1000)]
+    tic = time.perf_counter()
+    for audio in utterances:
+        torchaudio.transforms.Resample(orig_freq=8000, new_freq=16000)(audio)
+    fresh_time = time.perf_counter() - tic
+    tic = time.perf_counter()
+    for audio in utterances:
+        torch_resample(audio, 8000, 16000)
+    cached_time = time.perf_counter() - tic
+    print("resampler 1000 utterances 8k -> 16k: fresh Resample {:.2f}s, cached {:.2f}s".format(
+        fresh_time, cached_time))
+
+
+def benchmark_accum_grad(args):
+    from test_trainer_accum_grad import run
+
+    accum_grad = 4
+    time_sync = run(accum_grad, False)[0][0]
+    time_no_sync = run(accum_grad, True)[0][0]
+    print("accum_grad {}, gloo, 2 workers: {:.3f}s -> {:.3f}s per epoch without gradient sync of the accumulation "
+          "steps".format(accum_grad, time_sync, time_no_sync))
+
+
+def benchmark_checkpoint_writer(args):
+    from funasr.train.checkpoint_writer import AsyncCheckpointWriter
+
+    model = torch.nn.Sequential(*[torch.nn.Linear(1024, 1024) for _ in range(32)])
+    with tempfile.TemporaryDirectory() as output_dir:
+        tic = time.perf_counter()
+        torch.save(model.state_dict(), os.path.join(output_dir, "sync.pth"))
+        sync_time = time.perf_counter() - tic
+        writer = AsyncCheckpointWriter()
+        tic = time.perf_counter()
+        writer.save(model.state_dict(), os.path.join(output_dir, "async.pth"))
+        async_time = time.perf_counter() - tic
+        writer.close()
+    print("checkpoint of a 128MB state dict: torch.save blocks {:.3f}s, async writer {:.3f}s".format(
+        sync_time, async_time))
+
+
+def benchmark_average_nbest(args):
+    from pathlib import Path
+
+    from funasr.main_funcs.average_nbest_models import average_nbest_models
+    from test_average_nbest_models import build_reporter, save_models
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_dir = Path(tmp_dir)
+        save_models(output_dir, 10, dim=1024)
+        reporter = build_reporter([float(e) for e in range(10)], [float(e) for e in range(10)])
+        tic = time.perf_counter()
+        average_nbest_models(
+            output_dir=output_dir,
+            reporter=reporter,
+            best_model_criterion=[("valid", "loss", "min"), ("valid", "acc", "max")],
+            nbest=[5, 10],
+        )
+        print("average nbest of 10 models, nbest [5, 10], 2 criteria: {:.2f}s".format(time.perf_counter() - tic))
+
+
+BENCHMARKS = {
+    "cif": benchmark_cif,
+    "vad": benchmark_vad,
+    "speaker_index": benchmark_speaker_index,
+    "sond_windowed": benchmark_sond_windowed,
+    "sond_postprocess": benchmark_sond_postprocess,
+    "punctuation_streaming": benchmark_punctuation_streaming,
+    "itn_memo": benchmark_itn_memo,
+    "hotword_set": benchmark_hotword_set,
+    "resampler": benchmark_resampler,
+    "accum_grad": benchmark_accum_grad,
+    "checkpoint_writer": benchmark_checkpoint_writer,
+    "average_nbest": benchmark_average_nbest,
+}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Timing benchmarks",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "names",
+        nargs="*",
+        help="benchmarks to run, all if none is given: " + ", ".join(BENCHMARKS),
+    )
+    parser.add_argument(
+        "--vad_seconds",
+        type=int,
+        default=600,
+        help="duration of the synthetic recording of the vad benchmark",
+    )
+    parser.add_argument(
+        "--speaker_index_sizes",
+        type=int,
+        nargs="+",
+        default=[10000, 100000],
+        help="numbers of enrolled speakers of the speaker index benchmark",
+    )
+    parser.add_argument(
+        "--itn_sentences",
+        type=int,
+        default=3000,
+        help="number of distinct sentences of the itn memo benchmark",
+    )
+    return parser
+
+
+def main(cmd=None):
+    parser = get_parser()
+    args = parser.parse_args(cmd)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark {}, choose from {}".format(name, ", ".join(BENCHMARKS)))
+    for name in args.names or list(BENCHMARKS):
+        print("== {}".format(name))
+        BENCHMARKS[name](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,11 +19,21 @@ class InverseNormalizer(Normalizer):
         lang: language specifying the ITN
         cache_dir: path to a dir with .far grammar file. Set to None to avoid using cache.
         overwrite_cache: set to True to overwrite .far files
+        enable_standalone_number: ja only, set to True to convert standalone numbers
+        enable_0_to_9: ja only, set to True to convert the numbers 0 to 9
+        grammar_cache: set to True to use the managed grammar cache in cache_dir, or in the shared default cache
+            dir if cache_dir is None. The grammars are versioned by language, options and grammar sources.
+        lazy: set to True to build or load the grammars on first use instead of in the constructor
+        memo_size: size of the LRU memo of tagged spans and verbalized token groups, 0 to disable it.
+            ASR output is highly repetitive, so a memo of e.g. 100000 entries avoids most of the FST work.
     """
 
     def __init__(self, lang: str = 'en', cache_dir: str = None, overwrite_cache: bool = False,
                  enable_standalone_number: bool = True,
-                 enable_0_to_9: bool = True):
+                 enable_0_to_9: bool = True,
+                 grammar_cache: bool = False,
+                 lazy: bool = False,
+                 memo_size: int = 0):
 
         if lang == 'en':
             from fun_text_processing.inverse_text_normalization.en.taggers.tokenize_and_classify import ClassifyFst
@@ -92,10 +102,27 @@ class InverseNormalizer(Normalizer):
                 VerbalizeFinalFst,
             )
 
-        self.tagger = ClassifyFst(cache_dir=cache_dir, overwrite_cache=overwrite_cache)
-        self.verbalizer = VerbalizeFinalFst()
+        options = {}
+        classify_kwargs = {}
+        if lang == 'ja':
+            # only the ja grammars depend on the number options
+            options = classify_kwargs = {
+                "enable_standalone_number": enable_standalone_number,
+                "enable_0_to_9": enable_0_to_9,
+            }
+
+        def build_grammars(cache_dir, overwrite_cache):
+            return {
+                "tagger": ClassifyFst(cache_dir=cache_dir, overwrite_cache=overwrite_cache, **classify_kwargs),
+                "verbalizer": VerbalizeFinalFst(),
+            }
+
+        self._init_grammars(
+            build_grammars, "inverse_text_normalization", lang, options, cache_dir, overwrite_cache, grammar_cache, lazy
+        )
         self.parser = TokenParser()
         self.lang = lang
+        self.init_memo(memo_size)
         self.convert_number = enable_standalone_number
         self.enable_0_to_9 = enable_0_to_9
 
@@ -159,6 +186,17 @@ def parse_args():
     parser.add_argument('--enable_0_to_9', type=str,
                         default='True',
                         help='enable convert number 0 to 9')
+    parser.add_argument(
+        "--grammar_cache",
+        help="use the managed grammar cache in cache_dir, or in the shared default cache dir",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--memo_size",
+        help="size of the LRU memo of tagged spans and verbalized token groups, 0 to disable it",
+        default=0,
+        type=int,
+    )
     return parser.parse_args()
 
 
@@ -168,10 +206,12 @@ if __name__ == "__main__":
     if args.language == 'ja':
         inverse_normalizer = InverseNormalizer(lang=args.language, cache_dir=args.cache_dir, overwrite_cache=args.overwrite_cache,
                 enable_standalone_number=str2bool(args.enable_standalone_number),
-                enable_0_to_9=str2bool(args.enable_0_to_9))
+                enable_0_to_9=str2bool(args.enable_0_to_9), grammar_cache=args.grammar_cache,
+                memo_size=args.memo_size)
     else:
         inverse_normalizer = InverseNormalizer(
-            lang=args.language, cache_dir=args.cache_dir, overwrite_cache=args.overwrite_cache
+            lang=args.language, cache_dir=args.cache_dir, overwrite_cache=args.overwrite_cache,
+            grammar_cache=args.grammar_cache, memo_size=args.memo_size,
         )
     print(f'Time to generate graph: {round(perf_counter() - start_time, 2)} sec')
 
@@ -182,7 +222,13 @@ if __name__ == "__main__":
         data = load_file(args.input_file)
 
         print("- Data: " + str(len(data)) + " sentences")
+        itn_start_time = perf_counter()
         prediction = inverse_normalizer.inverse_normalize_list(data, verbose=args.verbose)
+        itn_time = perf_counter() - itn_start_time
+        print(f"- Throughput: {len(data) / max(itn_time, 1e-6):.2f} sentences/sec")
+        if args.memo_size > 0:
+            num_lookups = max(inverse_normalizer.memo_hits + inverse_normalizer.memo_misses, 1)
+            print(f"- Memo hit rate: {inverse_normalizer.memo_hits / num_lookups:.2%}")
         if args.output_file:
             write_file(args.output_file, prediction)
             print(f"- Denormalized. Writing out to {args.output_file}")
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from functools import lru_cache
+from time import perf_counter
+from typing import Callable, Dict, Optional
+
+GRAMMAR_CACHE_VERSION = 1
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST = "manifest.json"
+
+
+def default_cache_dir() -> str:
+    """
+    Shared grammar cache dir, $FUN_TEXT_PROCESSING_CACHE or ~/.cache/fun_text_processing
+    """
+    return os.environ.get(
+        "FUN_TEXT_PROCESSING_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "fun_text_processing")
+    )
+
+
+def file_sha1(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def grammar_source_hash(*grammar_dirs: str) -> str:
+    """
+    Hash of the grammar sources, i.e. the python and data files under grammar_dirs
+
+    Args:
+        grammar_dirs: dirs relative to the fun_text_processing package
+    """
+    sha1 = hashlib.sha1()
+    for grammar_dir in grammar_dirs:
+        root = os.path.join(PACKAGE_DIR, grammar_dir)
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names[:] = sorted(d for d in dir_names if d != "__pycache__")
+            for file_name in sorted(file_names):
+                if file_name.endswith((".pyc", ".far")):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                sha1.update(os.path.relpath(path, PACKAGE_DIR).encode("utf-8"))
+                sha1.update(file_sha1(path).encode("utf-8"))
+    return sha1.hexdigest()
+
+
+def _pynini_version() -> str:
+    try:
+        import pynini
+
+        return getattr(pynini, "__version__", "unknown")
+    except ImportError:
+        return "none"
+
+
+class GrammarCache:
+    """
+    Managed cache of the compiled .far grammars of one normalizer
+
+    The grammars are stored in cache_dir/<kind>_<lang>_<key>, where the key hashes the cache version,
+    the language, the options of the grammars, the grammar sources and the pynini version, so a change
+    of any of them builds new grammars instead of loading stale ones. Grammars are built in a temporary
+    dir which is renamed into place with a manifest of the sha1 of its files, so concurrent workers
+    never read partially written grammars, and corrupted grammars are rebuilt.
+
+    Args:
+        kind: "text_normalization" or "inverse_text_normalization"
+        lang: language of the grammars
+        options: options which change the compiled grammars
+        cache_dir: root dir of the cache, default_cache_dir() if None
+    """
+
+    def __init__(self, kind: str, lang: str, options: Optional[Dict] = None, cache_dir: Optional[str] = None):
+        self.root = cache_dir if cache_dir is not None else default_cache_dir()
+        # all languages share the graph utils and data of en
+        source_hash = grammar_source_hash(os.path.join(kind, lang), os.path.join("text_normalization", "en"))
+        key = {
+            "version": GRAMMAR_CACHE_VERSION,
+            "kind": kind,
+            "lang": lang,
+            "options": options or {},
+            "source": source_hash,
+            "pynini": _pynini_version(),
+        }
+        self.key = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        self.path = os.path.join(self.root, f"{kind}_{lang}_{self.key[:16]}")
+
+    def is_valid(self) -> bool:
+        manifest_path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return False
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            return manifest["key"] == self.key and all(
+                file_sha1(os.path.join(self.path, name)) == sha1 for name, sha1 in manifest["files"].items()
+            )
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def build(self, build_fn: Callable[[str], object]):
+        """
+        Builds the grammars with build_fn(grammar_dir), which saves them into grammar_dir, and publishes them
+
+        Returns the result of build_fn
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(self.path) + ".tmp-", dir=self.root)
+        try:
+            result = build_fn(tmp_dir)
+            files = {name: file_sha1(os.path.join(tmp_dir, name)) for name in sorted(os.listdir(tmp_dir))}
+            with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+                json.dump({"key": self.key, "files": files}, f, indent=2)
+            if os.path.exists(self.path) and not self.is_valid():
+                shutil.rmtree(self.path, ignore_errors=True)
+            try:
+                os.rename(tmp_dir, self.path)
+                logging.info(f"Grammars are saved to {self.path}.")
+            except OSError:
+                # another worker has published the same grammars
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return result
+
+    def load_or_build(self, build_fn: Callable[[str, bool], object], overwrite_cache: bool = False):
+        """
+        Loads the grammars with build_fn(grammar_dir, overwrite_cache=False) if the cache is valid,
+        otherwise builds and publishes them with build_fn(grammar_dir, overwrite_cache=True)
+        """
+        if not overwrite_cache and self.is_valid():
+            logging.info(f"Grammars are restored from {self.path}.")
+            return build_fn(self.path, False)
+        return self.build(lambda grammar_dir: build_fn(grammar_dir, True))
+
+
+def parse_args():
+    parser = ArgumentParser(description="Startup benchmark of the normalizers with the grammar cache")
+    parser.add_argument("--language", default="zh", type=str)
+    parser.add_argument("--itn", help="benchmark InverseNormalizer instead of Normalizer", action="store_true")
+    parser.add_argument("--cache_dir", default=None, type=str, help="root dir of the grammar cache")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.itn:
+        from fun_text_processing.inverse_text_normalization.inverse_normalize import InverseNormalizer
+
+        def build(overwrite_cache):
+            return InverseNormalizer(
+                lang=args.language, cache_dir=args.cache_dir, overwrite_cache=overwrite_cache, grammar_cache=True
+            )
+
+    else:
+        from fun_text_processing.text_normalization.normalize import Normalizer
+
+        def build(overwrite_cache):
+            return Normalizer(
+                input_case="cased",
+                lang=args.language,
+                cache_dir=args.cache_dir,
+                overwrite_cache=overwrite_cache,
+                grammar_cache=True,
+            )
+
+    for name, overwrite_cache in [("cold", True), ("warm", False)]:
+        start_time = perf_counter()
+        build(overwrite_cache).tagger
+        print(f'{name} start: {round(perf_counter() - start_time, 2)} sec')
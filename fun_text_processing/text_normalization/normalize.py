@@ -5,9 +5,10 @@ import os
 import re
 from argparse import ArgumentParser
 from collections import OrderedDict
+from functools import partial
 from math import factorial
 from time import perf_counter
-from typing import Dict, List, Union
+from typing import Callable, Dict, List, Union
 
 import pynini
 import regex
@@ -18,7 +19,9 @@ from fun_text_processing.text_normalization.data_loader_utils import (
     pre_process,
     write_file,
 )
+from fun_text_processing.text_normalization.grammar_cache import GrammarCache, file_sha1
 from fun_text_processing.text_normalization.token_parser import PRESERVE_ORDER_KEY, TokenParser
+from pynini.lib import byte
 from pynini.lib.rewrite import top_rewrite
 from tqdm import tqdm
 
@@ -45,6 +48,11 @@ class Normalizer:
         whitelist: path to a file with whitelist replacements
         post_process: WFST-based post processing, e.g. to remove extra spaces added during TN.
             Note: punct_post_process flag in normalize() supports all languages.
+        grammar_cache: set to True to use the managed grammar cache in cache_dir, or in the shared default cache
+            dir if cache_dir is None. The grammars are versioned by language, options and grammar sources.
+        lazy: set to True to build or load the grammars on first use instead of in the constructor
+        memo_size: size of the LRU memo of tagged spans and verbalized token groups, 0 to disable it.
+            Useful for repetitive inputs such as ASR output, see _normalize_memoized().
     """
 
     def __init__(
@@ -57,18 +65,16 @@ class Normalizer:
         whitelist: str = None,
         lm: bool = False,
         post_process: bool = True,
+        grammar_cache: bool = False,
+        lazy: bool = False,
+        memo_size: int = 0,
     ):
         assert input_case in ["lower_cased", "cased"]
 
-        self.post_processor = None
-
         if lang == "en":
             from fun_text_processing.text_normalization.en.verbalizers.verbalize_final import VerbalizeFinalFst
             from fun_text_processing.text_normalization.en.verbalizers.post_processing import PostProcessingFst
 
-            if post_process:
-                self.post_processor = PostProcessingFst(cache_dir=cache_dir, overwrite_cache=overwrite_cache)
-
             if deterministic:
                 from fun_text_processing.text_normalization.en.taggers.tokenize_and_classify import ClassifyFst
             else:
@@ -93,20 +99,39 @@ class Normalizer:
         elif lang == 'zh':
             from fun_text_processing.text_normalization.zh.taggers.tokenize_and_classify import ClassifyFst
             from fun_text_processing.text_normalization.zh.verbalizers.verbalize_final import VerbalizeFinalFst
-        self.tagger = ClassifyFst(
-            input_case=input_case,
-            deterministic=deterministic,
-            cache_dir=cache_dir,
-            overwrite_cache=overwrite_cache,
-            whitelist=whitelist,
-        )
 
-        self.verbalizer = VerbalizeFinalFst(
-            deterministic=deterministic, cache_dir=cache_dir, overwrite_cache=overwrite_cache
+        def build_grammars(cache_dir, overwrite_cache):
+            grammars = {
+                "tagger": ClassifyFst(
+                    input_case=input_case,
+                    deterministic=deterministic,
+                    cache_dir=cache_dir,
+                    overwrite_cache=overwrite_cache,
+                    whitelist=whitelist,
+                ),
+                "verbalizer": VerbalizeFinalFst(
+                    deterministic=deterministic, cache_dir=cache_dir, overwrite_cache=overwrite_cache
+                ),
+                "post_processor": None,
+            }
+            if lang == "en" and post_process:
+                grammars["post_processor"] = PostProcessingFst(cache_dir=cache_dir, overwrite_cache=overwrite_cache)
+            return grammars
+
+        options = {
+            "input_case": input_case,
+            "deterministic": deterministic,
+            "whitelist": file_sha1(whitelist) if whitelist else None,
+            "lm": lm,
+            "post_process": post_process,
+        }
+        self._init_grammars(
+            build_grammars, "text_normalization", lang, options, cache_dir, overwrite_cache, grammar_cache, lazy
         )
 
         self.parser = TokenParser()
         self.lang = lang
+        self.init_memo(memo_size)
 
         if NLP_AVAILABLE:
             self.processor = MosesProcessor(lang_id=lang)
@@ -114,6 +139,175 @@ class Normalizer:
             self.processor = None
             print("NeMo NLP is not available. Moses de-tokenization will be skipped.")
 
+    def _init_grammars(
+        self,
+        build_grammars: Callable[[str, bool], Dict],
+        kind: str,
+        lang: str,
+        options: Dict,
+        cache_dir: str,
+        overwrite_cache: bool,
+        grammar_cache: bool,
+        lazy: bool,
+    ):
+        """
+        Sets up the grammars returned by build_grammars(cache_dir, overwrite_cache)
+
+        Args:
+            build_grammars: builds the grammars, saving or restoring them from cache_dir
+            kind: "text_normalization" or "inverse_text_normalization"
+            lang: language of the grammars
+            options: options which change the compiled grammars, part of the grammar cache key
+            cache_dir: path to a dir with .far grammar file, or the root of the grammar cache
+            overwrite_cache: set to True to overwrite .far files
+            grammar_cache: set to True to use the managed grammar cache
+            lazy: set to True to load the grammars on first use
+        """
+        self._grammars = None
+        self._token_input_arcs = None
+        if grammar_cache:
+            cache = GrammarCache(kind, lang, options, cache_dir)
+            self._build_grammars = partial(cache.load_or_build, build_grammars, overwrite_cache=overwrite_cache)
+        else:
+            self._build_grammars = partial(build_grammars, cache_dir, overwrite_cache)
+        if not lazy:
+            self._load_grammars()
+
+    def _load_grammars(self) -> Dict:
+        if self._grammars is None:
+            self._grammars = self._build_grammars()
+        return self._grammars
+
+    @property
+    def tagger(self):
+        return self._load_grammars()["tagger"]
+
+    @property
+    def verbalizer(self):
+        return self._load_grammars()["verbalizer"]
+
+    @property
+    def post_processor(self):
+        grammars = self._load_grammars()
+        if "post_processor" not in grammars:
+            # keeps hasattr(self, 'post_processor') False for normalizers without post processing grammars
+            raise AttributeError("post_processor")
+        return grammars["post_processor"]
+
+    def init_memo(self, memo_size: int):
+        """
+        Sets up an empty LRU memo of at most memo_size entries, 0 disables memoization
+        """
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self.memo_hits = 0
+        self.memo_misses = 0
+
+    def _memoized(self, key, fn):
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            self.memo_hits += 1
+            return self._memo[key]
+        self.memo_misses += 1
+        value = fn()
+        self._memo[key] = value
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return value
+
+    def _parse(self, tagged_text: str) -> List[dict]:
+        self.parser(tagged_text)
+        return self.parser.parse()
+
+    def _verbalize_token_group(self, token_group: dict) -> str:
+        verbalizer_lattice = None
+        for tagged_text in self.generate_permutations([token_group]):
+            verbalizer_lattice = self.find_verbalizer(pynini.escape(tagged_text))
+            if verbalizer_lattice.num_states() != 0:
+                break
+        if verbalizer_lattice is None:
+            raise ValueError(f"No permutations were generated from tokens {token_group}")
+        return self.select_verbalizer(verbalizer_lattice)
+
+    def _verbalize_tokens(self, tokens: List[dict]) -> str:
+        # token groups are verbalized independently, so each tagged span is memoized on its own
+        return ' '.join(
+            self._memoized(("verbalize", repr(token_group)), lambda: self._verbalize_token_group(token_group))
+            for token_group in tokens
+        )
+
+    def _token_inputs(self):
+        """
+        Returns the arcs of an acceptor of the inputs which the tagger tags as a single token, indexed by input
+        byte as ({(state, byte): next states}, {byte: next states from any state})
+        """
+        if self._token_input_arcs is None:
+            any_bytes = pynini.closure(byte.BYTE)
+            two_tokens = (any_bytes + "tokens {" + any_bytes + "tokens {" + any_bytes).optimize()
+            one_token = pynini.difference(any_bytes, two_tokens).optimize()
+            token_inputs = pynini.compose(self.tagger.fst, one_token).project("input").rmepsilon().connect()
+            next_states, any_next_states = {}, {}
+            for state in token_inputs.states():
+                for arc in token_inputs.arcs(state):
+                    next_states.setdefault((state, arc.ilabel), set()).add(arc.nextstate)
+                    any_next_states.setdefault(arc.ilabel, set()).add(arc.nextstate)
+            self._token_input_arcs = (next_states, any_next_states)
+        return self._token_input_arcs
+
+    def _in_token(self, text: str) -> bool:
+        """
+        Returns whether text is a substring of an input which the tagger tags as a single token
+        """
+        next_states, any_next_states = self._token_inputs()
+        labels = text.encode("utf-8")
+        states = any_next_states.get(labels[0], set())
+        for label in labels[1:]:
+            if not states:
+                break
+            states = {next_state for state in states for next_state in next_states.get((state, label), ())}
+        return len(states) > 0
+
+    def _may_join(self, left: str, space: str, right: str) -> bool:
+        """
+        Returns whether a single token may span the space between the words left and right. A token starts at
+        the start of left or after one of its non-letters, e.g. in "(5" or "10kg", and a token reading the space
+        and the first character of right may continue anywhere, so only that character is checked.
+        """
+        starts = [0] + [i + 1 for i, char in enumerate(left) if not char.isalpha()]
+        return any(self._in_token(left[start:] + space + right[0]) for start in starts)
+
+    def _normalize_memoized(self, text: str, verbose: bool = False) -> str:
+        """
+        Normalizes escaped text with the LRU memo. The text is split into spans at the spaces which no token of
+        the tagger may span, e.g. "twenty dollars" stays a span, "hello world" is split, and each span is tagged
+        through the memo, as are the verbalized token groups.
+
+        Args:
+            text: escaped text
+            verbose: whether to print intermediate meta information
+
+        Returns: normalized text
+        """
+        words = list(re.finditer(r'\S+', text))
+        spans = []
+        start = words[0].start()
+        for word, next_word in zip(words, words[1:]):
+            # the tagger reads unescaped text
+            left = re.sub(r'\\(.)', r'\1', word.group())
+            space = text[word.end():next_word.start()]
+            right = re.sub(r'\\(.)', r'\1', next_word.group())[0]
+            if self._memoized(("join", left, space, right), lambda: self._may_join(left, space, right)):
+                continue
+            spans.append(text[start:word.end()])
+            start = next_word.start()
+        spans.append(text[start:words[-1].end()])
+
+        tagged_texts = [self._memoized(("tag", span), lambda: self.select_tag(self.find_tags(span))) for span in spans]
+        if verbose:
+            print(' '.join(tagged_texts))
+        tokens = [token_group for tagged_text in tagged_texts for token_group in self._parse(tagged_text)]
+        return self._verbalize_tokens(tokens)
+
     def normalize_list(
         self,
         texts: List[str],
@@ -267,26 +461,29 @@ class Normalizer:
                 print(text)
             return text
         text = pynini.escape(text)
-        tagged_lattice = self.find_tags(text)
-        tagged_text = self.select_tag(tagged_lattice)
-        if verbose:
-            print(tagged_text)
-        self.parser(tagged_text)
-        tokens = self.parser.parse()
-        split_tokens = self._split_tokens_to_reduce_number_of_permutations(tokens)
-        output = ""
-        for s in split_tokens:
-            tags_reordered = self.generate_permutations(s)
-            verbalizer_lattice = None
-            for tagged_text in tags_reordered:
-                tagged_text = pynini.escape(tagged_text)
-
-                verbalizer_lattice = self.find_verbalizer(tagged_text)
-                if verbalizer_lattice.num_states() != 0:
-                    break
-            if verbalizer_lattice is None:
-                raise ValueError(f"No permutations were generated from tokens {s}")
-            output += ' ' + self.select_verbalizer(verbalizer_lattice)
+        if self.memo_size > 0:
+            output = ' ' + self._normalize_memoized(text, verbose)
+        else:
+            tagged_lattice = self.find_tags(text)
+            tagged_text = self.select_tag(tagged_lattice)
+            if verbose:
+                print(tagged_text)
+            self.parser(tagged_text)
+            tokens = self.parser.parse()
+            split_tokens = self._split_tokens_to_reduce_number_of_permutations(tokens)
+            output = ""
+            for s in split_tokens:
+                tags_reordered = self.generate_permutations(s)
+                verbalizer_lattice = None
+                for tagged_text in tags_reordered:
+                    tagged_text = pynini.escape(tagged_text)
+
+                    verbalizer_lattice = self.find_verbalizer(tagged_text)
+                    if verbalizer_lattice.num_states() != 0:
+                        break
+                if verbalizer_lattice is None:
+                    raise ValueError(f"No permutations were generated from tokens {s}")
+                output += ' ' + self.select_verbalizer(verbalizer_lattice)
         output = SPACE_DUP.sub(' ', output[1:])
 
         if self.lang == "en" and hasattr(self, 'post_processor'):
@@ -479,6 +676,11 @@ def parse_args():
         default=None,
         type=str,
     )
+    parser.add_argument(
+        "--grammar_cache",
+        help="use the managed grammar cache in cache_dir, or in the shared default cache dir",
+        action="store_true",
+    )
     return parser.parse_args()
 
 
@@ -497,6 +699,7 @@ if __name__ == "__main__":
         overwrite_cache=args.overwrite_cache,
         whitelist=whitelist,
         lang=args.language,
+        grammar_cache=args.grammar_cache,
     )
     if args.input_string:
         print(
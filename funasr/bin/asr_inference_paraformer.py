@@ -5,9 +5,6 @@ import sys
 import time
 import copy
 import os
-import codecs
-import tempfile
-import requests
 from pathlib import Path
 from typing import Optional
 from typing import Sequence
@@ -43,6 +40,7 @@ from funasr.models.frontend.wav_frontend import WavFrontend
 from funasr.models.e2e_asr_paraformer import BiCifParaformer, ContextualParaformer
 from funasr.export.models.e2e_asr_paraformer import Paraformer as Paraformer_export
 from funasr.utils.timestamp_tools import time_stamp_lfr6_pl, time_stamp_sentence
+from funasr.utils.hotword_set import HotwordSet, load_hotwords
 
 
 class Speech2Text:
@@ -171,6 +169,7 @@ class Speech2Text:
 
         # 6. [Optional] Build hotword list from str, local file or url
         self.hotword_list = None
+        self.hotword_set = None
         self.hotword_list = self.generate_hotwords_list(hotword_list_or_file)
 
         is_use_lm = lm_weight != 0.0 and lm_file is not None
@@ -300,57 +299,19 @@ class Speech2Text:
         return results
 
     def generate_hotwords_list(self, hotword_list_or_file):
-        # for None
-        if hotword_list_or_file is None:
-            hotword_list = None
-        # for local txt inputs
-        elif os.path.exists(hotword_list_or_file) and hotword_list_or_file.endswith('.txt'):
-            logging.info("Attempting to parse hotwords from local txt...")
-            hotword_list = []
-            hotword_str_list = []
-            with codecs.open(hotword_list_or_file, 'r') as fin:
-                for line in fin.readlines():
-                    hw = line.strip()
-                    hotword_str_list.append(hw)
-                    hotword_list.append(self.converter.tokens2ids([i for i in hw]))
-                hotword_list.append([self.asr_model.sos])
-                hotword_str_list.append('<s>')
-            logging.info("Initialized hotword list from file: {}, hotword list: {}."
-                         .format(hotword_list_or_file, hotword_str_list))
-        # for url, download and generate txt
-        elif hotword_list_or_file.startswith('http'):
-            logging.info("Attempting to parse hotwords from url...")
-            work_dir = tempfile.TemporaryDirectory().name
-            if not os.path.exists(work_dir):
-                os.makedirs(work_dir)
-            text_file_path = os.path.join(work_dir, os.path.basename(hotword_list_or_file))
-            local_file = requests.get(hotword_list_or_file)
-            open(text_file_path, "wb").write(local_file.content)
-            hotword_list_or_file = text_file_path
-            hotword_list = []
-            hotword_str_list = []
-            with codecs.open(hotword_list_or_file, 'r') as fin:
-                for line in fin.readlines():
-                    hw = line.strip()
-                    hotword_str_list.append(hw)
-                    hotword_list.append(self.converter.tokens2ids([i for i in hw]))
-                hotword_list.append([self.asr_model.sos])
-                hotword_str_list.append('<s>')
-            logging.info("Initialized hotword list from file: {}, hotword list: {}."
-                         .format(hotword_list_or_file, hotword_str_list))
-        # for text str input
-        elif not hotword_list_or_file.endswith('.txt'):
-            logging.info("Attempting to parse hotwords as str...")
-            hotword_list = []
-            hotword_str_list = []
-            for hw in hotword_list_or_file.strip().split():
-                hotword_str_list.append(hw)
-                hotword_list.append(self.converter.tokens2ids([i for i in hw]))
-            hotword_list.append([self.asr_model.sos])
-            hotword_str_list.append('<s>')
-            logging.info("Hotword list: {}.".format(hotword_str_list))
-        else:
-            hotword_list = None
+        hotword_str_list = load_hotwords(hotword_list_or_file)
+        if hotword_str_list is None:
+            return None
+        if isinstance(self.asr_model, ContextualParaformer):
+            # only new hotwords are tokenized and encoded, the set is kept across requests
+            if self.hotword_set is None:
+                self.hotword_set = HotwordSet(self.asr_model, lambda hw: self.converter.tokens2ids([i for i in hw]))
+            self.hotword_set.update(hotword_str_list)
+            logging.info("Hotword list: {}.".format(list(self.hotword_set.hotwords.keys()) + ['<s>']))
+            return self.hotword_set
+        hotword_list = [self.converter.tokens2ids([i for i in hw]) for hw in hotword_str_list]
+        hotword_list.append([self.asr_model.sos])
+        logging.info("Hotword list: {}.".format(hotword_str_list + ['<s>']))
         return hotword_list
 
 class Speech2TextExport:
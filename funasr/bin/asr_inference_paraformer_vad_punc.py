@@ -6,9 +6,6 @@ import logging
 import sys
 import time
 import os
-import codecs
-import tempfile
-import requests
 from pathlib import Path
 from typing import Optional
 from typing import Sequence
@@ -49,6 +46,7 @@ from funasr.bin.punctuation_infer import Text2Punc
 from funasr.models.e2e_asr_paraformer import BiCifParaformer, ContextualParaformer
 
 from funasr.utils.timestamp_tools import time_stamp_sentence
+from funasr.utils.hotword_set import HotwordSet, load_hotwords
 
 header_colors = '\033[95m'
 end_colors = '\033[0m'
@@ -180,6 +178,7 @@ class Speech2Text:
 
         # 6. [Optional] Build hotword list from str, local file or url
         self.hotword_list = None
+        self.hotword_set = None
         self.hotword_list = self.generate_hotwords_list(hotword_list_or_file)
 
         is_use_lm = lm_weight != 0.0 and lm_file is not None
@@ -201,15 +200,29 @@ class Speech2Text:
     @torch.no_grad()
     def __call__(
             self, speech: Union[torch.Tensor, np.ndarray], speech_lengths: Union[torch.Tensor, np.ndarray] = None,
-            begin_time: int = 0, end_time: int = None,
+            begin_time: Union[int, List[int]] = 0, end_time: Union[int, List[int]] = None,
     ):
         """Inference
 
         Args:
                 speech: Input speech data
+                begin_time: Segment begin time in ms, or one per batch element
+                end_time: Segment end time in ms, or one per batch element
         Returns:
                 text, token, token_int, hyp
 
+        """
+        return [result for results in self.decode_batch(speech, speech_lengths, begin_time, end_time)
+                for result in results]
+
+    @torch.no_grad()
+    def decode_batch(
+            self, speech: Union[torch.Tensor, np.ndarray], speech_lengths: Union[torch.Tensor, np.ndarray] = None,
+            begin_time: Union[int, List[int]] = 0, end_time: Union[int, List[int]] = None,
+    ) -> List[List[Tuple]]:
+        """Same as __call__, but the results are grouped by batch element.
+
+        The list of an element without any predicted token is empty, as if it was decoded alone.
         """
         assert check_argument_types()
 
@@ -245,7 +258,7 @@ class Speech2Text:
                                                                         predictor_outs[2], predictor_outs[3]
         pre_token_length = pre_token_length.round().long()
         if torch.max(pre_token_length) < 1:
-            return []
+            return [[] for _ in range(pre_token_length.size(0))]
 
         if not isinstance(self.asr_model, ContextualParaformer):
             if self.hotword_list:
@@ -259,10 +272,14 @@ class Speech2Text:
         if isinstance(self.asr_model, BiCifParaformer):
             _, _, us_alphas, us_cif_peak = self.asr_model.calc_predictor_timestamp(enc, enc_len,
                                                                                    pre_token_length)  # test no bias cif2
+            upsample_times = us_alphas.size(1) // enc.size(1)
 
         results = []
         b, n, d = decoder_out.size()
         for i in range(b):
+            results.append([])
+            if pre_token_length[i] < 1:
+                continue
             x = enc[i, :enc_len[i], :]
             am_scores = decoder_out[i, :pre_token_length[i], :]
             if self.beam_search is not None:
@@ -303,69 +320,56 @@ class Speech2Text:
                     text = None
 
                 if isinstance(self.asr_model, BiCifParaformer):
-                    timestamp = time_stamp_lfr6_pl(us_alphas[i], us_cif_peak[i], copy.copy(token), begin_time, end_time)
-                    results.append((text, token, token_int, timestamp, enc_len_batch_total, lfr_factor))
+                    # drop the padded frames, otherwise the tail silence of shorter segments is overestimated
+                    us_len = enc_len[i] * upsample_times
+                    timestamp = time_stamp_lfr6_pl(us_alphas[i, :us_len], us_cif_peak[i, :us_len], copy.copy(token),
+                                                   begin_time[i] if isinstance(begin_time, list) else begin_time,
+                                                   end_time[i] if isinstance(end_time, list) else end_time)
+                    results[i].append((text, token, token_int, timestamp, enc_len_batch_total, lfr_factor))
                 else:
-                    results.append((text, token, token_int, enc_len_batch_total, lfr_factor))
+                    results[i].append((text, token, token_int, enc_len_batch_total, lfr_factor))
 
         # assert check_return_type(results)
         return results
 
     def generate_hotwords_list(self, hotword_list_or_file):
-        # for None
-        if hotword_list_or_file is None:
-            hotword_list = None
-        # for local txt inputs
-        elif os.path.exists(hotword_list_or_file) and hotword_list_or_file.endswith('.txt'):
-            logging.info("Attempting to parse hotwords from local txt...")
-            hotword_list = []
-            hotword_str_list = []
-            with codecs.open(hotword_list_or_file, 'r') as fin:
-                for line in fin.readlines():
-                    hw = line.strip()
-                    hotword_str_list.append(hw)
-                    hotword_list.append(self.converter.tokens2ids([i for i in hw]))
-                hotword_list.append([self.asr_model.sos])
-                hotword_str_list.append('<s>')
-            logging.info("Initialized hotword list from file: {}, hotword list: {}."
-                         .format(hotword_list_or_file, hotword_str_list))
-        # for url, download and generate txt
-        elif hotword_list_or_file.startswith('http'):
-            logging.info("Attempting to parse hotwords from url...")
-            work_dir = tempfile.TemporaryDirectory().name
-            if not os.path.exists(work_dir):
-                os.makedirs(work_dir)
-            text_file_path = os.path.join(work_dir, os.path.basename(hotword_list_or_file))
-            local_file = requests.get(hotword_list_or_file)
-            open(text_file_path, "wb").write(local_file.content)
-            hotword_list_or_file = text_file_path
-            hotword_list = []
-            hotword_str_list = []
-            with codecs.open(hotword_list_or_file, 'r') as fin:
-                for line in fin.readlines():
-                    hw = line.strip()
-                    hotword_str_list.append(hw)
-                    hotword_list.append(self.converter.tokens2ids([i for i in hw]))
-                hotword_list.append([self.asr_model.sos])
-                hotword_str_list.append('<s>')
-            logging.info("Initialized hotword list from file: {}, hotword list: {}."
-                         .format(hotword_list_or_file, hotword_str_list))
-        # for text str input
-        elif not hotword_list_or_file.endswith('.txt'):
-            logging.info("Attempting to parse hotwords as str...")
-            hotword_list = []
-            hotword_str_list = []
-            for hw in hotword_list_or_file.strip().split():
-                hotword_str_list.append(hw)
-                hotword_list.append(self.converter.tokens2ids([i for i in hw]))
-            hotword_list.append([self.asr_model.sos])
-            hotword_str_list.append('<s>')
-            logging.info("Hotword list: {}.".format(hotword_str_list))
-        else:
-            hotword_list = None
+        hotword_str_list = load_hotwords(hotword_list_or_file)
+        if hotword_str_list is None:
+            return None
+        if isinstance(self.asr_model, ContextualParaformer):
+            # only new hotwords are tokenized and encoded, the set is kept across requests
+            if self.hotword_set is None:
+                self.hotword_set = HotwordSet(self.asr_model, lambda hw: self.converter.tokens2ids([i for i in hw]))
+            self.hotword_set.update(hotword_str_list)
+            logging.info("Hotword list: {}.".format(list(self.hotword_set.hotwords.keys()) + ['<s>']))
+            return self.hotword_set
+        hotword_list = [self.converter.tokens2ids([i for i in hw]) for hw in hotword_str_list]
+        hotword_list.append([self.asr_model.sos])
+        logging.info("Hotword list: {}.".format(hotword_str_list + ['<s>']))
         return hotword_list
 
 
+def split_to_mini_batch(segments_len: List[int], batch_size_token: int) -> List[List[int]]:
+    """Group segment indices into length-sorted mini-batches.
+
+    Segments are sorted by length so that padding inside a mini-batch is small, and a new
+    mini-batch is started whenever the padded size (max_len * num_segments) would exceed
+    batch_size_token frames. A segment longer than the budget forms a mini-batch on its own.
+    """
+    mini_batches = []
+    cur_batch, cur_max_len = [], 0
+    for idx in sorted(range(len(segments_len)), key=lambda k: segments_len[k]):
+        max_len = max(cur_max_len, segments_len[idx])
+        if cur_batch and max_len * (len(cur_batch) + 1) > batch_size_token:
+            mini_batches.append(cur_batch)
+            cur_batch, max_len = [], segments_len[idx]
+        cur_batch.append(idx)
+        cur_max_len = max_len
+    if cur_batch:
+        mini_batches.append(cur_batch)
+    return mini_batches
+
+
 def inference(
         maxlenratio: float,
         minlenratio: float,
@@ -401,6 +405,7 @@ def inference(
         time_stamp_writer: bool = False,
         punc_infer_config: Optional[str] = None,
         punc_model_file: Optional[str] = None,
+        batch_size_token: int = 0,
         **kwargs,
 ):
     inference_pipeline = inference_modelscope(
@@ -437,6 +442,7 @@ def inference(
         time_stamp_writer=time_stamp_writer,
         punc_infer_config=punc_infer_config,
         punc_model_file=punc_model_file,
+        batch_size_token=batch_size_token,
         **kwargs,
     )
     return inference_pipeline(data_path_and_name_and_type, raw_inputs)
@@ -477,6 +483,7 @@ def inference_modelscope(
         punc_model_file: Optional[str] = None,
         outputs_dict: Optional[bool] = True,
         param_dict: dict = None,
+        batch_size_token: int = 0,
         **kwargs,
 ):
     assert check_argument_types()
@@ -584,8 +591,10 @@ def inference_modelscope(
 
         if param_dict is not None:
             use_timestamp = param_dict.get('use_timestamp', True)
+            batch_size_token_cur = param_dict.get('batch_size_token', batch_size_token)
         else:
             use_timestamp = True
+            batch_size_token_cur = batch_size_token
 
         finish_count = 0
         file_count = 1
@@ -598,23 +607,55 @@ def inference_modelscope(
             writer = DatadirWriter(output_path)
             ibest_writer = writer[f"1best_recog"]
 
-        for keys, batch in loader:
-            assert isinstance(batch, dict), type(batch)
-            assert all(isinstance(s, str) for s in keys), keys
-            _bs = len(next(iter(batch.values())))
-            assert len(keys) == _bs, f"{len(keys)} != {_bs}"
-
-            vad_results = speech2vadsegment(**batch)
-            fbanks, vadsegments = vad_results[0], vad_results[1]
-            for i, segments in enumerate(vadsegments):
-                result_segments = [["", [], [], []]]
+        def _decode_segment(fbank, segment_idx):
+            bed_idx, end_idx = int(segment_idx[0] / 10), int(segment_idx[1] / 10)
+            return _decode_segment_feats(fbank[bed_idx:end_idx, :], segment_idx)
+
+        def _decode_segment_feats(feats, segment_idx):
+            segment = feats[None, :, :].to(device)
+            speech_lengths = torch.Tensor([feats.size(0)]).int().to(device)
+            batch = {"speech": segment, "speech_lengths": speech_lengths, "begin_time": segment_idx[0],
+                     "end_time": segment_idx[1]}
+            return speech2text(**batch)
+
+        def _decode_files_batched(pending):
+            # gather the vad segments of all pending files and decode them in length-sorted mini-batches
+            seg_feats, seg_times, seg_owner = [], [], []
+            for n, (_, fbank, segments) in enumerate(pending):
                 for j, segment_idx in enumerate(segments):
                     bed_idx, end_idx = int(segment_idx[0] / 10), int(segment_idx[1] / 10)
-                    segment = fbanks[:, bed_idx:end_idx, :].to(device)
-                    speech_lengths = torch.Tensor([end_idx - bed_idx]).int().to(device)
-                    batch = {"speech": segment, "speech_lengths": speech_lengths, "begin_time": vadsegments[i][j][0],
-                             "end_time": vadsegments[i][j][1]}
-                    results = speech2text(**batch)
+                    seg_feats.append(fbank[bed_idx:end_idx, :])
+                    seg_times.append(segment_idx)
+                    seg_owner.append((n, j))
+            seg_results = [[[] for _ in segments] for _, _, segments in pending]
+            seg_lens = [feat.size(0) for feat in seg_feats]
+            valid_idx = [k for k in range(len(seg_feats)) if seg_lens[k] > 0]
+            for mini_batch in split_to_mini_batch([seg_lens[k] for k in valid_idx], batch_size_token_cur):
+                mini_batch = [valid_idx[k] for k in mini_batch]
+                speech = torch.nn.utils.rnn.pad_sequence([seg_feats[k] for k in mini_batch], batch_first=True)
+                speech_lengths = torch.Tensor([seg_lens[k] for k in mini_batch]).int()
+                batch = {"speech": speech.to(device), "speech_lengths": speech_lengths.to(device),
+                         "begin_time": [seg_times[k][0] for k in mini_batch],
+                         "end_time": [seg_times[k][1] for k in mini_batch]}
+                results = speech2text.decode_batch(**batch)
+                for k, result in zip(mini_batch, results):
+                    if len(result) < 1:
+                        # no hypothesis in the padded mini-batch, decode this segment alone
+                        result = _decode_segment_feats(seg_feats[k], seg_times[k])
+                    n, j = seg_owner[k]
+                    seg_results[n][j] = result
+            return seg_results
+
+        def _decode_files(pending):
+            if batch_size_token_cur > 0:
+                seg_results = _decode_files_batched(pending)
+            else:
+                seg_results = [[_decode_segment(fbank, segment_idx) for segment_idx in segments]
+                               for _, fbank, segments in pending]
+
+            for (key, _, segments), results_list in zip(pending, seg_results):
+                result_segments = [["", [], [], []]]
+                for j, results in enumerate(results_list):
                     if len(results) < 1:
                         continue
 
@@ -625,7 +666,6 @@ def inference_modelscope(
                         result_segments = [
                             [result_segments[0][i] + result_cur[0][i] for i in range(len(result_cur[0]))]]
 
-                key = keys[0]
                 result = result_segments[0]
                 text, token, token_int = result[0], result[1], result[2]
                 time_stamp = None if len(result) < 4 else result[3]
@@ -659,19 +699,39 @@ def inference_modelscope(
                 item['sentences'] = time_stamp_sentence(punc_id_list, time_stamp_postprocessed, text_postprocessed)
 
                 asr_result_list.append(item)
-                finish_count += 1
                 # asr_utils.print_progress(finish_count / file_count)
                 if writer is not None:
                     # Write the result to each file
                     ibest_writer["token"][key] = " ".join(token)
                     ibest_writer["token_int"][key] = " ".join(map(str, token_int))
-                    ibest_writer["vad"][key] = "{}".format(vadsegments)
+                    ibest_writer["vad"][key] = "{}".format([segments])
                     ibest_writer["text"][key] = text_postprocessed
                     ibest_writer["text_with_punc"][key] = text_postprocessed_punc
                     if time_stamp_postprocessed is not None:
                         ibest_writer["time_stamp"][key] = "{}".format(time_stamp_postprocessed)
 
                 logging.info("decoding, utt: {}, predictions: {}".format(key, text_postprocessed_punc))
+
+        # with batch_size_token > 0, the segments of up to batch_size files are decoded together
+        pending = []
+        num_files_per_batch = max(batch_size, 1) if batch_size_token_cur > 0 else 1
+        for keys, batch in loader:
+            assert isinstance(batch, dict), type(batch)
+            assert all(isinstance(s, str) for s in keys), keys
+            _bs = len(next(iter(batch.values())))
+            assert len(keys) == _bs, f"{len(keys)} != {_bs}"
+
+            vad_results = speech2vadsegment(**batch)
+            fbanks, vadsegments = vad_results[0], vad_results[1]
+            for i, segments in enumerate(vadsegments):
+                pending.append((keys[i], fbanks[i], segments))
+            if len(pending) >= num_files_per_batch:
+                _decode_files(pending)
+                finish_count += len(pending)
+                pending = []
+        if len(pending) > 0:
+            _decode_files(pending)
+            finish_count += len(pending)
         return asr_result_list
 
     return _forward
@@ -809,6 +869,14 @@ def get_parser():
     group.add_argument("--ngram_weight", type=float, default=0.9, help="ngram weight")
     group.add_argument("--streaming", type=str2bool, default=False)
     group.add_argument("--time_stamp_writer", type=str2bool, default=False)
+    group.add_argument(
+        "--batch_size_token",
+        type=int,
+        default=0,
+        help="The max number of padded fbank frames of a batch of vad segments. "
+             "If > 0, vad segments are decoded in length-sorted mini-batches, "
+             "otherwise one by one",
+    )
 
     group.add_argument(
         "--frontend_conf",
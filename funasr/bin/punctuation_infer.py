@@ -3,6 +3,7 @@ import argparse
 import logging
 from pathlib import Path
 import sys
+import time
 from typing import Optional
 from typing import Sequence
 from typing import Tuple
@@ -65,79 +66,223 @@ class Text2Punc:
 
     @torch.no_grad()
     def __call__(self, text: Union[list, str], split_size=20):
+        return self.punctuate_batch([text], split_size)[0]
+
+    def split_text(self, text: Union[list, str], split_size=20):
         data = {"text": text}
         result = self.preprocessor(data=data, uid="12938712838719")
         split_text = self.preprocessor.pop_split_text_data(result)
         mini_sentences = split_to_mini_sentence(split_text, split_size)
         mini_sentences_id = split_to_mini_sentence(data["text"], split_size)
         assert len(mini_sentences) == len(mini_sentences_id)
-        cache_sent = []
-        cache_sent_id = torch.from_numpy(np.array([], dtype='int32'))
-        new_mini_sentence = ""
-        new_mini_sentence_punc = []
-        cache_pop_trigger_limit = 200
-        for mini_sentence_i in range(len(mini_sentences)):
-            mini_sentence = mini_sentences[mini_sentence_i]
-            mini_sentence_id = mini_sentences_id[mini_sentence_i]
-            mini_sentence = cache_sent + mini_sentence
-            mini_sentence_id = np.concatenate((cache_sent_id, mini_sentence_id), axis=0)
+        return mini_sentences, mini_sentences_id
+
+    @torch.no_grad()
+    def punctuate_batch(self, texts: List[Union[list, str]], split_size=20) -> List[Tuple[str, List[int]]]:
+        """Punctuation of many documents
+
+        The documents are advanced in lockstep, each with its own carry-over cache of the words after the
+        last sentence end. At each step, the current mini-sentences of all unfinished documents are padded
+        into one batch, so the model is called once per step instead of once per mini-sentence of each
+        document.
+
+        Args:
+            texts: documents, each as a string or a list of words
+            split_size: number of words of a mini-sentence
+        Returns:
+            the punctuated text and the punctuation ids of each document
+        """
+        states = []
+        for text in texts:
+            mini_sentences, mini_sentences_id = self.split_text(text, split_size)
+            states.append({
+                "mini_sentences": mini_sentences,
+                "mini_sentences_id": mini_sentences_id,
+                "cache_sent": [],
+                "cache_sent_id": np.array([], dtype='int32'),
+                "new_mini_sentence": "",
+                "new_mini_sentence_punc": [],
+                "output": ("", []),
+            })
+
+        num_steps = max([len(state["mini_sentences"]) for state in states], default=0)
+        for mini_sentence_i in range(num_steps):
+            active_states = [state for state in states if mini_sentence_i < len(state["mini_sentences"])]
+            inputs = []
+            for state in active_states:
+                mini_sentence = state["cache_sent"] + state["mini_sentences"][mini_sentence_i]
+                mini_sentence_id = np.concatenate(
+                    (state["cache_sent_id"], state["mini_sentences_id"][mini_sentence_i]), axis=0)
+                inputs.append((mini_sentence, mini_sentence_id))
+            lengths = [len(mini_sentence_id) for _, mini_sentence_id in inputs]
+            text_pad = np.zeros((len(inputs), max(lengths)), dtype='int32')
+            for i, (_, mini_sentence_id) in enumerate(inputs):
+                text_pad[i, :len(mini_sentence_id)] = mini_sentence_id
             data = {
-                "text": torch.unsqueeze(torch.from_numpy(mini_sentence_id), 0),
-                "text_lengths": torch.from_numpy(np.array([len(mini_sentence_id)], dtype='int32')),
+                "text": torch.from_numpy(text_pad),
+                "text_lengths": torch.from_numpy(np.array(lengths, dtype='int32')),
             }
             data = to_device(data, self.device)
             y, _ = self.wrapped_model(**data)
-            _, indices = y.view(-1, y.shape[-1]).topk(1, dim=1)
-            punctuations = indices
-            if indices.size()[0] != 1:
-                punctuations = torch.squeeze(indices)
-            assert punctuations.size()[0] == len(mini_sentence)
-
-            # Search for the last Period/QuestionMark as cache
-            if mini_sentence_i < len(mini_sentences) - 1:
-                sentenceEnd = -1
-                last_comma_index = -1
-                for i in range(len(punctuations) - 2, 1, -1):
-                    if self.punc_list[punctuations[i]] == "。" or self.punc_list[punctuations[i]] == "？":
-                        sentenceEnd = i
-                        break
-                    if last_comma_index < 0 and self.punc_list[punctuations[i]] == "，":
-                        last_comma_index = i
-
-                if sentenceEnd < 0 and len(mini_sentence) > cache_pop_trigger_limit and last_comma_index >= 0:
-                    # The sentence it too long, cut off at a comma.
-                    sentenceEnd = last_comma_index
-                    punctuations[sentenceEnd] = self.period
-                cache_sent = mini_sentence[sentenceEnd + 1:]
-                cache_sent_id = mini_sentence_id[sentenceEnd + 1:]
-                mini_sentence = mini_sentence[0:sentenceEnd + 1]
-                punctuations = punctuations[0:sentenceEnd + 1]
-
-            # if len(punctuations) == 0:
-            #    continue
-
-            punctuations_np = punctuations.cpu().numpy()
-            new_mini_sentence_punc += [int(x) for x in punctuations_np]
-            words_with_punc = []
-            for i in range(len(mini_sentence)):
-                if i > 0:
-                    if len(mini_sentence[i][0].encode()) == 1 and len(mini_sentence[i - 1][0].encode()) == 1:
-                        mini_sentence[i] = " " + mini_sentence[i]
-                words_with_punc.append(mini_sentence[i])
-                if self.punc_list[punctuations[i]] != "_":
-                    words_with_punc.append(self.punc_list[punctuations[i]])
-            new_mini_sentence += "".join(words_with_punc)
-            # Add Period for the end of the sentence
-            new_mini_sentence_out = new_mini_sentence
-            new_mini_sentence_punc_out = new_mini_sentence_punc
-            if mini_sentence_i == len(mini_sentences) - 1:
-                if new_mini_sentence[-1] == "，" or new_mini_sentence[-1] == "、":
-                    new_mini_sentence_out = new_mini_sentence[:-1] + "。"
-                    new_mini_sentence_punc_out = new_mini_sentence_punc[:-1] + [self.period]
-                elif new_mini_sentence[-1] != "。" and new_mini_sentence[-1] != "？":
-                    new_mini_sentence_out = new_mini_sentence + "。"
-                    new_mini_sentence_punc_out = new_mini_sentence_punc[:-1] + [self.period]
-        return new_mini_sentence_out, new_mini_sentence_punc_out
+            _, indices = y.topk(1, dim=-1)
+            indices = indices.squeeze(-1).cpu().numpy()
+            for state, (mini_sentence, mini_sentence_id), length, punctuations in zip(
+                    active_states, inputs, lengths, indices):
+                assert length == len(mini_sentence)
+                is_last = mini_sentence_i == len(state["mini_sentences"]) - 1
+                self.update_state(state, mini_sentence, mini_sentence_id, punctuations[:length].tolist(), is_last)
+
+        return [state["output"] for state in states]
+
+    def update_state(self, state: dict, mini_sentence: list, mini_sentence_id: np.ndarray, punctuations: List[int],
+                     is_last: bool):
+        cache_pop_trigger_limit = 200
+        # Search for the last Period/QuestionMark as cache
+        if not is_last:
+            sentenceEnd = -1
+            last_comma_index = -1
+            for i in range(len(punctuations) - 2, 1, -1):
+                if self.punc_list[punctuations[i]] == "。" or self.punc_list[punctuations[i]] == "？":
+                    sentenceEnd = i
+                    break
+                if last_comma_index < 0 and self.punc_list[punctuations[i]] == "，":
+                    last_comma_index = i
+
+            if sentenceEnd < 0 and len(mini_sentence) > cache_pop_trigger_limit and last_comma_index >= 0:
+                # The sentence it too long, cut off at a comma.
+                sentenceEnd = last_comma_index
+                punctuations[sentenceEnd] = self.period
+            state["cache_sent"] = mini_sentence[sentenceEnd + 1:]
+            state["cache_sent_id"] = mini_sentence_id[sentenceEnd + 1:]
+            mini_sentence = mini_sentence[0:sentenceEnd + 1]
+            punctuations = punctuations[0:sentenceEnd + 1]
+
+        state["new_mini_sentence_punc"] += punctuations
+        words_with_punc = []
+        for i in range(len(mini_sentence)):
+            if i > 0:
+                if len(mini_sentence[i][0].encode()) == 1 and len(mini_sentence[i - 1][0].encode()) == 1:
+                    mini_sentence[i] = " " + mini_sentence[i]
+            words_with_punc.append(mini_sentence[i])
+            if self.punc_list[punctuations[i]] != "_":
+                words_with_punc.append(self.punc_list[punctuations[i]])
+        state["new_mini_sentence"] += "".join(words_with_punc)
+        new_mini_sentence = state["new_mini_sentence"]
+        new_mini_sentence_punc = state["new_mini_sentence_punc"]
+        # Add Period for the end of the sentence
+        new_mini_sentence_out = new_mini_sentence
+        new_mini_sentence_punc_out = new_mini_sentence_punc
+        if is_last:
+            if new_mini_sentence[-1] == "，" or new_mini_sentence[-1] == "、":
+                new_mini_sentence_out = new_mini_sentence[:-1] + "。"
+                new_mini_sentence_punc_out = new_mini_sentence_punc[:-1] + [self.period]
+            elif new_mini_sentence[-1] != "。" and new_mini_sentence[-1] != "？":
+                new_mini_sentence_out = new_mini_sentence + "。"
+                new_mini_sentence_punc_out = new_mini_sentence_punc[:-1] + [self.period]
+        state["output"] = (new_mini_sentence_out, new_mini_sentence_punc_out)
+
+
+class PuncStreamingSession:
+    """Streaming punctuation of a growing text with a VadRealtimeTransformer model
+
+    Only the newly recognized words are fed to the model, and the encoder caches are reused across calls.
+    The punctuation of a word is final once the words in the look-ahead of the encoder have arrived, and
+    the final words are returned with their punctuation. As in Text2Punc, the context is restarted after
+    each sentence end, or after max_context words without one, so the cost of a call doesn't grow with
+    the length of the text.
+
+    Examples:
+        >>> text2punc = Text2Punc("punc.yaml", "punc.pb")
+        >>> session = PuncStreamingSession(text2punc)
+        >>> for words in asr_results:
+        ...     text, punc_ids = session.feed(words)
+        >>> text, punc_ids = session.finish()
+
+    """
+
+    def __init__(self, text2punc: Text2Punc, max_context: int = 200):
+        self.text2punc = text2punc
+        self.punc_model = text2punc.wrapped_model.module.punc_model
+        assert self.punc_model.with_vad(), "streaming punctuation needs a VadRealtimeTransformer model"
+        encoder = self.punc_model.encoder
+        self.look_ahead = sum(layer.self_attn.pad_fn.padding[1]
+                              for layer in list(encoder.encoders0) + list(encoder.encoders))
+        self.max_context = max_context
+        # seconds of each call of feed
+        self.latencies = []
+        self.reset()
+
+    def reset(self):
+        self.words = []
+        self.ids = []
+        self.num_final = 0
+        self.cache = None
+        self.num_encoded = 0
+        self.punctuations = []
+        self.last_word = None
+
+    @torch.no_grad()
+    def feed(self, text: Union[list, str]) -> Tuple[str, List[int]]:
+        """Add new words, return the punctuated words which are final and their punctuation ids"""
+        tic = time.perf_counter()
+        if len(text) > 0:
+            data = {"text": text}
+            result = self.text2punc.preprocessor(data=data, uid="12938712838719")
+            self.words += self.text2punc.preprocessor.pop_split_text_data(result)
+            self.ids += [int(x) for x in data["text"]]
+        result = self.decode(is_final=False)
+        self.latencies.append(time.perf_counter() - tic)
+        return result
+
+    @torch.no_grad()
+    def finish(self) -> Tuple[str, List[int]]:
+        """Punctuate the remaining words and end the text with a period"""
+        text, punctuations = self.decode(is_final=True)
+        if len(text) > 0:
+            if text[-1] == "，" or text[-1] == "、":
+                text = text[:-1] + "。"
+                punctuations = punctuations[:-1] + [self.text2punc.period]
+            elif text[-1] != "。" and text[-1] != "？":
+                text = text + "。"
+                punctuations = punctuations[:-1] + [self.text2punc.period]
+        self.reset()
+        return text, punctuations
+
+    def decode(self, is_final: bool) -> Tuple[str, List[int]]:
+        punc_list = self.text2punc.punc_list
+        if self.num_encoded < len(self.ids) or (is_final and len(self.ids) > self.num_final):
+            new_ids = torch.tensor([self.ids[self.num_encoded:]], dtype=torch.long)
+            y, self.cache = self.punc_model.forward_incremental(
+                to_device(new_ids, self.text2punc.device), self.cache, is_final)
+            self.num_encoded = len(self.ids)
+            self.punctuations = y[0].argmax(-1).tolist()
+        num_ready = len(self.ids) if is_final else max(len(self.ids) - self.look_ahead, self.num_final)
+
+        words_with_punc = []
+        new_punctuations = self.punctuations[self.num_final:num_ready] if num_ready > self.num_final else []
+        sentence_end = -1
+        for i, punc in zip(range(self.num_final, num_ready), new_punctuations):
+            word = self.words[i]
+            if self.last_word is not None and len(word[0].encode()) == 1 and len(self.last_word[0].encode()) == 1:
+                word = " " + word
+            self.last_word = self.words[i]
+            words_with_punc.append(word)
+            if punc_list[punc] != "_":
+                words_with_punc.append(punc_list[punc])
+            if punc_list[punc] == "。" or punc_list[punc] == "？":
+                sentence_end = i
+        self.num_final = num_ready
+
+        # restart the context after the last sentence end, the words after it are encoded again
+        if sentence_end < 0 and self.num_final > self.max_context:
+            sentence_end = self.num_final - 1
+        if sentence_end >= 0:
+            self.words = self.words[sentence_end + 1:]
+            self.ids = self.ids[sentence_end + 1:]
+            self.num_final -= sentence_end + 1
+            self.cache = None
+            self.num_encoded = 0
+        return "".join(words_with_punc), new_punctuations
 
 
 def inference(
@@ -226,8 +371,14 @@ def inference_modelscope(
             print(results)
             return results
 
+        def punctuate_batch(keys, texts):
+            for key, (result, _) in zip(keys, text2punc.punctuate_batch(texts, split_size)):
+                item = {'key': key, 'value': result}
+                results.append(item)
+
         for inference_text, _, _ in data_path_and_name_and_type:
             with open(inference_text, "r", encoding="utf-8") as fin:
+                keys, texts = [], []
                 for line in fin:
                     line = line.strip()
                     segs = line.split("\t")
@@ -236,9 +387,13 @@ def inference_modelscope(
                     key = segs[0]
                     if len(segs[1]) == 0:
                         continue
-                    result, _ = text2punc(segs[1])
-                    item = {'key': key, 'value': result}
-                    results.append(item)
+                    keys.append(key)
+                    texts.append(segs[1])
+                    if len(keys) == batch_size:
+                        punctuate_batch(keys, texts)
+                        keys, texts = [], []
+                if len(keys) > 0:
+                    punctuate_batch(keys, texts)
         output_path = output_dir_v2 if output_dir_v2 is not None else output_dir
         if output_path != None:
             output_file_name = "infer.out"
@@ -8,6 +8,7 @@ import os
 import sys
 from pathlib import Path
 from typing import Any
+from typing import Iterator
 from typing import List
 from typing import Optional
 from typing import Sequence
@@ -18,7 +19,6 @@ from collections import OrderedDict
 import numpy as np
 import soundfile
 import torch
-from torch.nn import functional as F
 from typeguard import check_argument_types
 from typeguard import check_return_type
 
@@ -60,6 +60,8 @@ class Speech2Diarization:
             streaming: bool = False,
             smooth_size: int = 83,
             dur_threshold: float = 10,
+            window_size: int = 0,
+            window_shift: int = 0,
     ):
         assert check_argument_types()
 
@@ -81,6 +83,14 @@ class Speech2Diarization:
         self.dur_threshold = dur_threshold
         self.device = device
         self.dtype = dtype
+        # sliding window for long recordings in number frames, window_size = 0 decodes the whole recording
+        ds_ratio = self.diar_model.encoder.time_ds_ratio
+        self.window_size = window_size // ds_ratio * ds_ratio
+        if window_shift <= 0:
+            window_shift = window_size * 3 // 4
+        self.window_shift = max(window_shift // ds_ratio * ds_ratio, ds_ratio)
+        if self.window_size > 0:
+            assert self.window_shift < self.window_size, "window_shift must be less than window_size."
 
     def smooth_multi_labels(self, multi_label):
         multi_label = median_filter(multi_label, (self.smooth_size, 1), mode="constant", cval=0.0).astype(int)
@@ -89,48 +99,38 @@ class Speech2Diarization:
     @staticmethod
     def calc_spk_turns(label_arr, spk_list):
         turn_list = []
-        length = label_arr.shape[0]
         n_spk = label_arr.shape[1]
+        # +1 at the first frame of a turn, -1 at the frame after its last frame
+        edges = np.diff(np.pad(label_arr, ((1, 1), (0, 0))), axis=0)
         for k in range(n_spk):
             if spk_list[k] == "None":
                 continue
-            in_utt = False
-            start = 0
-            for i in range(length):
-                if label_arr[i, k] == 1 and in_utt is False:
-                    start = i
-                    in_utt = True
-                if label_arr[i, k] == 0 and in_utt is True:
-                    turn_list.append([spk_list[k], start, i - start])
-                    in_utt = False
-            if in_utt:
-                turn_list.append([spk_list[k], start, length - start])
+            starts = np.nonzero(edges[:, k] > 0)[0]
+            ends = np.nonzero(edges[:, k] < 0)[0]
+            turn_list.extend([spk_list[k], int(st), int(ed - st)] for st, ed in zip(starts, ends))
         return turn_list
 
     @staticmethod
     def seq2arr(seq, vec_dim=8):
-        def int2vec(x, vec_dim=8, dtype=np.int):
-            b = ('{:0' + str(vec_dim) + 'b}').format(x)
-            # little-endian order: lower bit first
-            return (np.array(list(b)[::-1]) == '1').astype(dtype)
+        codes = np.array([int(x) for x in seq], dtype=np.int64)
+        vec_dim = max(vec_dim, int(codes.max(initial=0)).bit_length())
+        # little-endian order: lower bit first
+        return (codes[:, None] >> np.arange(vec_dim)) & 1
 
-        return np.row_stack([int2vec(int(x), vec_dim) for x in seq])
-
-    def post_processing(self, raw_logits: torch.Tensor, spk_num: int):
-        logits_idx = raw_logits.argmax(-1)  # B, T, vocab_size -> B, T
+    def logits_to_index(self, raw_logits: torch.Tensor) -> np.ndarray:
+        logits_idx = raw_logits.argmax(-1)[0].cpu().numpy()  # B, T, vocab_size -> T
         # upsampling outputs to match inputs
-        ut = logits_idx.shape[1] * self.diar_model.encoder.time_ds_ratio
-        logits_idx = F.upsample(
-            logits_idx.unsqueeze(1).float(),
-            size=(ut, ),
-            mode="nearest",
-        ).squeeze(1).long()
-        logits_idx = logits_idx[0].tolist()
-        pse_labels = [self.token_list[x] for x in logits_idx]
-        multi_labels = self.seq2arr(pse_labels, spk_num)[:, :spk_num]  # remove padding speakers
-        multi_labels = self.smooth_multi_labels(multi_labels)
-        spk_list = ["spk{}".format(i + 1) for i in range(spk_num)]
-        spk_turns = self.calc_spk_turns(multi_labels, spk_list)
+        return np.repeat(logits_idx, self.diar_model.encoder.time_ds_ratio)
+
+    def index_to_multi_labels(self, logits_idx: np.ndarray, spk_num: int) -> np.ndarray:
+        # decode the speaker activities of each token once and look them up for all frames
+        multi_labels = self.seq2arr(self.token_list, spk_num)[logits_idx]
+        return multi_labels[:, :spk_num]  # remove padding speakers
+
+    def index_to_labels(self, logits_idx: np.ndarray) -> List[str]:
+        return np.array(self.token_list)[logits_idx].tolist()
+
+    def turns_to_results(self, spk_turns: list):
         results = OrderedDict()
         for spk, st, dur in spk_turns:
             if spk not in results:
@@ -142,9 +142,116 @@ class Speech2Diarization:
         for spk in results:
             results[spk] = sorted(results[spk], key=lambda x: x[0])
 
-        return results, pse_labels
+        return results
+
+    def post_processing(self, raw_logits: torch.Tensor, spk_num: int):
+        logits_idx = self.logits_to_index(raw_logits)
+        multi_labels = self.index_to_multi_labels(logits_idx, spk_num)
+        multi_labels = self.smooth_multi_labels(multi_labels)
+        spk_list = ["spk{}".format(i + 1) for i in range(spk_num)]
+        spk_turns = self.calc_spk_turns(multi_labels, spk_list)
+        results = self.turns_to_results(spk_turns)
+
+        return results, self.index_to_labels(logits_idx)
 
     @torch.no_grad()
+    def predict(self, speech: torch.Tensor, profile: torch.Tensor) -> torch.Tensor:
+        # data: (Nsamples,) -> (1, Nsamples)
+        speech = speech.unsqueeze(0).to(getattr(torch, self.dtype))
+        profile = profile.unsqueeze(0).to(getattr(torch, self.dtype))
+        # lengths: (1,)
+        speech_lengths = speech.new_full([1], dtype=torch.long, fill_value=speech.size(1))
+        profile_lengths = profile.new_full([1], dtype=torch.long, fill_value=profile.size(1))
+        batch = {"speech": speech, "speech_lengths": speech_lengths,
+                 "profile": profile, "profile_lengths": profile_lengths}
+        # a. To device
+        batch = to_device(batch, device=self.device)
+
+        return self.diar_model.prediction_forward(**batch)
+
+    def inputs_per_frame(self) -> int:
+        frontend = self.diar_model.frontend
+        if frontend is None:
+            # inputs are already features
+            return 1
+        return int(frontend.fs * frontend.frame_shift * 0.001) * getattr(frontend, "lfr_n", 1)
+
+    def window_labels(self, speech: torch.Tensor, profile: torch.Tensor) -> Iterator[Tuple[np.ndarray, bool]]:
+        """Label indices of the frames decided by each window and whether it is the last window
+
+        A window of window_size frames is decoded every window_shift frames, and the overlap of two windows
+        is split at its middle, so each frame is labeled by the window where it is farther from the edges.
+        The speakers are given by the profiles, so the labels of all windows are consistent.
+        """
+        ratio = self.inputs_per_frame()
+        num_inputs = speech.shape[0]
+        overlap = self.window_size - self.window_shift
+        keep_beg = 0
+        for beg in range(0, num_inputs, self.window_shift * ratio):
+            is_final = beg + self.window_size * ratio >= num_inputs
+            logits_idx = self.logits_to_index(self.predict(speech[beg: beg + self.window_size * ratio], profile))
+            offset = beg // ratio
+            keep_end = offset + len(logits_idx)
+            if not is_final:
+                keep_end = min(offset + self.window_shift + overlap // 2, keep_end)
+            yield logits_idx[keep_beg - offset: keep_end - offset], is_final
+            keep_beg = keep_end
+            if is_final:
+                break
+
+    def diarize_windows(
+            self,
+            speech: Union[torch.Tensor, np.ndarray],
+            profile: Union[torch.Tensor, np.ndarray],
+    ) -> Iterator[Tuple[list, List[str]]]:
+        """Sliding-window diarization for long recordings
+
+        The memory footprint is bounded by the window size. For each window, the speaker turns finished in it
+        are yielded as [spk, start, duration] in number frames, together with the labels of its new frames.
+        The median smoothing is continued across windows with a buffer of smooth_size frames, so the labels
+        are smoothed as if the whole recording was decoded at once.
+
+        Args:
+            speech: Input speech data
+            profile: Speaker profiles
+        """
+        if isinstance(speech, np.ndarray):
+            speech = torch.tensor(speech)
+        if isinstance(profile, np.ndarray):
+            profile = torch.tensor(profile)
+        spk_num = profile.shape[0]
+        spk_list = ["spk{}".format(i + 1) for i in range(spk_num)]
+        left = self.smooth_size // 2
+        right = self.smooth_size - 1 - left
+        # unsmoothed labels, preceded by the left context of the median filter
+        buffer = np.zeros((left, spk_num), dtype=int)
+        num_smoothed = 0
+        in_turn = np.zeros(spk_num, dtype=int)
+        turn_start = np.zeros(spk_num, dtype=int)
+        for logits_idx, is_final in self.window_labels(speech, profile):
+            buffer = np.concatenate([buffer, self.index_to_multi_labels(logits_idx, spk_num)], axis=0)
+            if is_final:
+                buffer = np.concatenate([buffer, np.zeros((right, spk_num), dtype=int)], axis=0)
+            # frames with the whole right context
+            num_ready = max(buffer.shape[0] - left - right, 0)
+            smoothed = self.smooth_multi_labels(buffer)[left: left + num_ready]
+            buffer = buffer[num_ready:]
+
+            spk_turns = []
+            edges = np.diff(np.concatenate([in_turn[None, :], smoothed], axis=0), axis=0)
+            for i, k in zip(*np.nonzero(edges)):
+                if edges[i, k] > 0:
+                    turn_start[k] = num_smoothed + i
+                else:
+                    spk_turns.append([spk_list[k], int(turn_start[k]), int(num_smoothed + i - turn_start[k])])
+            if num_ready > 0:
+                in_turn = smoothed[-1]
+            num_smoothed += num_ready
+            if is_final:
+                for k in np.nonzero(in_turn)[0]:
+                    spk_turns.append([spk_list[k], int(turn_start[k]), int(num_smoothed - turn_start[k])])
+            yield spk_turns, self.index_to_labels(logits_idx)
+
     def __call__(
             self,
             speech: Union[torch.Tensor, np.ndarray],
@@ -166,19 +273,18 @@ class Speech2Diarization:
         if isinstance(profile, np.ndarray):
             profile = torch.tensor(profile)
 
-        # data: (Nsamples,) -> (1, Nsamples)
-        speech = speech.unsqueeze(0).to(getattr(torch, self.dtype))
-        profile = profile.unsqueeze(0).to(getattr(torch, self.dtype))
-        # lengths: (1,)
-        speech_lengths = speech.new_full([1], dtype=torch.long, fill_value=speech.size(1))
-        profile_lengths = profile.new_full([1], dtype=torch.long, fill_value=profile.size(1))
-        batch = {"speech": speech, "speech_lengths": speech_lengths,
-                 "profile": profile, "profile_lengths": profile_lengths}
-        # a. To device
-        batch = to_device(batch, device=self.device)
+        if 0 < self.window_size and self.window_size * self.inputs_per_frame() < speech.shape[0]:
+            spk_turns, pse_labels = [], []
+            for turns, labels in self.diarize_windows(speech, profile):
+                spk_turns.extend(turns)
+                pse_labels.extend(labels)
+            # the same order of speakers as calc_spk_turns
+            spk_list = ["spk{}".format(i + 1) for i in range(profile.shape[0])]
+            spk_turns = sorted(spk_turns, key=lambda x: spk_list.index(x[0]))
+            return self.turns_to_results(spk_turns), pse_labels
 
-        logits = self.diar_model.prediction_forward(**batch)
-        results, pse_labels = self.post_processing(logits, profile.shape[1])
+        logits = self.predict(speech, profile)
+        results, pse_labels = self.post_processing(logits, profile.shape[0])
 
         return results, pse_labels
 
@@ -229,6 +335,8 @@ def inference_modelscope(
         streaming: bool = False,
         smooth_size: int = 83,
         dur_threshold: int = 10,
+        window_size: int = 0,
+        window_shift: int = 0,
         out_format: str = "vad",
         param_dict: Optional[dict] = None,
         mode: str = "sond",
@@ -255,6 +363,7 @@ def inference_modelscope(
     set_all_random_seed(seed)
 
     # 2a. Build speech2xvec [Optional]
+    speech2xvector = None
     if mode == "sond_demo" and param_dict is not None and "extract_profile" in param_dict and param_dict["extract_profile"]:
         assert "sv_train_config" in param_dict, "sv_train_config must be provided param_dict."
         assert "sv_model_file" in param_dict, "sv_model_file must be provided in param_dict."
@@ -270,7 +379,9 @@ def inference_modelscope(
             device=device,
             dtype=dtype,
             streaming=streaming,
-            embedding_node="resnet1_dense"
+            embedding_node="resnet1_dense",
+            embedding_cache_dir=param_dict.get("embedding_cache_dir", None),
+            embedding_cache_size=param_dict.get("embedding_cache_size", 10000),
         )
         logging.info("speech2xvector_kwargs: {}".format(speech2xvector_kwargs))
         speech2xvector = Speech2Xvector.from_pretrained(
@@ -288,6 +399,8 @@ def inference_modelscope(
         streaming=streaming,
         smooth_size=smooth_size,
         dur_threshold=dur_threshold,
+        window_size=window_size,
+        window_shift=window_shift,
     )
     logging.info("speech2diarization_kwargs: {}".format(speech2diar_kwargs))
     speech2diar = Speech2Diarization.from_pretrained(
@@ -388,6 +501,8 @@ def inference_modelscope(
         if output_path is not None:
             output_writer.close()
             pse_label_writer.close()
+        if speech2xvector is not None and speech2xvector.embedding_cache is not None:
+            logging.info("profile embedding cache: {}".format(speech2xvector.embedding_cache.stats()))
 
         return result_list
 
@@ -411,6 +526,8 @@ def inference(
         streaming: bool = False,
         smooth_size: int = 83,
         dur_threshold: int = 10,
+        window_size: int = 0,
+        window_shift: int = 0,
         out_format: str = "vad",
         **kwargs,
 ):
@@ -430,6 +547,8 @@ def inference(
         streaming=streaming,
         smooth_size=smooth_size,
         dur_threshold=dur_threshold,
+        window_size=window_size,
+        window_shift=window_shift,
         out_format=out_format,
         **kwargs,
     )
@@ -513,6 +632,18 @@ def get_parser():
         default=83,
         help="The smoothing window length in number frames"
     )
+    parser.add_argument(
+        "--window_size",
+        type=int,
+        default=0,
+        help="The sliding window length in number frames for long recordings, 0 to decode the whole recording"
+    )
+    parser.add_argument(
+        "--window_shift",
+        type=int,
+        default=0,
+        help="The sliding window shift in number frames, 0 for 3/4 of the window length"
+    )
     group.add_argument(
         "--model_tag",
         type=str,
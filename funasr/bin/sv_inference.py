@@ -17,6 +17,7 @@ from typing import Union
 import numpy as np
 import torch
 from kaldiio import WriteHelper
+from torch.nn.utils.rnn import pad_sequence
 from typeguard import check_argument_types
 from typeguard import check_return_type
 
@@ -30,6 +31,8 @@ from funasr.utils.types import str2bool
 from funasr.utils.types import str2triple_str
 from funasr.utils.types import str_or_none
 from funasr.utils.misc import statistic_model_parameters
+from funasr.utils.embedding_cache import EmbeddingCache, audio_hash, model_identity
+from funasr.utils.speaker_index import SpeakerIndex
 
 class Speech2Xvector:
     """Speech2Xvector class
@@ -52,6 +55,8 @@ class Speech2Xvector:
             dtype: str = "float32",
             streaming: bool = False,
             embedding_node: str = "resnet1_dense",
+            embedding_cache_dir: Optional[str] = None,
+            embedding_cache_size: int = 0,
     ):
         assert check_argument_types()
 
@@ -69,11 +74,35 @@ class Speech2Xvector:
         self.sv_model = sv_model
         self.sv_train_args = sv_train_args
         self.device = device
+        self.batch_size = batch_size
         self.dtype = dtype
         self.embedding_node = embedding_node
+        # embeddings of the same waveform are reused, e.g. for the profiles of enrolled speakers
+        self.embedding_cache = None
+        if embedding_cache_dir is not None or embedding_cache_size > 0:
+            self.embedding_cache = EmbeddingCache(
+                model_identity(sv_train_config, sv_model_file, embedding_node, dtype),
+                embedding_cache_dir,
+                embedding_cache_size,
+            )
+
+    def _cached_embedding(self, embedding: np.ndarray) -> torch.Tensor:
+        return torch.from_numpy(embedding).to(device=self.device, dtype=getattr(torch, self.dtype))
 
     @torch.no_grad()
     def calculate_embedding(self, speech: Union[torch.Tensor, np.ndarray]) -> torch.Tensor:
+        if self.embedding_cache is None:
+            return self._calculate_embedding(speech)
+
+        key = audio_hash(speech)
+        embedding = self.embedding_cache.get(key)
+        if embedding is not None:
+            return self._cached_embedding(embedding).unsqueeze(0)
+        embedding = self._calculate_embedding(speech)
+        self.embedding_cache.put(key, embedding[0].cpu().numpy())
+        return embedding
+
+    def _calculate_embedding(self, speech: Union[torch.Tensor, np.ndarray]) -> torch.Tensor:
         # Input as audio signal
         if isinstance(speech, np.ndarray):
             speech = torch.tensor(speech)
@@ -102,6 +131,64 @@ class Speech2Xvector:
 
         return embeddings[self.embedding_node]
 
+    @torch.no_grad()
+    def calculate_embeddings(
+            self,
+            speech_list: List[Union[torch.Tensor, np.ndarray]],
+            batch_size: Optional[int] = None,
+    ) -> torch.Tensor:
+        """Embeddings of many waveforms
+
+        The waveforms are sorted by length and batched with the ones of similar length to keep the padding
+        small, the padded frames are masked out of the statistic pooling.
+
+        Args:
+            speech_list: waveforms (Nsamples,) of different lengths
+            batch_size: number of waveforms in one forward, self.batch_size by default
+        Returns:
+            embeddings (N, D) in the order of speech_list
+
+        """
+        batch_size = self.batch_size if batch_size is None else batch_size
+        speech_list = [torch.tensor(speech) if isinstance(speech, np.ndarray) else speech for speech in speech_list]
+        embeddings = [None] * len(speech_list)
+        keys = None
+        if self.embedding_cache is not None:
+            keys = [audio_hash(speech) for speech in speech_list]
+            for i, key in enumerate(keys):
+                embedding = self.embedding_cache.get(key)
+                if embedding is not None:
+                    embeddings[i] = self._cached_embedding(embedding)
+        todo = [i for i in range(len(speech_list)) if embeddings[i] is None]
+
+        if batch_size <= 1:
+            for i in todo:
+                embeddings[i] = self._calculate_embedding(speech_list[i])[0]
+            order = []
+        else:
+            order = sorted(todo, key=lambda i: speech_list[i].size(0))
+        for beg_idx in range(0, len(order), batch_size):
+            batch_idx = order[beg_idx:beg_idx + batch_size]
+            speech = pad_sequence([speech_list[i] for i in batch_idx], batch_first=True)
+            speech = speech.to(getattr(torch, self.dtype))
+            lengths = torch.tensor([speech_list[i].size(0) for i in batch_idx], dtype=torch.long)
+            batch = {"speech": speech, "speech_lengths": lengths}
+            batch = to_device(batch, device=self.device)
+
+            enc, ilens = self.sv_model.encode(**batch)
+            pooling = self.sv_model.pooling_layer(enc, ilens)
+            outputs, batch_embeddings = self.sv_model.decoder(pooling)
+            if self.embedding_node not in batch_embeddings:
+                raise ValueError("Required embedding node {} not in {}".format(
+                    self.embedding_node, batch_embeddings.keys()))
+
+            for i, embedding in zip(batch_idx, batch_embeddings[self.embedding_node]):
+                embeddings[i] = embedding
+        if keys is not None:
+            for i in todo:
+                self.embedding_cache.put(keys[i], embeddings[i].cpu().numpy())
+        return torch.stack(embeddings)
+
     @torch.no_grad()
     def __call__(
             self, speech: Union[torch.Tensor, np.ndarray],
@@ -128,6 +215,28 @@ class Speech2Xvector:
         assert check_return_type(results)
         return results
 
+    @torch.no_grad()
+    def identify(
+            self, speech: Union[torch.Tensor, np.ndarray],
+            speaker_index: SpeakerIndex,
+            top_k: int = 5,
+            num_probe: Optional[int] = None,
+    ) -> List[Tuple[str, float]]:
+        """1:N identification against the enrolled speakers of a SpeakerIndex
+
+        Args:
+            speech: Input speech data
+            speaker_index: index built from the x-vectors of the enrolled speakers
+            top_k: number of candidates
+            num_probe: number of partitions searched in a partitioned index, None for exact search
+        Returns:
+            [(speaker key, cosine similarity), ...] in descending order of similarity
+
+        """
+        embedding = self.calculate_embedding(speech)
+        scores, keys = speaker_index.search(embedding.float().cpu().numpy(), top_k, num_probe=num_probe)
+        return list(zip(keys[0], scores[0, :len(keys[0])].tolist()))
+
     @staticmethod
     def from_pretrained(
             model_tag: Optional[str] = None,
@@ -175,12 +284,12 @@ def inference_modelscope(
         streaming: bool = False,
         embedding_node: str = "resnet1_dense",
         sv_threshold: float = 0.9465,
+        embedding_cache_dir: Optional[str] = None,
+        embedding_cache_size: int = 0,
         param_dict: Optional[dict] = None,
         **kwargs,
 ):
     assert check_argument_types()
-    if batch_size > 1:
-        raise NotImplementedError("batch decoding is not implemented")
     if ngpu > 1:
         raise NotImplementedError("only single GPU decoding is supported")
 
@@ -203,9 +312,12 @@ def inference_modelscope(
         sv_train_config=sv_train_config,
         sv_model_file=sv_model_file,
         device=device,
+        batch_size=batch_size,
         dtype=dtype,
         streaming=streaming,
-        embedding_node=embedding_node
+        embedding_node=embedding_node,
+        embedding_cache_dir=embedding_cache_dir,
+        embedding_cache_size=embedding_cache_size,
     )
     logging.info("speech2xvector_kwargs: {}".format(speech2xvector_kwargs))
     speech2xvector = Speech2Xvector.from_pretrained(
@@ -234,7 +346,7 @@ def inference_modelscope(
             key_file=key_file,
             num_workers=num_workers,
             preprocess_fn=None,
-            collate_fn=None,
+            collate_fn=SVTask.build_collate_fn(speech2xvector.sv_train_args, False),
             allow_variable_data_keys=allow_variable_data_keys,
             inference=True,
         )
@@ -246,40 +358,65 @@ def inference_modelscope(
             os.makedirs(output_path, exist_ok=True)
             embd_writer = WriteHelper("ark,scp:{}/xvector.ark,{}/xvector.scp".format(output_path, output_path))
         sv_result_list = []
+
+        def _write_results(keys, embeddings, ref_embeddings):
+            nonlocal ref_embd_writer, score_writer
+            scores = None
+            if ref_embeddings is not None:
+                scores = torch.cosine_similarity(embeddings, ref_embeddings).cpu().numpy()
+                ref_embeddings = ref_embeddings.cpu().numpy()
+            embeddings = embeddings.cpu().numpy()
+            for i, key in enumerate(keys):
+                normalized_score = 0.0
+                if scores is not None:
+                    normalized_score = max(float(scores[i]) - sv_threshold, 0.0) / (1.0 - sv_threshold) * 100.0
+                    item = {"key": key, "value": normalized_score}
+                else:
+                    item = {"key": key, "value": embeddings[i]}
+                sv_result_list.append(item)
+                if output_path is not None:
+                    embd_writer(key, embeddings[i])
+                    if ref_embeddings is not None:
+                        if ref_embd_writer is None:
+                            ref_embd_writer = WriteHelper(
+                                "ark,scp:{}/ref_xvector.ark,{}/ref_xvector.scp".format(output_path, output_path)
+                            )
+                            score_writer = open(os.path.join(output_path, "score.txt"), "w")
+                        ref_embd_writer(key, ref_embeddings[i])
+                        score_writer.write("{} {:.6f}\n".format(key, normalized_score))
+
+        # waveforms of several batches are collected, so that the ones of similar length are batched together
+        bucket_size = batch_size * 32
+        bucket_keys, bucket_speech, bucket_ref_speech = [], [], []
         for keys, batch in loader:
             assert isinstance(batch, dict), type(batch)
             assert all(isinstance(s, str) for s in keys), keys
             _bs = len(next(iter(batch.values())))
             assert len(keys) == _bs, f"{len(keys)} != {_bs}"
-            batch = {k: v[0] for k, v in batch.items() if not k.endswith("_lengths")}
-
-            embedding, ref_embedding, score = speech2xvector(**batch)
-            # Only supporting batch_size==1
-            key = keys[0]
-            normalized_score = 0.0
-            if score is not None:
-                score = score.item()
-                normalized_score = max(score - sv_threshold, 0.0) / (1.0 - sv_threshold) * 100.0
-                item = {"key": key, "value": normalized_score}
-            else:
-                item = {"key": key, "value": embedding.squeeze(0).cpu().numpy()}
-            sv_result_list.append(item)
-            if output_path is not None:
-                embd_writer(key, embedding[0].cpu().numpy())
-                if ref_embedding is not None:
-                    if ref_embd_writer is None:
-                        ref_embd_writer = WriteHelper(
-                            "ark,scp:{}/ref_xvector.ark,{}/ref_xvector.scp".format(output_path, output_path)
-                        )
-                        score_writer = open(os.path.join(output_path, "score.txt"), "w")
-                    ref_embd_writer(key, ref_embedding[0].cpu().numpy())
-                    score_writer.write("{} {:.6f}\n".format(key, normalized_score))
+
+            for i, key in enumerate(keys):
+                bucket_keys.append(key)
+                bucket_speech.append(batch["speech"][i][:batch["speech_lengths"][i]])
+                if "ref_speech" in batch:
+                    bucket_ref_speech.append(batch["ref_speech"][i][:batch["ref_speech_lengths"][i]])
+            if len(bucket_keys) >= bucket_size:
+                embeddings = speech2xvector.calculate_embeddings(bucket_speech)
+                ref_embeddings = speech2xvector.calculate_embeddings(bucket_ref_speech) if bucket_ref_speech else None
+                _write_results(bucket_keys, embeddings, ref_embeddings)
+                bucket_keys, bucket_speech, bucket_ref_speech = [], [], []
+
+        if len(bucket_keys) > 0:
+            embeddings = speech2xvector.calculate_embeddings(bucket_speech)
+            ref_embeddings = speech2xvector.calculate_embeddings(bucket_ref_speech) if bucket_ref_speech else None
+            _write_results(bucket_keys, embeddings, ref_embeddings)
 
         if output_path is not None:
             embd_writer.close()
             if ref_embd_writer is not None:
                 ref_embd_writer.close()
                 score_writer.close()
+        if speech2xvector.embedding_cache is not None:
+            logging.info("embedding cache: {}".format(speech2xvector.embedding_cache.stats()))
 
         return sv_result_list
 
@@ -411,6 +548,18 @@ def get_parser():
     )
     parser.add_argument("--streaming", type=str2bool, default=False)
     parser.add_argument("--embedding_node", type=str, default="resnet1_dense")
+    parser.add_argument(
+        "--embedding_cache_dir",
+        type=str_or_none,
+        default=None,
+        help="The directory to store the embeddings of processed waveforms, reused by later runs",
+    )
+    parser.add_argument(
+        "--embedding_cache_size",
+        type=int,
+        default=0,
+        help="The number of embeddings kept in memory, 0 to disable the in-memory cache",
+    )
 
     return parser
 
@@ -18,6 +18,7 @@ from typeguard import check_argument_types
 import os.path
 
 from funasr.datasets.dataset import ESPnetDataset
+from funasr.utils.wav_utils import torch_resample
 
 
 SUPPORT_AUDIO_TYPE_SETS = ['flac', 'mp3', 'ogg', 'opus', 'wav', 'pcm']
@@ -189,8 +190,7 @@ class IterableESPnetDataset(IterableDataset):
                     if audio_fs is not None and model_fs is not None:
                         array = torch.from_numpy(array)
                         array = array.unsqueeze(0)
-                        array = torchaudio.transforms.Resample(orig_freq=audio_fs,
-                                                       new_freq=model_fs)(array)
+                        array = torch_resample(array, audio_fs, model_fs)
                         array = array.squeeze(0).numpy()
                 data[name] = array
 
@@ -239,8 +239,7 @@ class IterableESPnetDataset(IterableDataset):
                     if audio_fs is not None and model_fs is not None:
                         array = torch.from_numpy(array)
                         array = array.unsqueeze(0)
-                        array = torchaudio.transforms.Resample(orig_freq=audio_fs,
-                                                               new_freq=model_fs)(array)
+                        array = torch_resample(array, audio_fs, model_fs)
                         array = array.squeeze(0).numpy()
                 data[name] = array
 
@@ -341,8 +340,7 @@ class IterableESPnetDataset(IterableDataset):
                         if audio_fs is not None and model_fs is not None:
                             array = torch.from_numpy(array)
                             array = array.unsqueeze(0)
-                            array = torchaudio.transforms.Resample(orig_freq=audio_fs,
-                                                                   new_freq=model_fs)(array)
+                            array = torch_resample(array, audio_fs, model_fs)
                             array = array.squeeze(0).numpy()
                     data[name] = array
                 if self.non_iterable_dataset is not None:
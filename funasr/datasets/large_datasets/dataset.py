@@ -16,6 +16,7 @@ from funasr.datasets.large_datasets.utils.filter import filter
 from funasr.datasets.large_datasets.utils.padding import padding
 from funasr.datasets.large_datasets.utils.clipping import clipping
 from funasr.datasets.large_datasets.utils.tokenize import tokenize
+from funasr.utils.wav_utils import torch_resample
 
 
 def read_lists(list_file):
@@ -122,8 +123,7 @@ class AudioDataset(IterableDataset):
                         waveform, sampling_rate = torchaudio.load(path)
                         if self.frontend_conf is not None:
                             if sampling_rate != self.frontend_conf["fs"]:
-                                waveform = torchaudio.transforms.Resample(orig_freq=sampling_rate,
-                                                                          new_freq=self.frontend_conf["fs"])(waveform)
+                                waveform = torch_resample(waveform, sampling_rate, self.frontend_conf["fs"])
                                 sampling_rate = self.frontend_conf["fs"] 
                         waveform = waveform.numpy()
                         mat = waveform[0]
@@ -1,5 +1,8 @@
+from distutils.version import LooseVersion
 import logging
 from pathlib import Path
+import tempfile
+from typing import Dict
 from typing import Optional
 from typing import Sequence
 from typing import Union
@@ -14,6 +17,35 @@ from typing import Collection
 from funasr.train.reporter import Reporter
 
 
+def _load_model(output_dir: Path, epoch: int, oss_bucket=None, pai_output_dir=None) -> Dict[str, torch.Tensor]:
+    """Loads {epoch}epoch.pth, which is memory-mapped if torch supports it"""
+    if oss_bucket is None:
+        path = output_dir / f"{epoch}epoch.pth"
+        if LooseVersion(torch.__version__) >= LooseVersion("2.1.0"):
+            return torch.load(path, map_location="cpu", mmap=True)
+        return torch.load(path, map_location="cpu")
+    else:
+        # Downloaded to a temporary file instead of being held as bytes in memory
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, f"{epoch}epoch.pth")
+            oss_bucket.get_object_to_file(os.path.join(pai_output_dir, f"{epoch}epoch.pth"), path)
+            if LooseVersion(torch.__version__) >= LooseVersion("2.1.0"):
+                # The mapping is still valid after the file is removed
+                return torch.load(path, map_location="cpu", mmap=True)
+            return torch.load(path, map_location="cpu")
+
+
+def _link_model(output_dir: Path, src: str, dst: str, oss_bucket=None, pai_output_dir=None):
+    if oss_bucket is None:
+        sym_op = output_dir / dst
+        if sym_op.is_symlink() or sym_op.exists():
+            sym_op.unlink()
+        sym_op.symlink_to(src)
+    else:
+        oss_bucket.copy_object(oss_bucket.bucket_name, os.path.join(pai_output_dir, src),
+                               os.path.join(pai_output_dir, dst))
+
+
 @torch.no_grad()
 def average_nbest_models(
     output_dir: Path,
@@ -33,6 +65,9 @@ def average_nbest_models(
             e.g. [("valid", "loss", "min"), ("train", "acc", "max")]
         nbest: Number of best model files to be averaged
         suffix: A suffix added to the averaged model file name
+
+    The models are loaded one at a time and accumulated in float64, so the peak memory is
+    about twice the size of a single model regardless of nbest.
     """
     assert check_argument_types()
     if isinstance(nbest, int):
@@ -54,69 +89,88 @@ def average_nbest_models(
         if reporter.has(ph, k)
     ]
 
-    _loaded = {}
+    # Averaged models of the same epochs are shared among the criteria
+    _averaged = {}
     for ph, cr, epoch_and_values in nbest_epochs:
         _nbests = [i for i in nbests if i <= len(epoch_and_values)]
         if len(_nbests) == 0:
             _nbests = [1]
 
-        for n in _nbests:
-            if n == 0:
+        if 1 in _nbests:
+            # The averaged model is same as the best model
+            e, _ = epoch_and_values[0]
+            op = output_dir / f"{e}epoch.pth"
+            sym_op = output_dir / f"{ph}.{cr}.ave_1best.{suffix}pth"
+            if sym_op.is_symlink() or sym_op.exists():
+                sym_op.unlink()
+            sym_op.symlink_to(op.name)
+
+        _nbests_to_average = []
+        for n in sorted(set(_nbests)):
+            if n <= 1:
                 continue
-            elif n == 1:
-                # The averaged model is same as the best model
-                e, _ = epoch_and_values[0]
-                op = output_dir / f"{e}epoch.pth"
-                sym_op = output_dir / f"{ph}.{cr}.ave_1best.{suffix}pth"
-                if sym_op.is_symlink() or sym_op.exists():
-                    sym_op.unlink()
-                sym_op.symlink_to(op.name)
-            else:
-                op = output_dir / f"{ph}.{cr}.ave_{n}best.{suffix}pth"
+            name = f"{ph}.{cr}.ave_{n}best.{suffix}pth"
+            epochs = frozenset(e for e, _ in epoch_and_values[:n])
+            if epochs in _averaged:
                 logging.info(
-                    f"Averaging {n}best models: " f'criterion="{ph}.{cr}": {op}'
+                    f"Averaging {n}best models: " f'criterion="{ph}.{cr}": same as {_averaged[epochs]}'
                 )
+                _link_model(output_dir, _averaged[epochs], name, oss_bucket, pai_output_dir)
+            else:
+                _averaged[epochs] = name
+                _nbests_to_average.append(n)
 
-                avg = None
-                # 2.a. Averaging model
-                for e, _ in epoch_and_values[:n]:
-                    if e not in _loaded:
-                        if oss_bucket is None:
-                            _loaded[e] = torch.load(
-                                output_dir / f"{e}epoch.pth",
-                                map_location="cpu",
-                            )
-                        else:
-                            buffer = BytesIO(
-                                oss_bucket.get_object(os.path.join(pai_output_dir, f"{e}epoch.pth")).read())
-                            _loaded[e] = torch.load(buffer)
-                    states = _loaded[e]
-
-                    if avg is None:
-                        avg = states
-                    else:
-                        # Accumulated
-                        for k in avg:
-                            avg[k] = avg[k] + states[k]
-                for k in avg:
-                    if str(avg[k].dtype).startswith("torch.int"):
-                        # For int type, not averaged, but only accumulated.
-                        # e.g. BatchNorm.num_batches_tracked
-                        # (If there are any cases that requires averaging
-                        #  or the other reducing method, e.g. max/min, for integer type,
-                        #  please report.)
-                        pass
-                    else:
-                        avg[k] = avg[k] / n
-
-                # 2.b. Save the ave model and create a symlink
-                if oss_bucket is None:
-                    torch.save(avg, op)
+        # 2. Averaging model: Load the models one by one in the order of the scores
+        # and save the average when the number of the accumulated models reaches each nbest.
+        # Only the sum and a loaded model are kept in memory.
+        _sum = None
+        _dtypes = None
+        for i, (e, _) in enumerate(epoch_and_values[: max(_nbests_to_average, default=0)], 1):
+            states = _load_model(output_dir, e, oss_bucket, pai_output_dir)
+            if _sum is None:
+                _dtypes = {k: v.dtype for k, v in states.items()}
+                # Accumulated in float64 to avoid the rounding error of float16/float32
+                _sum = {
+                    k: v.to(torch.float64, copy=True) if v.is_floating_point() else v.clone()
+                    for k, v in states.items()
+                }
+            else:
+                for k in _sum:
+                    if _sum[k].is_floating_point() or str(_sum[k].dtype).startswith("torch.int"):
+                        _sum[k] += states[k]
+            del states
+
+            if i not in _nbests_to_average:
+                continue
+            n = i
+            op = output_dir / f"{ph}.{cr}.ave_{n}best.{suffix}pth"
+            logging.info(
+                f"Averaging {n}best models: " f'criterion="{ph}.{cr}": {op}'
+            )
+            # The sum is averaged in place if it's not used anymore
+            in_place = n == max(_nbests_to_average)
+            avg = _sum if in_place else {}
+            for k in _sum:
+                if _sum[k].is_floating_point():
+                    avg[k] = (_sum[k] / n).to(_dtypes[k])
                 else:
-                    buffer = BytesIO()
-                    torch.save(avg, buffer)
-                    oss_bucket.put_object(os.path.join(pai_output_dir, f"{ph}.{cr}.ave_{n}best.{suffix}pth"),
-                                          buffer.getvalue())
+                    # For int type, not averaged, but only accumulated.
+                    # e.g. BatchNorm.num_batches_tracked
+                    # (If there are any cases that requires averaging
+                    #  or the other reducing method, e.g. max/min, for integer type,
+                    #  please report.)
+                    avg[k] = _sum[k]
+
+            # 2.b. Save the ave model and create a symlink
+            if oss_bucket is None:
+                torch.save(avg, op)
+            else:
+                buffer = BytesIO()
+                torch.save(avg, buffer)
+                oss_bucket.put_object(os.path.join(pai_output_dir, f"{ph}.{cr}.ave_{n}best.{suffix}pth"),
+                                      buffer.getvalue())
+            del avg
+        del _sum
 
         # 3. *.*.ave.pth is a symlink to the max ave model
         if oss_bucket is None:
@@ -30,6 +30,7 @@ from funasr.modules.nets_utils import make_pad_mask, pad_list
 from funasr.modules.nets_utils import th_accuracy
 from funasr.torch_utils.device_funcs import force_gatherable
 from funasr.train.abs_espnet_model import AbsESPnetModel
+from funasr.utils.hotword_set import HotwordSet
 from funasr.models.predictor.cif import CifPredictorV3
 
 
@@ -1327,7 +1328,10 @@ class ContextualParaformer(Paraformer):
         return loss_att, acc_att, cer_att, wer_att, loss_pre
 
     def cal_decoder_with_predictor(self, encoder_out, encoder_out_lens, sematic_embeds, ys_pad_lens, hw_list=None):
-        if hw_list is None:
+        if isinstance(hw_list, HotwordSet):
+            # bias encoder outputs are cached in the hotword set
+            contextual_info = hw_list.contextual_info(encoder_out.shape[0]).to(encoder_out.device)
+        elif hw_list is None:
             # default hotword list
             hw_list = [torch.Tensor([self.sos]).long().to(encoder_out.device)]  # empty hotword list
             hw_list_pad = pad_list(hw_list, 0)
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Union
 
 import torch
 from torch import nn
@@ -191,43 +191,75 @@ class WindowDetector(object):
         return int(self.frame_size_ms)
 
 
-class E2EVadModel(nn.Module):
-    def __init__(self, encoder: FSMN, vad_post_args: Dict[str, Any]):
-        super(E2EVadModel, self).__init__()
-        self.vad_opts = VADXOptions(**vad_post_args)
+class E2EVadDataRingBuf(object):
+    """Ring buffer of the received samples that are not popped by the detection yet.
+
+    Samples are addressed by their index in the whole stream. Popped samples are dropped, so the
+    memory only depends on the longest span of unconfirmed audio, not on the stream length.
+    """
+
+    def __init__(self, capacity: int = 16000):
+        self.init_capacity = capacity
+        self.Reset()
+
+    def Reset(self) -> None:
+        self.buffer = None
+        self.head = 0  # position of the first kept sample in self.buffer
+        self.start = 0  # stream index of the first kept sample
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def Append(self, samples: torch.Tensor) -> None:
+        num_samples = samples.shape[0]
+        if self.buffer is None:
+            self.buffer = torch.zeros(max(self.init_capacity, num_samples), dtype=samples.dtype,
+                                      device=samples.device)
+        elif self.size + num_samples > self.buffer.shape[0]:
+            # double the capacity, so that appending stays O(1) amortized
+            buffer = torch.zeros(max(2 * self.buffer.shape[0], self.size + num_samples), dtype=self.buffer.dtype,
+                                 device=self.buffer.device)
+            buffer[:self.size] = self.GetData()
+            self.buffer = buffer
+            self.head = 0
+        capacity = self.buffer.shape[0]
+        tail = (self.head + self.size) % capacity
+        first_part = min(num_samples, capacity - tail)
+        self.buffer[tail:tail + first_part] = samples[:first_part]
+        self.buffer[:num_samples - first_part] = samples[first_part:]
+        self.size += num_samples
+
+    def PopTill(self, sample_idx: int) -> None:
+        num_pop = min(max(0, sample_idx - self.start), self.size)
+        if self.buffer is not None:
+            self.head = (self.head + num_pop) % self.buffer.shape[0]
+        self.start += num_pop
+        self.size -= num_pop
+
+    def GetData(self) -> torch.Tensor:
+        if self.buffer is None:
+            return torch.zeros(0)
+        capacity = self.buffer.shape[0]
+        if self.head + self.size <= capacity:
+            return self.buffer[self.head:self.head + self.size]
+        return torch.cat((self.buffer[self.head:], self.buffer[:self.head + self.size - capacity]))
+
+
+class E2EVadStreamState(object):
+    """Detection state of one audio stream.
+
+    Holds the buffers and the state machine of the VAD post-processing, so that a single
+    E2EVadModel can serve many concurrent streams, each with its own E2EVadStreamState.
+    """
+
+    def __init__(self, vad_opts: VADXOptions):
+        self.vad_opts = vad_opts
         self.windows_detector = WindowDetector(self.vad_opts.window_size_ms,
                                                self.vad_opts.sil_to_speech_time_thres,
                                                self.vad_opts.speech_to_sil_time_thres,
                                                self.vad_opts.frame_in_ms)
-        self.encoder = encoder
-        # init variables
-        self.is_final = False
-        self.data_buf_start_frame = 0
-        self.frm_cnt = 0
-        self.latest_confirmed_speech_frame = 0
-        self.lastest_confirmed_silence_frame = -1
-        self.continous_silence_frame_count = 0
-        self.vad_state_machine = VadStateMachine.kVadInStateStartPointNotDetected
-        self.confirmed_start_frame = -1
-        self.confirmed_end_frame = -1
-        self.number_end_time_detected = 0
-        self.sil_frame = 0
-        self.sil_pdf_ids = self.vad_opts.sil_pdf_ids
-        self.noise_average_decibel = -100.0
-        self.pre_end_silence_detected = False
-
-        self.output_data_buf = []
-        self.output_data_buf_offset = 0
-        self.frame_probs = []
-        self.max_end_sil_frame_cnt_thresh = self.vad_opts.max_end_silence_time - self.vad_opts.speech_to_sil_time_thres
-        self.speech_noise_thres = self.vad_opts.speech_noise_thres
-        self.scores = None
-        self.max_time_out = False
-        self.decibel = []
-        self.data_buf = None
-        self.data_buf_all = None
-        self.waveform = None
-        self.ResetDetection()
+        self.AllResetDetection()
 
     def AllResetDetection(self):
         self.is_final = False
@@ -253,9 +285,14 @@ class E2EVadModel(nn.Module):
         self.scores = None
         self.max_time_out = False
         self.decibel = []
-        self.data_buf = None
-        self.data_buf_all = None
+        self.speech_frames = []
+        self.noise_probs = []
+        self.speech_probs = []
+        self.sum_scores = []
+        self.data_buf = E2EVadDataRingBuf(self.vad_opts.sample_rate)
         self.waveform = None
+        self.nn_eval_block_size = self.vad_opts.nn_eval_block_size
+        self.in_cache = dict()
         self.ResetDetection()
 
     def ResetDetection(self):
@@ -269,35 +306,51 @@ class E2EVadModel(nn.Module):
         self.sil_frame = 0
         self.frame_probs = []
 
-    def ComputeDecibel(self) -> None:
+    def ComputeDecibel(self, waveform: torch.Tensor) -> None:
+        self.waveform = waveform
         frame_sample_length = int(self.vad_opts.frame_length_ms * self.vad_opts.sample_rate / 1000)
         frame_shift_length = int(self.vad_opts.frame_in_ms * self.vad_opts.sample_rate / 1000)
-        if self.data_buf_all is None:
-            self.data_buf_all = self.waveform[0]  # self.data_buf is pointed to self.waveform[0]
-            self.data_buf = self.data_buf_all
+        self.data_buf.Append(self.waveform[0])
+        if self.waveform.shape[1] >= frame_sample_length:
+            frames = self.waveform[0].unfold(0, frame_sample_length, frame_shift_length)
+            decibel = 10 * torch.log10((frames.square().sum(dim=-1) + 0.000001).double())
+            self.decibel = decibel.tolist()
         else:
-            self.data_buf_all = torch.cat((self.data_buf_all, self.waveform[0]))
-        for offset in range(0, self.waveform.shape[1] - frame_sample_length + 1, frame_shift_length):
-            self.decibel.append(
-                10 * math.log10((self.waveform[0][offset: offset + frame_sample_length]).square().sum() + \
-                                0.000001))
+            self.decibel = []
 
-    def ComputeScores(self, feats: torch.Tensor, in_cache: Dict[str, torch.Tensor]) -> None:
-        scores = self.encoder(feats, in_cache)  # return B * T * D
-        assert scores.shape[1] == feats.shape[1], "The shape between feats and scores does not match"
-        self.vad_opts.nn_eval_block_size = scores.shape[1]
+    def ComputeScores(self, scores: torch.Tensor) -> None:
+        self.nn_eval_block_size = scores.shape[1]
         self.frm_cnt += scores.shape[1]  # count total frames
-        if self.scores is None:
-            self.scores = scores  # the first calculation
+        self.scores = scores  # only the current block is kept, older frames are already detected
+        self.ComputeFrameProbs(scores)
+
+    def ComputeFrameProbs(self, scores: torch.Tensor) -> None:
+        # speech/noise probability of every frame in the block, GetFrameState only looks them up
+        assert len(self.sil_pdf_ids) == self.vad_opts.silence_pdf_num
+        if len(self.sil_pdf_ids) > 0:
+            assert scores.shape[0] == 1  # 只支持batch_size = 1的测试
+            sil_pdf_scores = scores[0][:, self.sil_pdf_ids].sum(dim=-1)
+            noise_prob = torch.log(sil_pdf_scores.double()) * self.vad_opts.speech_2_noise_ratio
+            sum_score = (1.0 - sil_pdf_scores).double()
         else:
-            self.scores = torch.cat((self.scores, scores), dim=1)
+            sum_score = torch.zeros(scores.shape[1], dtype=torch.float64)
+            noise_prob = torch.zeros_like(sum_score)
+        speech_prob = torch.log(sum_score)
+        speech_frames = torch.exp(speech_prob) >= torch.exp(noise_prob) + self.speech_noise_thres
+        self.speech_frames = speech_frames.tolist()
+        if self.vad_opts.output_frame_probs:
+            self.noise_probs = noise_prob.tolist()
+            self.speech_probs = speech_prob.tolist()
+            self.sum_scores = sum_score.tolist()
 
     def PopDataBufTillFrame(self, frame_idx: int) -> None:  # need check again
+        frame_shift_length = int(self.vad_opts.frame_in_ms * self.vad_opts.sample_rate / 1000)
         while self.data_buf_start_frame < frame_idx:
-            if len(self.data_buf) >= int(self.vad_opts.frame_in_ms * self.vad_opts.sample_rate / 1000):
+            if len(self.data_buf) >= frame_shift_length:
                 self.data_buf_start_frame += 1
-                self.data_buf = self.data_buf_all[self.data_buf_start_frame * int(
-                    self.vad_opts.frame_in_ms * self.vad_opts.sample_rate / 1000):]
+                self.data_buf.PopTill(self.data_buf_start_frame * frame_shift_length)
+            else:
+                break
 
     def PopDataToOutputBuf(self, start_frm: int, frm_cnt: int, first_frm_is_start_point: bool,
                            last_frm_is_end_point: bool, end_point_is_sent_end: bool) -> None:
@@ -333,15 +386,12 @@ class E2EVadModel(nn.Module):
             expected_sample_number = len(self.data_buf)
 
         cur_seg.doa = 0
-        for sample_cpy_out in range(0, data_to_pop):
-            # cur_seg.buffer[out_pos ++] = data_buf_.back();
-            out_pos += 1
-        for sample_cpy_out in range(data_to_pop, expected_sample_number):
-            # cur_seg.buffer[out_pos++] = data_buf_.back()
-            out_pos += 1
+        # cur_seg.buffer[out_pos ++] = data_buf_.back() for each sample
+        out_pos += max(data_to_pop, expected_sample_number)
         if cur_seg.end_ms != start_frm * self.vad_opts.frame_in_ms:
             print('Something wrong with the VAD algorithm\n')
         self.data_buf_start_frame += frm_cnt
+        self.data_buf.PopTill(self.data_buf_start_frame * int(self.vad_opts.frame_in_ms * self.vad_opts.sample_rate / 1000))
         cur_seg.end_ms = (start_frm + frm_cnt) * self.vad_opts.frame_in_ms
         if first_frm_is_start_point:
             cur_seg.contain_seg_start_point = True
@@ -400,7 +450,9 @@ class E2EVadModel(nn.Module):
 
     def GetFrameState(self, t: int) -> FrameState:
         frame_state = FrameState.kFrameStateInvalid
-        cur_decibel = self.decibel[t]
+        # the per-frame lists only hold the current block
+        block_idx = t - (self.frm_cnt - self.nn_eval_block_size)
+        cur_decibel = self.decibel[block_idx]
         cur_snr = cur_decibel - self.noise_average_decibel
         # for each frame, calc log posterior probability of each state
         if cur_decibel < self.vad_opts.decibel_thres:
@@ -408,25 +460,14 @@ class E2EVadModel(nn.Module):
             self.DetectOneFrame(frame_state, t, False)
             return frame_state
 
-        sum_score = 0.0
-        noise_prob = 0.0
-        assert len(self.sil_pdf_ids) == self.vad_opts.silence_pdf_num
-        if len(self.sil_pdf_ids) > 0:
-            assert len(self.scores) == 1  # 只支持batch_size = 1的测试
-            sil_pdf_scores = [self.scores[0][t][sil_pdf_id] for sil_pdf_id in self.sil_pdf_ids]
-            sum_score = sum(sil_pdf_scores)
-            noise_prob = math.log(sum_score) * self.vad_opts.speech_2_noise_ratio
-            total_score = 1.0
-            sum_score = total_score - sum_score
-        speech_prob = math.log(sum_score)
         if self.vad_opts.output_frame_probs:
             frame_prob = E2EVadFrameProb()
-            frame_prob.noise_prob = noise_prob
-            frame_prob.speech_prob = speech_prob
-            frame_prob.score = sum_score
+            frame_prob.noise_prob = self.noise_probs[block_idx]
+            frame_prob.speech_prob = self.speech_probs[block_idx]
+            frame_prob.score = self.sum_scores[block_idx]
             frame_prob.frame_id = t
             self.frame_probs.append(frame_prob)
-        if math.exp(speech_prob) >= math.exp(noise_prob) + self.speech_noise_thres:
+        if self.speech_frames[block_idx]:
             if cur_snr >= self.vad_opts.snr_thres and cur_decibel >= self.vad_opts.decibel_thres:
                 frame_state = FrameState.kFrameStateSpeech
             else:
@@ -442,38 +483,10 @@ class E2EVadModel(nn.Module):
 
         return frame_state
 
-    def forward(self, feats: torch.Tensor, waveform: torch.tensor, in_cache: Dict[str, torch.Tensor] = dict(),
-                is_final: bool = False
-                ) -> Tuple[List[List[List[int]]], Dict[str, torch.Tensor]]:
-        self.waveform = waveform  # compute decibel for each frame
-        self.ComputeDecibel()
-        self.ComputeScores(feats, in_cache)
-        if not is_final:
-            self.DetectCommonFrames()
-        else:
-            self.DetectLastFrames()
-        segments = []
-        for batch_num in range(0, feats.shape[0]):  # only support batch_size = 1 now
-            segment_batch = []
-            if len(self.output_data_buf) > 0:
-                for i in range(self.output_data_buf_offset, len(self.output_data_buf)):
-                    if not self.output_data_buf[i].contain_seg_start_point or not self.output_data_buf[
-                        i].contain_seg_end_point:
-                        continue
-                    segment = [self.output_data_buf[i].start_ms, self.output_data_buf[i].end_ms]
-                    segment_batch.append(segment)
-                    self.output_data_buf_offset += 1  # need update this parameter
-            if segment_batch:
-                segments.append(segment_batch)
-        if is_final:
-            # reset class variables and clear the dict for the next query
-            self.AllResetDetection()
-        return segments, in_cache
-
     def DetectCommonFrames(self) -> int:
         if self.vad_state_machine == VadStateMachine.kVadInStateEndPointDetected:
             return 0
-        for i in range(self.vad_opts.nn_eval_block_size - 1, -1, -1):
+        for i in range(self.nn_eval_block_size - 1, -1, -1):
             frame_state = FrameState.kFrameStateInvalid
             frame_state = self.GetFrameState(self.frm_cnt - 1 - i)
             self.DetectOneFrame(frame_state, self.frm_cnt - 1 - i, False)
@@ -483,7 +496,7 @@ class E2EVadModel(nn.Module):
     def DetectLastFrames(self) -> int:
         if self.vad_state_machine == VadStateMachine.kVadInStateEndPointDetected:
             return 0
-        for i in range(self.vad_opts.nn_eval_block_size - 1, -1, -1):
+        for i in range(self.nn_eval_block_size - 1, -1, -1):
             frame_state = FrameState.kFrameStateInvalid
             frame_state = self.GetFrameState(self.frm_cnt - 1 - i)
             if i != 0:
@@ -597,3 +610,101 @@ class E2EVadModel(nn.Module):
         if self.vad_state_machine == VadStateMachine.kVadInStateEndPointDetected and \
                 self.vad_opts.detect_mode == VadDetectMode.kVadMutipleUtteranceDetectMode.value:
             self.ResetDetection()
+
+    def GetSegments(self) -> List[List[int]]:
+        segments = []
+        if len(self.output_data_buf) > 0:
+            for i in range(self.output_data_buf_offset, len(self.output_data_buf)):
+                if not self.output_data_buf[i].contain_seg_start_point or not self.output_data_buf[
+                    i].contain_seg_end_point:
+                    continue
+                segment = [self.output_data_buf[i].start_ms, self.output_data_buf[i].end_ms]
+                segments.append(segment)
+                self.output_data_buf_offset += 1  # need update this parameter
+            # drop the segments already returned, but keep the last one that may still be extended
+            num_drop = min(self.output_data_buf_offset, len(self.output_data_buf) - 1)
+            del self.output_data_buf[:num_drop]
+            self.output_data_buf_offset -= num_drop
+        return segments
+
+
+class E2EVadModel(nn.Module):
+    def __init__(self, encoder: FSMN, vad_post_args: Dict[str, Any]):
+        super(E2EVadModel, self).__init__()
+        self.vad_opts = VADXOptions(**vad_post_args)
+        self.encoder = encoder
+        # state of the single stream decoded by forward()
+        self.stream_state = E2EVadStreamState(self.vad_opts)
+
+    def NewStreamState(self) -> E2EVadStreamState:
+        return E2EVadStreamState(self.vad_opts)
+
+    def DetectStream(self, stream_state: E2EVadStreamState, scores: torch.Tensor, waveform: torch.Tensor,
+                     is_final: bool = False) -> List[List[int]]:
+        stream_state.ComputeDecibel(waveform)  # compute decibel for each frame
+        stream_state.ComputeScores(scores)
+        if not is_final:
+            stream_state.DetectCommonFrames()
+        else:
+            stream_state.DetectLastFrames()
+        segments = stream_state.GetSegments()
+        if is_final:
+            # reset stream variables for the next query
+            stream_state.AllResetDetection()
+        return segments
+
+    def forward(self, feats: torch.Tensor, waveform: torch.tensor, in_cache: Dict[str, torch.Tensor] = dict(),
+                is_final: bool = False
+                ) -> Tuple[List[List[List[int]]], Dict[str, torch.Tensor]]:
+        scores = self.encoder(feats, in_cache)  # return B * T * D
+        assert scores.shape[1] == feats.shape[1], "The shape between feats and scores does not match"
+        segments = []
+        # only support batch_size = 1 now, use forward_streams for concurrent streams
+        segment_batch = self.DetectStream(self.stream_state, scores, waveform, is_final)
+        if segment_batch:
+            segments.append(segment_batch)
+        return segments, in_cache
+
+    def forward_streams(self, feats: torch.Tensor, waveform: Union[torch.Tensor, List[torch.Tensor]],
+                        stream_states: List[E2EVadStreamState], is_final: Union[bool, List[bool]] = False
+                        ) -> List[List[List[int]]]:
+        """Score one chunk of N concurrent streams with a single encoder forward.
+
+        Args:
+            feats: (N, T, D) features of the new chunk of each stream, all chunks share the same T
+            waveform: (N, samples) waveform of the new chunk of each stream, or a list of (1, samples)
+            stream_states: detection state of each stream, updated in place together with its encoder cache
+            is_final: whether this is the last chunk, for all streams or one flag per stream
+        Returns:
+            the segments [[start_ms, end_ms], ...] finished in this chunk, one list per stream
+        """
+        num_streams = len(stream_states)
+        assert feats.shape[0] == num_streams, "The number of feats and stream states does not match"
+        if isinstance(is_final, bool):
+            is_final = [is_final] * num_streams
+
+        in_cache = self.GatherStreamCache(stream_states)
+        scores = self.encoder(feats, in_cache)
+        assert scores.shape[1] == feats.shape[1], "The shape between feats and scores does not match"
+        segments = []
+        for i, stream_state in enumerate(stream_states):
+            stream_state.in_cache = {key: cache[i:i + 1] for key, cache in in_cache.items()}
+            stream_waveform = waveform[i] if isinstance(waveform, list) else waveform[i:i + 1]
+            segments.append(self.DetectStream(stream_state, scores[i:i + 1], stream_waveform, is_final[i]))
+        return segments
+
+    @staticmethod
+    def GatherStreamCache(stream_states: List[E2EVadStreamState]) -> Dict[str, torch.Tensor]:
+        # streams without history start from zero cache, the same as the encoder does for an empty cache
+        ref_cache = None
+        for stream_state in stream_states:
+            if len(stream_state.in_cache) > 0:
+                ref_cache = stream_state.in_cache
+                break
+        if ref_cache is None:
+            return dict()
+        in_cache = dict()
+        for key, ref in ref_cache.items():
+            in_cache[key] = torch.cat([stream_state.in_cache.get(key, torch.zeros_like(ref))
+                                       for stream_state in stream_states], dim=0)
+        return in_cache
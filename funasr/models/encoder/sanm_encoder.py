@@ -115,6 +115,51 @@ class EncoderLayerSANM(nn.Module):
 
         return x, mask, cache, mask_shfit_chunk, mask_att_chunk_encoder
 
+    def forward_chunk(self, x, cache, mask_shfit_chunk, mask_att_chunk_encoder, cache_frames, look_back=1):
+        """Compute encoded features of one chunk of a stream.
+
+        Args:
+            x (torch.Tensor): Input tensor of the chunk (#batch, time, size).
+            cache (dict): Self attention cache of the previous chunks.
+            mask_shfit_chunk (torch.Tensor): Mask of the fsmn shift frames (#batch, time, 1).
+            mask_att_chunk_encoder (torch.Tensor): Mask over the keys of the look back chunks and of the chunk.
+            cache_frames (slice): Frames of the chunk attended to by the following chunks.
+            look_back (int): Number of chunks attended to by the following chunks.
+
+        Returns:
+            torch.Tensor: Output tensor (#batch, time, size).
+            dict: Self attention cache for the next chunk.
+
+        """
+        residual = x
+        if self.normalize_before:
+            x = self.norm1(x)
+
+        att_outs, cache = self.self_attn.forward_chunk(x, mask_shfit_chunk, mask_att_chunk_encoder, cache,
+                                                       cache_frames, look_back)
+        if self.concat_after:
+            x_concat = torch.cat((x, att_outs), dim=-1)
+            if self.in_size == self.size:
+                x = residual + self.concat_linear(x_concat)
+            else:
+                x = self.concat_linear(x_concat)
+        else:
+            if self.in_size == self.size:
+                x = residual + self.dropout(att_outs)
+            else:
+                x = self.dropout(att_outs)
+        if not self.normalize_before:
+            x = self.norm1(x)
+
+        residual = x
+        if self.normalize_before:
+            x = self.norm2(x)
+        x = residual + self.dropout(self.feed_forward(x))
+        if not self.normalize_before:
+            x = self.norm2(x)
+
+        return x, cache
+
 class SANMEncoder(AbsEncoder):
     """
     author: Speech Lab, Alibaba Group, China
@@ -760,6 +805,95 @@ class SANMEncoderChunkOpt(AbsEncoder):
             return (xs_pad, intermediate_outs), olens, None
         return xs_pad, olens, None
 
+    def forward_chunk(
+            self,
+            xs_pad: torch.Tensor,
+            cache: dict = None,
+            is_final: bool = False,
+            ind: int = 0,
+    ) -> Tuple[torch.Tensor, dict]:
+        """Encode the newly arrived frames of streams.
+
+        The chunks are the ones built by overlap_chunk_cls in forward, but only the chunks completed by
+        xs_pad are computed. The frames overlapping the next chunk, the fsmn memory and the keys and values
+        of the look back chunks of every layer are carried in cache. The input layer must be frame-wise:
+        pe, None, or linear with a position encoding which has forward_chunk, e.g. SinusoidalPositionEncoder
+        (as in forward, the first layer takes input_size, so linear needs input_size == output_size).
+
+        Args:
+            xs_pad: new input frames (B, L, D), all the streams of the batch have the same length
+            cache: returned by the previous call, None at the start of the streams
+            is_final: the streams end with xs_pad, the remaining frames are encoded
+            ind: index of the chunk configuration
+        Returns:
+            encoder outputs of the completed chunks (B, T, D) in the chunk layout of forward, and the cache
+        """
+        chunk_size, stride, pad_left, encoder_att_look_back_factor, _ = self.overlap_chunk_cls.get_chunk_size(ind)
+        shfit_fsmn = self.overlap_chunk_cls.shfit_fsmn
+        if cache is None:
+            cache = {"start_idx": 0, "chunk_idx": 0, "feats": None,
+                     "layers": [{"fsmn": None, "k": [], "v": []} for _ in range(len(self.encoders0) + len(self.encoders))]}
+
+        xs_pad = xs_pad * self.output_size() ** 0.5
+        if self.embed is None:
+            xs_pad = xs_pad
+        elif isinstance(self.embed, SinusoidalPositionEncoder):
+            xs_pad = self.embed.forward_chunk(xs_pad, cache["start_idx"])
+        elif isinstance(self.embed, torch.nn.Linear):
+            xs_pad = self.embed(xs_pad)
+        elif isinstance(self.embed, torch.nn.Sequential) and hasattr(self.embed[-1], "forward_chunk"):
+            # input_layer linear: frame-wise layers followed by the position encoding
+            xs_pad = self.embed[:-1](xs_pad)
+            xs_pad = self.embed[-1].forward_chunk(xs_pad, cache["start_idx"])
+        else:
+            raise NotImplementedError("forward_chunk supports input_layer pe, linear or None only")
+        cache["start_idx"] += xs_pad.size(1)
+        if cache["feats"] is None:
+            cache["feats"] = xs_pad.new_zeros((xs_pad.size(0), pad_left, xs_pad.size(2)))
+        # frames of the left padded stream from the first chunk not yet encoded
+        feats = torch.cat((cache["feats"], xs_pad), dim=1)
+
+        if is_final:
+            chunk_num = (cache["start_idx"] + stride - 1) // stride
+        else:
+            chunk_num = max(0, (cache["start_idx"] + pad_left - chunk_size) // stride + 1)
+        encoder_outs = []
+        for chunk_idx in range(cache["chunk_idx"], chunk_num):
+            offset = (chunk_idx - cache["chunk_idx"]) * stride
+            if chunk_idx == chunk_num - 1 and is_final:
+                xs_chunk = feats[:, offset:, :]
+            else:
+                # the chunks before the last one are zero padded at the end of the stream
+                xs_chunk = feats[:, offset:offset + chunk_size, :]
+                xs_chunk = torch.nn.functional.pad(xs_chunk, (0, 0, 0, chunk_size - xs_chunk.size(1)), "constant", 0.0)
+            encoder_outs.append(self._encode_chunk(xs_chunk, cache, shfit_fsmn, stride, encoder_att_look_back_factor))
+        cache["feats"] = feats[:, (chunk_num - cache["chunk_idx"]) * stride:, :]
+        cache["chunk_idx"] = chunk_num
+
+        if len(encoder_outs) == 0:
+            return xs_pad.new_zeros((xs_pad.size(0), 0, self.output_size())), cache
+        return torch.cat(encoder_outs, dim=1), cache
+
+    def _encode_chunk(self, xs_chunk, cache, shfit_fsmn, stride, look_back):
+        batch_size, chunk_len, _ = xs_chunk.size()
+        num_cached = sum(k.size(2) for k in cache["layers"][0]["k"])
+        xs_chunk = torch.nn.functional.pad(xs_chunk, (0, 0, shfit_fsmn, 0), "constant", 0.0)
+        time = shfit_fsmn + chunk_len
+        mask_shfit_chunk = xs_chunk.new_ones((batch_size, time, 1))
+        mask_shfit_chunk[:, :shfit_fsmn, :] = 0
+        # the first stride frames attend to the look back chunks, all frames attend to the chunk
+        mask_att_chunk_encoder = xs_chunk.new_zeros((batch_size, time, num_cached + time))
+        mask_att_chunk_encoder[:, shfit_fsmn:shfit_fsmn + stride, :num_cached] = 1
+        mask_att_chunk_encoder[:, shfit_fsmn:, num_cached + shfit_fsmn:] = 1
+        cache_frames = slice(shfit_fsmn, shfit_fsmn + stride)
+
+        for layer_idx, encoder_layer in enumerate(list(self.encoders0) + list(self.encoders)):
+            xs_chunk, cache["layers"][layer_idx] = encoder_layer.forward_chunk(
+                xs_chunk, cache["layers"][layer_idx], mask_shfit_chunk, mask_att_chunk_encoder, cache_frames, look_back)
+        if self.normalize_before:
+            xs_chunk = self.after_norm(xs_chunk)
+        return xs_chunk
+
     def gen_tf2torch_map_dict(self):
         tensor_name_prefix_torch = self.tf2torch_tensor_name_prefix_torch
         tensor_name_prefix_tf = self.tf2torch_tensor_name_prefix_tf
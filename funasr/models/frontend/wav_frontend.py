@@ -56,23 +56,80 @@ def apply_cmvn(inputs, cmvn_file):  # noqa
 
 
 def apply_lfr(inputs, lfr_m, lfr_n):
-    LFR_inputs = []
     T = inputs.shape[0]
-    T_lfr = int(np.ceil(T / lfr_n))
-    left_padding = inputs[0].repeat((lfr_m - 1) // 2, 1)
-    inputs = torch.vstack((left_padding, inputs))
-    T = T + (lfr_m - 1) // 2
-    for i in range(T_lfr):
-        if lfr_m <= T - i * lfr_n:
-            LFR_inputs.append((inputs[i * lfr_n:i * lfr_n + lfr_m]).view(1, -1))
-        else:  # process last LFR frame
-            num_padding = lfr_m - (T - i * lfr_n)
-            frame = (inputs[i * lfr_n:]).view(-1)
-            for _ in range(num_padding):
-                frame = torch.hstack((frame, inputs[-1]))
-            LFR_inputs.append(frame)
-    LFR_outputs = torch.vstack(LFR_inputs)
-    return LFR_outputs.type(torch.float32)
+    LFR_outputs, _ = apply_lfr_batch(inputs[None], torch.as_tensor([T]), lfr_m, lfr_n)
+    return LFR_outputs[0]
+
+
+def apply_lfr_batch(inputs, input_lengths, lfr_m, lfr_n):
+    """
+    Low frame rate stacking of a padded batch (B, T, D) -> (B, ceil(T / lfr_n), lfr_m * D)
+
+    Output frame i stacks the input frames from i * lfr_n - (lfr_m - 1) // 2 to i * lfr_n - (lfr_m - 1) // 2 + lfr_m - 1,
+    clamped to the first and the last frame of each utterance, with a single gather.
+    """
+    batch_size, T, dim = inputs.shape
+    input_lengths = torch.as_tensor(input_lengths).long().cpu().clamp(max=T)
+    lfr_lengths = (input_lengths + lfr_n - 1) // lfr_n
+    T_lfr = int(lfr_lengths.max()) if batch_size > 0 else 0
+    index = torch.arange(T_lfr)[:, None] * lfr_n + torch.arange(lfr_m)[None, :] - (lfr_m - 1) // 2
+    index = torch.min(index.clamp(min=0)[None, :, :], (input_lengths - 1).clamp(min=0)[:, None, None])
+    index = index.to(inputs.device)
+    LFR_outputs = torch.gather(inputs, 1, index.view(batch_size, -1, 1).expand(-1, -1, dim))
+    LFR_outputs = LFR_outputs.view(batch_size, T_lfr, lfr_m * dim)
+    mask = (torch.arange(T_lfr)[None, :] < lfr_lengths[:, None]).to(inputs.device)
+    LFR_outputs = LFR_outputs.masked_fill(~mask[:, :, None], 0.0)
+    return LFR_outputs.type(torch.float32), lfr_lengths
+
+
+def fbank_window(window_type, window_size):
+    # the same windows as torchaudio.compliance.kaldi, None for the types only supported there
+    if window_type == 'hamming':
+        return torch.hamming_window(window_size, periodic=False, alpha=0.54, beta=0.46)
+    elif window_type == 'hanning':
+        return torch.hann_window(window_size, periodic=False)
+    elif window_type == 'povey':
+        return torch.hann_window(window_size, periodic=False).pow(0.85)
+    elif window_type == 'rectangular':
+        return torch.ones(window_size)
+    return None
+
+
+def fbank_batch(waveforms, waveform_lengths, window, mel_banks, frame_shift, dither=0.0):
+    """
+    Kaldi compatible fbank of a padded batch of waveforms (B, N) -> (B, T, n_mels)
+
+    Follows torchaudio.compliance.kaldi.fbank with snip_edges=True and the default options, framing,
+    dithering, windowing, FFT and mel filtering all utterances at once. Frames beyond the length of
+    an utterance are set to zero.
+    """
+    batch_size, num_samples = waveforms.shape
+    window_size = window.shape[0]
+    padded_window_size = (mel_banks.shape[1] - 1) * 2
+    waveform_lengths = torch.as_tensor(waveform_lengths).long().cpu().clamp(max=num_samples)
+    feats_lens = torch.where(waveform_lengths >= window_size,
+                             (waveform_lengths - window_size) // frame_shift + 1,
+                             torch.zeros_like(waveform_lengths))
+    max_len = int(feats_lens.max()) if batch_size > 0 else 0
+    if max_len == 0:
+        return torch.zeros((batch_size, 0, mel_banks.shape[0]), dtype=waveforms.dtype,
+                           device=waveforms.device), feats_lens
+
+    frames = waveforms.unfold(1, window_size, frame_shift)[:, :max_len, :]
+    if dither != 0.0:
+        frames = frames + torch.randn_like(frames) * dither
+    # remove dc offset and pre-emphasis
+    frames = frames - torch.mean(frames, dim=-1, keepdim=True)
+    frames = frames - 0.97 * torch.cat((frames[:, :, :1], frames[:, :, :-1]), dim=-1)
+    frames = frames * window.type(frames.dtype)
+    power_spectrum = torch.fft.rfft(frames, n=padded_window_size).abs().pow(2.0)
+    mel_energies = torch.matmul(power_spectrum, mel_banks.type(frames.dtype).t())
+    epsilon = torch.tensor(torch.finfo(torch.float).eps, dtype=frames.dtype, device=frames.device)
+    mel_energies = torch.max(mel_energies, epsilon).log()
+
+    mask = (torch.arange(max_len)[None, :] < feats_lens[:, None]).to(waveforms.device)
+    mel_energies = mel_energies.masked_fill(~mask[:, :, None], 0.0)
+    return mel_energies, feats_lens
 
 
 class WavFrontend(AbsFrontend):
@@ -109,22 +166,53 @@ class WavFrontend(AbsFrontend):
         self.dither = dither
         self.snip_edges = snip_edges
         self.upsacle_samples = upsacle_samples
+        # cmvn is parsed once here instead of for every utterance, not saved in the state dict
+        cmvn = load_cmvn(self.cmvn_file).float() if self.cmvn_file is not None else None
+        self.register_buffer("cmvn", cmvn, persistent=False)
+        # window and mel banks of the batched fbank, which supports snip_edges only
+        window_size = int(self.fs * self.frame_length * 0.001)
+        padded_window_size = 1 << (window_size - 1).bit_length()
+        self.frame_shift_samples = int(self.fs * self.frame_shift * 0.001)
+        mel_banks, _ = kaldi.get_mel_banks(self.n_mels, padded_window_size, float(self.fs), 20.0, 0.0, 100.0,
+                                           -500.0, 1.0)
+        mel_banks = torch.nn.functional.pad(mel_banks, (0, 1), mode="constant", value=0)
+        self.register_buffer("fbank_window", fbank_window(self.window, window_size), persistent=False)
+        self.register_buffer("mel_banks", mel_banks, persistent=False)
 
     def output_size(self) -> int:
         return self.n_mels * self.lfr_m
 
-    def forward(
+    def apply_lfr_cmvn(
+            self,
+            feats: torch.Tensor,
+            feats_lens: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        feats_lens = torch.as_tensor(feats_lens).long().cpu().clamp(max=feats.shape[1])
+        if self.lfr_m != 1 or self.lfr_n != 1:
+            feats, feats_lens = apply_lfr_batch(feats, feats_lens, self.lfr_m, self.lfr_n)
+        elif feats.shape[0] > 0:
+            feats = feats[:, :int(feats_lens.max())]
+        if self.cmvn is not None:
+            dim = feats.shape[-1]
+            feats = (feats + self.cmvn[0:1, :dim].type(feats.dtype)) * self.cmvn[1:2, :dim].type(feats.dtype)
+            mask = (torch.arange(feats.shape[1])[None, :] < feats_lens[:, None]).to(feats.device)
+            feats = feats.masked_fill(~mask[:, :, None], 0.0).type(torch.float32)
+        return feats, feats_lens
+
+    def compute_fbank(
             self,
             input: torch.Tensor,
-            input_lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+            input_lengths: torch.Tensor,
+            snip_edges: bool = True) -> Tuple[torch.Tensor, torch.Tensor]:
+        if snip_edges and self.fbank_window is not None:
+            return fbank_batch(input, input_lengths, self.fbank_window, self.mel_banks, self.frame_shift_samples,
+                               dither=self.dither)
+
         batch_size = input.size(0)
         feats = []
         feats_lens = []
         for i in range(batch_size):
             waveform_length = input_lengths[i]
             waveform = input[i][:waveform_length]
-            if self.upsacle_samples:
-                waveform = waveform * (1 << 15)
             waveform = waveform.unsqueeze(0)
             mat = kaldi.fbank(waveform,
                               num_mel_bins=self.n_mels,
@@ -134,12 +222,8 @@ class WavFrontend(AbsFrontend):
                               energy_floor=0.0,
                               window_type=self.window,
                               sample_frequency=self.fs,
-                              snip_edges=self.snip_edges)
-     
-            if self.lfr_m != 1 or self.lfr_n != 1:
-                mat = apply_lfr(mat, self.lfr_m, self.lfr_n)
-            if self.cmvn_file is not None:
-                mat = apply_cmvn(mat, self.cmvn_file) 
+                              snip_edges=snip_edges)
+
             feat_length = mat.size(0)
             feats.append(mat)
             feats_lens.append(feat_length)
@@ -150,57 +234,90 @@ class WavFrontend(AbsFrontend):
                                  padding_value=0.0)
         return feats_pad, feats_lens
 
+    def forward(
+            self,
+            input: torch.Tensor,
+            input_lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        if self.upsacle_samples:
+            input = input * (1 << 15)
+        feats_pad, feats_lens = self.compute_fbank(input, input_lengths, self.snip_edges)
+        return self.apply_lfr_cmvn(feats_pad, feats_lens)
+
     def forward_fbank(
             self,
             input: torch.Tensor,
             input_lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
-        batch_size = input.size(0)
-        feats = []
-        feats_lens = []
-        for i in range(batch_size):
-            waveform_length = input_lengths[i]
-            waveform = input[i][:waveform_length]
-            waveform = waveform * (1 << 15)
-            waveform = waveform.unsqueeze(0)
-            mat = kaldi.fbank(waveform,
-                              num_mel_bins=self.n_mels,
-                              frame_length=self.frame_length,
-                              frame_shift=self.frame_shift,
-                              dither=self.dither,
-                              energy_floor=0.0,
-                              window_type=self.window,
-                              sample_frequency=self.fs)
+        return self.compute_fbank(input * (1 << 15), input_lengths)
 
+    def forward_lfr_cmvn(
+            self,
+            input: torch.Tensor,
+            input_lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        return self.apply_lfr_cmvn(input, input_lengths)
 
-            feat_length = mat.size(0)
-            feats.append(mat)
-            feats_lens.append(feat_length)
 
-        feats_lens = torch.as_tensor(feats_lens)
-        feats_pad = pad_sequence(feats,
-                                 batch_first=True,
-                                 padding_value=0.0)
-        return feats_pad, feats_lens
+class OnlineWavFrontend(WavFrontend):
+    """Streaming frontend for online recognition.
 
-    def forward_lfr_cmvn(
+    Accepts pcm chunks of any size and returns only the new fbank + lfr + cmvn frames. The samples
+    of an incomplete fbank frame and the fbank frames still needed as lfr context are cached, so the
+    concatenated outputs are the same as WavFrontend.forward over the concatenated audio.
+
+    Examples:
+        >>> frontend = OnlineWavFrontend(cmvn_file="am.mvn", lfr_m=7, lfr_n=6, dither=0.0)
+        >>> for chunk, is_final in chunks:
+        ...     feats, feats_lens = frontend.forward_chunk(chunk, is_final)
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        assert self.snip_edges, "OnlineWavFrontend only supports snip_edges=True"
+        self.reset_status()
+
+    def reset_status(self):
+        self.waveform_cache = torch.zeros(0)
+        self.fbank_cache = torch.zeros((0, self.n_mels))
+        self.fbank_cache_start = 0  # index of the first cached fbank frame in the whole stream
+        self.num_fbank = 0
+        self.lfr_idx = 0  # index of the next lfr frame to output
+
+    def forward_chunk(
             self,
             input: torch.Tensor,
-            input_lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
-        batch_size = input.size(0)
-        feats = []
-        feats_lens = []
-        for i in range(batch_size):
-            mat = input[i, :input_lengths[i], :]
-            if self.lfr_m != 1 or self.lfr_n != 1:
-                mat = apply_lfr(mat, self.lfr_m, self.lfr_n)
-            if self.cmvn_file is not None:
-                mat = apply_cmvn(mat, self.cmvn_file)
-            feat_length = mat.size(0)
-            feats.append(mat)
-            feats_lens.append(feat_length)
+            is_final: bool = False) -> Tuple[torch.Tensor, torch.Tensor]:
+        waveform = input.view(-1)
+        if self.upsacle_samples:
+            waveform = waveform * (1 << 15)
+        waveform = torch.cat((self.waveform_cache.to(waveform), waveform))
+        fbank, fbank_lens = self.compute_fbank(waveform[None, :], torch.as_tensor([waveform.shape[0]]))
+        num_frames = int(fbank_lens[0])
+        # keep the samples from the first incomplete fbank frame on
+        self.waveform_cache = waveform[num_frames * self.frame_shift_samples:]
+        self.fbank_cache = torch.cat((self.fbank_cache.to(fbank), fbank[0, :num_frames]))
+        self.num_fbank += num_frames
 
-        feats_lens = torch.as_tensor(feats_lens)
-        feats_pad = pad_sequence(feats,
-                                 batch_first=True,
-                                 padding_value=0.0)
-        return feats_pad, feats_lens
+        left_padding = (self.lfr_m - 1) // 2
+        if is_final:
+            num_lfr = (self.num_fbank + self.lfr_n - 1) // self.lfr_n
+        else:
+            # lfr frame i is complete once fbank frame i * lfr_n - left_padding + lfr_m - 1 is computed
+            num_lfr = max(0, (self.num_fbank - self.lfr_m + left_padding) // self.lfr_n + 1)
+        num_new = max(0, num_lfr - self.lfr_idx)
+        index = torch.arange(self.lfr_idx, self.lfr_idx + num_new)[:, None] * self.lfr_n + \
+                torch.arange(self.lfr_m)[None, :] - left_padding
+        index = index.clamp(min=0, max=max(self.num_fbank - 1, 0)) - self.fbank_cache_start
+        feats = self.fbank_cache[index.view(-1).to(self.fbank_cache.device)]
+        feats = feats.view(num_new, self.lfr_m * self.n_mels).type(torch.float32)
+        if self.cmvn is not None:
+            dim = feats.shape[-1]
+            feats = (feats + self.cmvn[0:1, :dim].type(feats.dtype)) * self.cmvn[1:2, :dim].type(feats.dtype)
+            feats = feats.type(torch.float32)
+        self.lfr_idx += num_new
+
+        if is_final:
+            self.reset_status()
+        else:
+            # drop the fbank frames before the left context of the next lfr frame
+            next_start = max(0, self.lfr_idx * self.lfr_n - left_padding)
+            self.fbank_cache = self.fbank_cache[next_start - self.fbank_cache_start:]
+            self.fbank_cache_start = next_start
+        return feats[None, :, :], torch.as_tensor([num_new])
@@ -22,9 +22,11 @@ class StatisticPooling(torch.nn.Module):
             masks = torch.ones_like(xs_pad).to(xs_pad)
         else:
             masks = make_non_pad_mask(ilens, xs_pad, length_dim=2).to(xs_pad)
+            # padded frames of a batch are excluded from the statistics
+            xs_pad = xs_pad * masks
         mean = (torch.sum(xs_pad, dim=self.pooling_dim, keepdim=True) /
                 torch.sum(masks, dim=self.pooling_dim, keepdim=True))
-        squared_difference = torch.pow(xs_pad - mean, 2.0)
+        squared_difference = torch.pow(xs_pad - mean, 2.0) * masks
         variance = (torch.sum(squared_difference, dim=self.pooling_dim, keepdim=True) /
                     torch.sum(masks, dim=self.pooling_dim, keepdim=True))
         for i in reversed(self.pooling_dim):
@@ -6,7 +6,8 @@ from funasr.modules.nets_utils import make_pad_mask
 from funasr.modules.streaming_utils.utils import sequence_mask
 
 class CifPredictor(nn.Module):
-    def __init__(self, idim, l_order, r_order, threshold=1.0, dropout=0.1, smooth_factor=1.0, noise_threshold=0, tail_threshold=0.45):
+    def __init__(self, idim, l_order, r_order, threshold=1.0, dropout=0.1, smooth_factor=1.0, noise_threshold=0, tail_threshold=0.45,
+                 vectorized_cif=False):
         super(CifPredictor, self).__init__()
 
         self.pad = nn.ConstantPad1d((l_order, r_order), 0)
@@ -17,6 +18,7 @@ class CifPredictor(nn.Module):
         self.smooth_factor = smooth_factor
         self.noise_threshold = noise_threshold
         self.tail_threshold = tail_threshold
+        self.vectorized_cif = vectorized_cif
 
     def forward(self, hidden, target_label=None, mask=None, ignore_id=-1, mask_chunk_predictor=None,
                 target_label_length=None):
@@ -50,7 +52,10 @@ class CifPredictor(nn.Module):
         elif self.tail_threshold > 0.0:
             hidden, alphas, token_num = self.tail_process_fn(hidden, alphas, token_num, mask=mask)
             
-        acoustic_embeds, cif_peak = cif(hidden, alphas, self.threshold)
+        if self.vectorized_cif:
+            acoustic_embeds, cif_peak = cif_vectorized(hidden, alphas, self.threshold)
+        else:
+            acoustic_embeds, cif_peak = cif(hidden, alphas, self.threshold)
         
         if target_length is None and self.tail_threshold > 0.0:
             token_num_int = torch.max(token_num).type(torch.int32).item()
@@ -144,6 +149,7 @@ class CifPredictorV2(nn.Module):
                  tf2torch_tensor_name_prefix_torch="predictor",
                  tf2torch_tensor_name_prefix_tf="seq2seq/cif",
                  tail_mask=True,
+                 vectorized_cif=False,
                  ):
         super(CifPredictorV2, self).__init__()
 
@@ -158,6 +164,7 @@ class CifPredictorV2(nn.Module):
         self.tf2torch_tensor_name_prefix_torch = tf2torch_tensor_name_prefix_torch
         self.tf2torch_tensor_name_prefix_tf = tf2torch_tensor_name_prefix_tf
         self.tail_mask = tail_mask
+        self.vectorized_cif = vectorized_cif
 
     def forward(self, hidden, target_label=None, mask=None, ignore_id=-1, mask_chunk_predictor=None,
                 target_label_length=None):
@@ -192,7 +199,10 @@ class CifPredictorV2(nn.Module):
             else:
                 hidden, alphas, token_num = self.tail_process_fn(hidden, alphas, token_num, mask=None)
 
-        acoustic_embeds, cif_peak = cif(hidden, alphas, self.threshold)
+        if self.vectorized_cif:
+            acoustic_embeds, cif_peak = cif_vectorized(hidden, alphas, self.threshold)
+        else:
+            acoustic_embeds, cif_peak = cif(hidden, alphas, self.threshold)
         if target_length is None and self.tail_threshold > 0.0:
             token_num_int = torch.max(token_num).type(torch.int32).item()
             acoustic_embeds = acoustic_embeds[:, :token_num_int, :]
@@ -414,6 +424,66 @@ def cif_wo_hidden(alphas, threshold):
     return fires
 
 
+def _cif_integrate(alphas, threshold):
+    """Cumulative-sum form of the integrate-and-fire recursion in cif/cif_wo_hidden.
+
+    Assuming every alpha is smaller than 1 (at most one fire per frame), the number of
+    fires up to frame t is floor(cumsum_t - threshold) + 1, so the integrated weight before
+    firing at frame t is cumsum_t minus the number of fires before t. The callers fall back to
+    the loop otherwise, see _has_multiple_fires().
+    """
+    alphas_cumsum = torch.cumsum(alphas.double(), dim=1)
+    fire_num = torch.clamp(torch.floor(alphas_cumsum - threshold) + 1, min=0)
+    fire_num_prev = torch.cat([torch.zeros_like(fire_num[:, :1]), fire_num[:, :-1]], dim=1)
+    fires = (alphas_cumsum - fire_num_prev).type(alphas.dtype)
+    fire_place = fire_num > fire_num_prev
+    return fires, fire_place, fire_num_prev.long()
+
+
+def _has_multiple_fires(alphas, threshold):
+    # e.g. the ds_alphas of CifPredictorV3 sum upsample_times alphas and may exceed 1
+    return alphas.numel() > 0 and alphas.max().item() >= threshold
+
+
+def cif_vectorized(hidden, alphas, threshold):
+    """Vectorized equivalent of cif() without the python loop over frames and batch.
+
+    Each frame weight is split into the part completing the current token and the remainder
+    starting the next one, then summed per token with scatter_add. If an alpha reaches the
+    threshold, cif() is used instead.
+    """
+    if _has_multiple_fires(alphas, threshold):
+        return cif(hidden, alphas, threshold)
+    batch_size, len_time, hidden_size = hidden.size()
+    fires, fire_place, token_index = _cif_integrate(alphas, threshold)
+
+    distribution_completion = 1.0 - (fires - alphas)
+    cur = torch.where(fire_place, distribution_completion, alphas)
+    remainds = alphas - cur
+
+    num_fires = fire_place.sum(-1)
+    len_labels = torch.round(alphas.sum(-1)).int()
+    max_label_len = len_labels.max().item()
+    num_slots = max(num_fires.max().item() + 1, max_label_len)
+    frames = torch.zeros([batch_size, num_slots, hidden_size], dtype=hidden.dtype, device=hidden.device)
+    frames = frames.scatter_add(1, token_index[:, :, None].repeat(1, 1, hidden_size), cur[:, :, None] * hidden)
+    remainds_index = torch.where(fire_place, token_index + 1, token_index)
+    frames = frames.scatter_add(1, remainds_index[:, :, None].repeat(1, 1, hidden_size),
+                                remainds[:, :, None] * hidden)
+
+    # tokens that never fired only hold the tail remainder
+    token_mask = torch.arange(max_label_len, device=hidden.device)[None, :] < num_fires[:, None]
+    acoustic_embeds = frames[:, :max_label_len, :] * token_mask[:, :, None].type(hidden.dtype)
+    return acoustic_embeds, fires
+
+
+def cif_wo_hidden_vectorized(alphas, threshold):
+    if _has_multiple_fires(alphas, threshold):
+        return cif_wo_hidden(alphas, threshold)
+    fires, _, _ = _cif_integrate(alphas, threshold)
+    return fires
+
+
 class CifPredictorV3(nn.Module):
     def __init__(self,
                  idim,
@@ -432,6 +502,7 @@ class CifPredictorV3(nn.Module):
                  upsample_type="cnn",
                  use_cif1_cnn=True,
                  tail_mask=True,
+                 vectorized_cif=False,
                  ):
         super(CifPredictorV3, self).__init__()
 
@@ -479,6 +550,7 @@ class CifPredictorV3(nn.Module):
             self.cif_output2 = nn.Linear(idim, 1)
         self.smooth_factor2 = smooth_factor2
         self.noise_threshold2 = noise_threshold2
+        self.vectorized_cif = vectorized_cif
 
     def forward(self, hidden, target_label=None, mask=None, ignore_id=-1, mask_chunk_predictor=None,
                 target_label_length=None):
@@ -539,7 +611,10 @@ class CifPredictorV3(nn.Module):
         elif self.tail_threshold > 0.0:
             hidden, alphas, token_num = self.tail_process_fn(hidden, alphas, token_num, mask=mask)
 
-        acoustic_embeds, cif_peak = cif(hidden, alphas, self.threshold)
+        if self.vectorized_cif:
+            acoustic_embeds, cif_peak = cif_vectorized(hidden, alphas, self.threshold)
+        else:
+            acoustic_embeds, cif_peak = cif(hidden, alphas, self.threshold)
         if target_length is None and self.tail_threshold > 0.0:
             token_num_int = torch.max(token_num).type(torch.int32).item()
             acoustic_embeds = acoustic_embeds[:, :token_num_int, :]
@@ -581,10 +656,11 @@ class CifPredictorV3(nn.Module):
             alphas2 *= (token_num / _token_num)[:, None].repeat(1, alphas2.size(1))
         # re-downsample
         ds_alphas = alphas2.reshape(b, -1, self.upsample_times).sum(-1)
-        ds_cif_peak = cif_wo_hidden(ds_alphas, self.threshold - 1e-4)
+        cif_wo_hidden_fn = cif_wo_hidden_vectorized if self.vectorized_cif else cif_wo_hidden
+        ds_cif_peak = cif_wo_hidden_fn(ds_alphas, self.threshold - 1e-4)
         # upsampled alphas and cif_peak
         us_alphas = alphas2
-        us_cif_peak = cif_wo_hidden(us_alphas, self.threshold - 1e-4)
+        us_cif_peak = cif_wo_hidden_fn(us_alphas, self.threshold - 1e-4)
         return ds_alphas, ds_cif_peak, us_alphas, us_cif_peak
 
     def tail_process_fn(self, hidden, alphas, token_num=None, mask=None):
@@ -439,6 +439,63 @@ class MultiHeadedAttentionSANM(nn.Module):
         att_outs = self.forward_attention(v_h, scores, mask, mask_att_chunk_encoder)
         return att_outs + fsmn_memory
 
+    def forward_fsmn_chunk(self, inputs, mask_shfit_chunk, cache=None):
+        """Compute the fsmn memory of one chunk, continuing the masked inputs of the previous chunk.
+
+        Args:
+            inputs (torch.Tensor): Value tensor of the chunk (#batch, time1, size).
+            mask_shfit_chunk (torch.Tensor): Mask of the fsmn shift frames (#batch, time1, 1).
+            cache (torch.Tensor): Last masked inputs of the previous chunk (#batch, left_padding, size).
+
+        Returns:
+            torch.Tensor: Output tensor (#batch, time1, size).
+            torch.Tensor: Cache for the next chunk (#batch, left_padding, size).
+
+        """
+        b, t, d = inputs.size()
+        left_padding, right_padding = self.pad_fn.padding
+        if cache is None:
+            cache = inputs.new_zeros((b, left_padding, d))
+        inputs = inputs * mask_shfit_chunk
+        x = torch.cat((cache, inputs), dim=1)
+        cache = x[:, x.size(1) - left_padding:, :]
+        x = nn.functional.pad(x.transpose(1, 2), (0, right_padding), "constant", 0.0)
+        x = self.fsmn_block(x)
+        x = x.transpose(1, 2)
+        x += inputs
+        x = self.dropout(x)
+        return x * mask_shfit_chunk, cache
+
+    def forward_chunk(self, x, mask_shfit_chunk, mask_att_chunk_encoder, cache, cache_frames, look_back=1):
+        """Compute scaled dot product attention of one chunk of a stream.
+
+        Args:
+            x (torch.Tensor): Input tensor of the chunk (#batch, time1, size).
+            mask_shfit_chunk (torch.Tensor): Mask of the fsmn shift frames (#batch, time1, 1).
+            mask_att_chunk_encoder (torch.Tensor): Mask over the keys of the look back chunks
+                and of the chunk (#batch, time1, time2).
+            cache (dict): Fsmn cache and the keys and values of the look back chunks.
+            cache_frames (slice): Frames of the chunk attended to by the following chunks.
+            look_back (int): Number of chunks attended to by the following chunks.
+
+        Returns:
+            torch.Tensor: Output tensor (#batch, time1, d_model).
+            dict: Cache for the next chunk.
+
+        """
+        q_h, k_h, v_h, v = self.forward_qkv(x)
+        fsmn_memory, fsmn_cache = self.forward_fsmn_chunk(v, mask_shfit_chunk, cache["fsmn"])
+        q_h = q_h * self.d_k ** (-0.5)
+        k_h_all = torch.cat(cache["k"] + [k_h], dim=2)
+        v_h_all = torch.cat(cache["v"] + [v_h], dim=2)
+        scores = torch.matmul(q_h, k_h_all.transpose(-2, -1))
+        att_outs = self.forward_attention(v_h_all, scores, mask_att_chunk_encoder)
+        new_cache = {"fsmn": fsmn_cache, "k": [], "v": []}
+        if look_back > 0:
+            new_cache["k"] = (cache["k"] + [k_h[:, :, cache_frames, :]])[-look_back:]
+            new_cache["v"] = (cache["v"] + [v_h[:, :, cache_frames, :]])[-look_back:]
+        return att_outs + fsmn_memory, new_cache
+
 class MultiHeadedAttentionSANMwithMask(MultiHeadedAttentionSANM):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
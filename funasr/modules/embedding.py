@@ -405,4 +405,12 @@ class SinusoidalPositionEncoder(torch.nn.Module):
         positions = torch.arange(1, timesteps+1)[None, :]
         position_encoding = self.encode(positions, input_dim, x.dtype).to(x.device)
 
-        return x + position_encoding
\ No newline at end of file
+        return x + position_encoding
+
+    def forward_chunk(self, x, start_idx=0):
+        batch_size, timesteps, input_dim = x.size()
+        # positions continue from the frames of the previous chunks
+        positions = torch.arange(start_idx + 1, start_idx + timesteps + 1)[None, :]
+        position_encoding = self.encode(positions, input_dim, x.dtype).to(x.device)
+
+        return x + position_encoding
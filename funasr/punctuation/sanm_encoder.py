@@ -117,6 +117,76 @@ class EncoderLayerSANM(nn.Module):
 
         return x, mask, cache, mask_shfit_chunk, mask_att_chunk_encoder
 
+    def forward_incremental(self, x, cache=None, is_final=False):
+        """Compute encoded features of the new frames of a stream with the subsequent attention mask.
+
+        The fsmn memory looks ahead right_padding frames, so the outputs are computed up to right_padding
+        frames before the last input frame, and up to the last one if is_final. The outputs are the same
+        as forward over all frames with the subsequent mask.
+
+        Args:
+            x (torch.Tensor): New input frames (1, time, size).
+            cache (dict): Inputs, queries, keys and values of the previous frames and the number of outputs.
+            is_final (bool): Whether x contains the last frames of the stream.
+
+        Returns:
+            torch.Tensor: Outputs of the frames not output before (1, time2, size).
+            dict: Cache for the next frames.
+
+        """
+        if self.concat_after:
+            raise NotImplementedError("forward_incremental doesn't support concat_after")
+        left_padding, right_padding = self.self_attn.pad_fn.padding
+        residual = x
+        if self.normalize_before:
+            x = self.norm1(x)
+        q_h, k_h, v_h, v = self.self_attn.forward_qkv(x)
+        if cache is not None:
+            residual = torch.cat([cache["x"], residual], dim=1)
+            q_h = torch.cat([cache["q"], q_h], dim=2)
+            k_h = torch.cat([cache["k"], k_h], dim=2)
+            v_h = torch.cat([cache["v_h"], v_h], dim=2)
+            v = torch.cat([cache["v"], v], dim=1)
+        beg = 0 if cache is None else cache["num_out"]
+        num_in = residual.size(1)
+        end = num_in if is_final else max(num_in - right_padding, beg)
+        cache = {"x": residual, "q": q_h, "k": k_h, "v_h": v_h, "v": v, "num_out": end}
+        if end == beg:
+            return residual.new_zeros(residual.size(0), 0, self.size), cache
+
+        # fsmn memory, zero padded before the first and after the last frame
+        fsmn_beg = max(beg - left_padding, 0)
+        fsmn_end = min(end + right_padding, num_in)
+        fsmn_memory = nn.functional.pad(
+            v[:, fsmn_beg:fsmn_end, :].transpose(1, 2),
+            (left_padding - (beg - fsmn_beg), end + right_padding - fsmn_end),
+            "constant",
+            0.0,
+        )
+        fsmn_memory = self.self_attn.fsmn_block(fsmn_memory).transpose(1, 2)
+        fsmn_memory = self.self_attn.dropout(fsmn_memory + v[:, beg:end, :])
+
+        q_h = q_h[:, :, beg:end, :] * self.self_attn.d_k ** (-0.5)
+        scores = torch.matmul(q_h, k_h[:, :, :end, :].transpose(-2, -1))
+        mask = subsequent_mask(end, device=x.device)[beg:end].unsqueeze(0)
+        att_outs = self.self_attn.forward_attention(v_h[:, :, :end, :], scores, mask)
+
+        if self.in_size == self.size:
+            x = residual[:, beg:end, :] + self.dropout(att_outs + fsmn_memory)
+        else:
+            x = self.dropout(att_outs + fsmn_memory)
+        if not self.normalize_before:
+            x = self.norm1(x)
+
+        residual = x
+        if self.normalize_before:
+            x = self.norm2(x)
+        x = residual + self.dropout(self.feed_forward(x))
+        if not self.normalize_before:
+            x = self.norm2(x)
+
+        return x, cache
+
 class SANMEncoder(AbsEncoder):
     """
     author: Speech Lab, Alibaba Group, China
@@ -588,3 +658,50 @@ class SANMVadEncoder(AbsEncoder):
             return (xs_pad, intermediate_outs), olens, None
         return xs_pad, olens, None
 
+    def forward_incremental(
+        self,
+        xs: torch.Tensor,
+        cache: dict = None,
+        is_final: bool = False,
+        vad_index: int = 0,
+    ) -> Tuple[torch.Tensor, dict]:
+        """Encode the new frames of a stream, reusing the caches of the previous frames.
+
+        All layers but the last one attend to the past only, so they are computed incrementally and
+        their outputs are kept in cache, which is exact. The last layer attends to all frames and is
+        recomputed over the cached outputs of the previous layer. Since the fsmn memory of each layer
+        looks ahead, the outputs of the last frames change until the frames after them arrive, and
+        after is_final the outputs are the same as forward over all frames.
+
+        Args:
+            xs: new input frames (1, L, D)
+            cache: cache of the previous frames, None for the first frames
+            is_final: whether xs contains the last frames of the stream
+            vad_index: vad index of the last layer as in forward
+        Returns:
+            encoder outputs of the frames encoded by all but the last layer (1, T, D), and the cache
+        """
+        if not isinstance(self.embed, SinusoidalPositionEncoder):
+            raise NotImplementedError("forward_incremental only supports the pe input layer")
+        if cache is None:
+            cache = {"start_idx": 0, "layers": None, "hidden": None}
+        xs = xs * self.output_size() ** 0.5
+        xs = self.embed.forward_chunk(xs, cache["start_idx"])
+        new_cache = {"start_idx": cache["start_idx"] + xs.size(1), "layers": []}
+
+        causal_layers = list(self.encoders0) + list(self.encoders)[:-1]
+        layer_caches = cache["layers"] if cache["layers"] is not None else [None] * len(causal_layers)
+        for encoder_layer, layer_cache in zip(causal_layers, layer_caches):
+            xs, layer_cache = encoder_layer.forward_incremental(xs, layer_cache, is_final)
+            new_cache["layers"].append(layer_cache)
+        if cache["hidden"] is not None:
+            xs = torch.cat([cache["hidden"], xs], dim=1)
+        new_cache["hidden"] = xs
+
+        if len(self.encoders) > 0 and xs.size(1) > 0:
+            masks = torch.ones(1, 1, xs.size(1), device=xs.device, dtype=torch.bool)
+            layer_mask = masks & vad_mask(xs.size(1), vad_index, device=xs.device).unsqueeze(0)
+            xs = self.encoders[-1](xs, [masks, layer_mask])[0]
+        if self.normalize_before:
+            xs = self.after_norm(xs)
+        return xs, new_cache
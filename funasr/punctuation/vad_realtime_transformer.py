@@ -78,6 +78,25 @@ class VadRealtimeTransformer(AbsPunctuation):
     def with_vad(self):
         return True
 
+    def forward_incremental(self, input: torch.Tensor, cache: dict = None, is_final: bool = False,
+                            vad_index: int = 0) -> Tuple[torch.Tensor, dict]:
+        """Punctuation logits of a growing text, encoding only the new tokens.
+
+        Args:
+            input (torch.Tensor): Ids of the new tokens. (1, len)
+            cache (dict): Encoder cache of the previous tokens, None for the first tokens.
+            is_final (bool): Whether input contains the last tokens of the text.
+
+        Returns:
+            the logits of the tokens encoded so far (1, T, punc_size), where the last tokens wait for
+            the look-ahead of the encoder unless is_final, and the encoder cache
+
+        """
+        x = self.embed(input)
+        h, cache = self.encoder.forward_incremental(x, cache, is_final, vad_index)
+        y = self.decoder(h)
+        return y, cache
+
     def score(self, y: torch.Tensor, state: Any, x: torch.Tensor) -> Tuple[torch.Tensor, Any]:
         """Score new token.
 
@@ -0,0 +1,103 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+
+class BatchScheduler():
+    """Collects the finished utterances of all client streams and decodes them in batches.
+
+    A worker thread takes the first waiting utterance, then waits at most max_wait_ms for more
+    until max_batch_size utterances are collected, and decodes them with one call of decode_fn.
+    Each stream gets the result of its own utterance from the future returned by submit.
+    close() decodes the utterances already submitted, then stops the worker thread.
+    """
+    def __init__(self, decode_fn, max_batch_size=8, max_wait_ms=10, log_interval=100):
+        self.decode_fn = decode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self.log_interval = log_interval
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.num_batches = 0
+        self.num_utterances = 0
+        self.max_queue_depth = 0
+        self.closed = False
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, audio):
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("the batch scheduler is closed")
+            self.requests.put((audio, future))
+            self.max_queue_depth = max(self.max_queue_depth, self.requests.qsize())
+        return future
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                # None marks the end of the requests
+                self.requests.put(None)
+        self.worker.join()
+
+    def next_batch(self):
+        """Returns the next batch and whether the scheduler is closed after it."""
+        request = self.requests.get()
+        if request is None:
+            return [], True
+        batch = [request]
+        deadline = time.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def decode(self, batch):
+        try:
+            results = self.decode_fn([audio for audio, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError("got %d results for a batch of %d utterances" % (len(results), len(batch)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+        with self.lock:
+            self.num_batches += 1
+            self.num_utterances += len(batch)
+        if self.log_interval > 0 and self.num_batches % self.log_interval == 0:
+            print("batch scheduler metrics: %s" % str(self.metrics()))
+
+    def run(self):
+        closed = False
+        while not closed:
+            batch, closed = self.next_batch()
+            if len(batch) > 0:
+                self.decode(batch)
+
+    def metrics(self):
+        with self.lock:
+            num_batches = self.num_batches
+            num_utterances = self.num_utterances
+            max_queue_depth = self.max_queue_depth
+        return {
+            "queue_depth": self.requests.qsize(),
+            "max_queue_depth": max_queue_depth,
+            "batches": num_batches,
+            "utterances": num_utterances,
+            "avg_batch_size": num_utterances / num_batches if num_batches > 0 else 0.0,
+            "batch_fill_rate": num_utterances / (num_batches * self.max_batch_size) if num_batches > 0 else 0.0,
+        }
@@ -9,13 +9,15 @@ def serve(args):
       server = grpc.server(futures.ThreadPoolExecutor(max_workers=10),
                         # interceptors=(AuthInterceptor('Bearer mysecrettoken'),)
                            )
-      paraformer_pb2_grpc.add_ASRServicer_to_server(
-          ASRServicer(args.user_allowed, args.model, args.sample_rate, args.backend, args.onnx_dir), server)
+      servicer = ASRServicer(args.user_allowed, args.model, args.sample_rate, args.backend, args.onnx_dir,
+                             args.max_batch_size, args.max_wait_ms)
+      paraformer_pb2_grpc.add_ASRServicer_to_server(servicer, server)
       port = "[::]:" + str(args.port)
       server.add_insecure_port(port)
       server.start()
       print("grpc server started!")
       server.wait_for_termination()
+      servicer.scheduler.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -50,6 +52,16 @@ if __name__ == '__main__':
                         type=str,
                         default="/nfs/models/speech_paraformer-large_asr_nat-zh-cn-16k-common-vocab8404-pytorch",
                         help="onnx model dir")
+
+    parser.add_argument("--max_batch_size",
+                        type=int,
+                        default=8,
+                        help="max number of utterances from different clients decoded in one batch")
+
+    parser.add_argument("--max_wait_ms",
+                        type=int,
+                        default=10,
+                        help="max time to wait for more utterances before decoding a batch")
                         
 
 
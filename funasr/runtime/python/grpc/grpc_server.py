@@ -5,10 +5,11 @@ import time
 
 import paraformer_pb2_grpc
 from paraformer_pb2 import Response
+from batch_scheduler import BatchScheduler
 
 
 class ASRServicer(paraformer_pb2_grpc.ASRServicer):
-    def __init__(self, user_allowed, model, sample_rate, backend, onnx_dir):
+    def __init__(self, user_allowed, model, sample_rate, backend, onnx_dir, max_batch_size=8, max_wait_ms=10):
         print("ASRServicer init")
         self.backend = backend
         self.init_flag = 0
@@ -27,8 +28,24 @@ class ASRServicer(paraformer_pb2_grpc.ASRServicer):
                 from rapid_paraformer.paraformer_onnx import Paraformer
             except ImportError:
                 raise ImportError(f"Please install onnxruntime environment")
-            self.inference_16k_pipeline = Paraformer(model_dir=onnx_dir)
+            self.inference_16k_pipeline = Paraformer(model_dir=onnx_dir, batch_size=max_batch_size)
         self.sample_rate = sample_rate
+        # finished utterances of all streams are decoded together by one worker
+        self.scheduler = BatchScheduler(self.decode_batch, max_batch_size, max_wait_ms)
+
+    def decode_batch(self, audio_list):
+        if self.backend == "pipeline":
+            asr_results = []
+            for audio in audio_list:
+                asr_result = self.inference_16k_pipeline(audio_in=audio, audio_fs = self.sample_rate)
+                if "text" in asr_result:
+                    asr_results.append(asr_result['text'])
+                else:
+                    asr_results.append("")
+            return asr_results
+        elif self.backend == "onnxruntime":
+            from rapid_paraformer.utils.frontend import load_bytes
+            return self.inference_16k_pipeline([load_bytes(audio) for audio in audio_list])
 
     def clear_states(self, user):
         self.clear_buffers(user)
@@ -102,16 +119,7 @@ class ASRServicer(paraformer_pb2_grpc.ASRServicer):
                         print ("user: %s , delay(ms): %s, info: %s " % (req.user, delay_str, "waiting_for_more_voice"))
                         yield Response(sentence=json.dumps(result), user=req.user, action="waiting", language=req.language)
                     else:
-                        if self.backend == "pipeline":
-                            asr_result = self.inference_16k_pipeline(audio_in=tmp_data, audio_fs = self.sample_rate)
-                            if "text" in asr_result:
-                                asr_result = asr_result['text']
-                            else:
-                                asr_result = ""
-                        elif self.backend == "onnxruntime":
-                            from rapid_paraformer.utils.frontend import load_bytes
-                            array = load_bytes(tmp_data)
-                            asr_result = self.inference_16k_pipeline(array)[0]
+                        asr_result = self.scheduler.submit(tmp_data).result()
                         end_time = int(round(time.time() * 1000))
                         delay_str = str(end_time - begin_time)
                         print ("user: %s , delay(ms): %s, text: %s " % (req.user, delay_str, asr_result))
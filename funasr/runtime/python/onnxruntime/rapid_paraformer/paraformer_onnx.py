@@ -54,31 +54,45 @@ class Paraformer():
         for beg_idx in range(0, waveform_nums, self.batch_size):
             
             end_idx = min(waveform_nums, beg_idx + self.batch_size)
-            feats, feats_len = self.extract_feat(waveform_list[beg_idx:end_idx])
             try:
-                outputs = self.infer(feats, feats_len)
-                am_scores, valid_token_lens = outputs[0], outputs[1]
-                if len(outputs) == 4:
-                    # for BiCifParaformer Inference
-                    us_alphas, us_cif_peak = outputs[2], outputs[3]
-                else:
-                    us_alphas, us_cif_peak = None, None
+                asr_res.extend(self.infer_batch(waveform_list[beg_idx:end_idx]))
             except ONNXRuntimeError:
                 #logging.warning(traceback.format_exc())
-                logging.warning("input wav is silence or noise")
-                preds = ['']
-            else:
-                preds = self.decode(am_scores, valid_token_lens)
-                if us_cif_peak is None:
-                    for pred in preds:
-                        asr_res.append({'preds': pred})
-                else:
-                    for pred, us_cif_peak_ in zip(preds, us_cif_peak):
-                        text, tokens = pred
-                        timestamp, timestamp_total = time_stamp_lfr6_onnx(us_cif_peak_, copy.copy(tokens))
-                        if len(self.plot_timestamp_to):
-                            self.plot_wave_timestamp(waveform_list[0], timestamp_total, self.plot_timestamp_to)
-                        asr_res.append({'preds': text, 'timestamp': timestamp})
+                if end_idx - beg_idx == 1:
+                    logging.warning("input wav is silence or noise")
+                    asr_res.append({'preds': ''})
+                    continue
+                # retry one by one, so that only the failing waveforms get an empty result
+                for waveform in waveform_list[beg_idx:end_idx]:
+                    try:
+                        asr_res.extend(self.infer_batch([waveform]))
+                    except ONNXRuntimeError:
+                        logging.warning("input wav is silence or noise")
+                        asr_res.append({'preds': ''})
+        return asr_res
+
+    def infer_batch(self, waveform_list: List[np.ndarray]) -> List:
+        feats, feats_len = self.extract_feat(waveform_list)
+        outputs = self.infer(feats, feats_len)
+        am_scores, valid_token_lens = outputs[0], outputs[1]
+        if len(outputs) == 4:
+            # for BiCifParaformer Inference
+            us_alphas, us_cif_peak = outputs[2], outputs[3]
+        else:
+            us_alphas, us_cif_peak = None, None
+
+        asr_res = []
+        preds = self.decode(am_scores, valid_token_lens)
+        if us_cif_peak is None:
+            for pred in preds:
+                asr_res.append({'preds': pred})
+        else:
+            for pred, us_cif_peak_ in zip(preds, us_cif_peak):
+                text, tokens = pred
+                timestamp, timestamp_total = time_stamp_lfr6_onnx(us_cif_peak_, copy.copy(tokens))
+                if len(self.plot_timestamp_to):
+                    self.plot_wave_timestamp(waveform_list[0], timestamp_total, self.plot_timestamp_to)
+                asr_res.append({'preds': text, 'timestamp': timestamp})
         return asr_res
 
     def plot_wave_timestamp(self, wav, text_timestamp, dest):
@@ -117,7 +131,7 @@ class Paraformer():
             return [load_wav(wav_content)]
 
         if isinstance(wav_content, list):
-            return [load_wav(path) for path in wav_content]
+            return [load_wav(path) if isinstance(path, str) else path for path in wav_content]
 
         raise TypeError(
             f'The type of {wav_content} is not in [str, np.ndarray, list]')
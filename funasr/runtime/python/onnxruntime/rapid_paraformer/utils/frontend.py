@@ -71,10 +71,11 @@ class WavFrontend():
         # self.fbank_fn = knf.OnlineFbank(self.opts)
         self.fbank_fn.accept_waveform(self.opts.frame_opts.samp_freq, waveform.tolist())
         frames = self.fbank_fn.num_frames_ready
-        mat = np.empty([frames, self.opts.mel_opts.num_bins])
+        # only the frames computed since the last call are returned
+        mat = np.empty([frames - self.fbank_beg_idx, self.opts.mel_opts.num_bins])
         for i in range(self.fbank_beg_idx, frames):
-            mat[i, :] = self.fbank_fn.get_frame(i)
-        # self.fbank_beg_idx += (frames-self.fbank_beg_idx)
+            mat[i - self.fbank_beg_idx, :] = self.fbank_fn.get_frame(i)
+        self.fbank_beg_idx = frames
         feat = mat.astype(np.float32)
         feat_len = np.array(mat.shape[0]).astype(np.int32)
         return feat, feat_len
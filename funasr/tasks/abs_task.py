@@ -517,6 +517,20 @@ class AbsTask(ABC):
             default=0,
             help="The epoch interval to apply model averaging and save nbest models",
         )
+        group.add_argument(
+            "--async_checkpoint",
+            type=str2bool,
+            default=False,
+            help="Copy the checkpoint to CPU memory and write it to the disk from a background thread, "
+                 "so that the training goes on without waiting for the disk. Ignored with --use_pai",
+        )
+        group.add_argument(
+            "--keep_recent_checkpoints",
+            type=int,
+            default=0,
+            help="With --async_checkpoint, keep the checkpoints of the last N epochs as checkpoint.{epoch}.pth "
+                 "and link checkpoint.pth to the latest. 0 keeps only checkpoint.pth",
+        )
         group.add_argument(
             "--grad_clip",
             type=float,
@@ -542,6 +556,14 @@ class AbsTask(ABC):
             default=1,
             help="The number of gradient accumulation",
         )
+        group.add_argument(
+            "--accum_grad_no_sync",
+            type=str2bool,
+            default=False,
+            help="For distributed training, synchronize gradients only at the last step of the "
+                 "gradient accumulation and the stats only every log_interval. "
+                 "The loss is averaged in each worker instead of over all workers",
+        )
         group.add_argument(
             "--no_forward_run",
             type=str2bool,
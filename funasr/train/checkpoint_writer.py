@@ -0,0 +1,155 @@
+"""Background checkpoint writer."""
+import atexit
+import copy
+import logging
+import os
+import queue
+import re
+import threading
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Collection
+from typing import List
+from typing import Union
+
+import torch
+
+
+def cpu_snapshot(obj: Any) -> Any:
+    """Copies the tensors of a (nested) state dict to CPU memory, so that training can go on"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    elif isinstance(obj, dict):
+        return type(obj)((k, cpu_snapshot(v)) for k, v in obj.items())
+    elif isinstance(obj, list):
+        return [cpu_snapshot(v) for v in obj]
+    elif isinstance(obj, tuple):
+        return tuple(cpu_snapshot(v) for v in obj)
+    else:
+        return copy.deepcopy(obj)
+
+
+def atomic_save(obj: Any, path: Union[str, Path]):
+    """torch.save() to a temporary file which is renamed to path, so path is never partially written"""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    try:
+        torch.save(obj, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def remove_epoch_models(output_dir: Union[str, Path], iepoch: int, keep: Collection[int]) -> List[str]:
+    """Removes {e}epoch.pth of the epochs before iepoch which are not in keep"""
+    output_dir = Path(output_dir)
+    removed = []
+    for e in range(1, iepoch):
+        p = output_dir / f"{e}epoch.pth"
+        if p.exists() and e not in keep:
+            p.unlink()
+            removed.append(str(p))
+    if len(removed) != 0:
+        logging.info("The model files were removed: " + ", ".join(removed))
+    return removed
+
+
+class AsyncCheckpointWriter:
+    """Writes checkpoints from a background thread.
+
+    save() takes a CPU snapshot of the state and returns, then the thread writes it to a temporary file
+    which is atomically renamed. Tasks are run in submission order, so e.g. removing old model files can
+    be submitted after saving the new one. At most max_pending snapshots are queued, save() blocks
+    beyond that. An error of the thread is raised by the next call of save(), submit() or wait().
+    The pending tasks are also done when the interpreter exits, e.g. after an exception in the training.
+
+    Examples:
+        >>> writer = AsyncCheckpointWriter(keep_recent=3)
+        >>> writer.save_checkpoint(states, output_dir, iepoch)
+        >>> writer.save(model.state_dict(), output_dir / f"{iepoch}epoch.pth")
+        >>> writer.close()
+
+    """
+
+    def __init__(self, keep_recent: int = 0, max_pending: int = 2):
+        self.keep_recent = keep_recent
+        self.tasks = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="checkpoint_writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                if self.error is None:
+                    task()
+            except BaseException as e:
+                logging.error(f"Failed to write the checkpoint: {e}")
+                self.error = e
+            finally:
+                self.tasks.task_done()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, task: Callable[[], None]):
+        self._raise_error()
+        self.tasks.put(task)
+
+    def save(self, obj: Any, path: Union[str, Path], copy: bool = True):
+        """Saves obj to path. With copy=False, obj must be a snapshot given by cpu_snapshot()"""
+        snapshot = cpu_snapshot(obj) if copy else obj
+        self.submit(lambda: atomic_save(snapshot, path))
+
+    def save_checkpoint(self, obj: Any, output_dir: Union[str, Path], iepoch: int, copy: bool = True):
+        """Saves output_dir/checkpoint.pth, which Trainer.resume() reads.
+
+        If keep_recent > 0, the checkpoint is written to checkpoint.{iepoch}.pth, checkpoint.pth links to it,
+        and only the keep_recent most recent of them are kept.
+        """
+        output_dir = Path(output_dir)
+        if self.keep_recent <= 0:
+            self.save(obj, output_dir / "checkpoint.pth", copy=copy)
+            return
+
+        self.save(obj, output_dir / f"checkpoint.{iepoch}.pth", copy=copy)
+
+        def update_links():
+            tmp_link = output_dir / f".checkpoint.pth.tmp-{os.getpid()}"
+            if tmp_link.is_symlink() or tmp_link.exists():
+                tmp_link.unlink()
+            tmp_link.symlink_to(f"checkpoint.{iepoch}.pth")
+            os.replace(tmp_link, output_dir / "checkpoint.pth")
+
+            epochs = []
+            for p in output_dir.glob("checkpoint.*.pth"):
+                m = re.fullmatch(r"checkpoint\.(\d+)\.pth", p.name)
+                if m is not None:
+                    epochs.append(int(m.group(1)))
+            for e in sorted(epochs)[:-self.keep_recent]:
+                (output_dir / f"checkpoint.{e}.pth").unlink()
+
+        self.submit(update_links)
+
+    def wait(self):
+        """Blocks until all the submitted tasks are done"""
+        self.tasks.join()
+        self._raise_error()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        self.tasks.put(None)
+        self.thread.join()
+        self._raise_error()
@@ -192,6 +192,43 @@ class SubReporter:
                 self.stats[key2].append(r)
             self._seen_keys_in_the_step.add(key2)
 
+    def all_reduce_stats(
+            self,
+            keys: Sequence[str],
+            start: int = None,
+            device: Union[str, torch.device] = "cpu",
+    ) -> None:
+        """Replaces the weighted stats of keys from start by their weighted average over all workers
+
+        Stats registered without all_reduce() can be synchronized once per log interval with a single
+        all_reduce(), e.g. Trainer.train_one_epoch() with accum_grad_no_sync.
+        All workers must call it with the same keys and the same number of steps.
+        """
+        if start is None:
+            start = 0
+        if start < 0:
+            start = self.count + start
+        keys = [
+            key2 for key2 in sorted(keys)
+            if key2 in self.stats and isinstance(self.stats[key2][0], WeightedAverage)
+        ]
+        if len(keys) == 0 or start >= self.count:
+            return
+
+        sums = torch.tensor(
+            [
+                [[v.value * v.weight if v.weight != 0 else 0.0, v.weight] for v in self.stats[key2][start:self.count]]
+                for key2 in keys
+            ],
+            dtype=torch.float64,
+            device=device,
+        )
+        torch.distributed.all_reduce(sums, op=torch.distributed.ReduceOp.SUM)
+        for key2, key_sums in zip(keys, sums.tolist()):
+            self.stats[key2][start:self.count] = [
+                to_reported_value(value / weight if weight != 0 else np.nan, weight) for value, weight in key_sums
+            ]
+
     def log_message(self, start: int = None, end: int = None, num_updates: int = None) -> str:
         if self._finished:
             raise RuntimeError("Already finished")
@@ -4,6 +4,7 @@
 """Trainer module."""
 import argparse
 from contextlib import contextmanager
+from contextlib import nullcontext
 import dataclasses
 from dataclasses import is_dataclass
 from distutils.version import LooseVersion
@@ -40,6 +41,9 @@ from funasr.torch_utils.device_funcs import to_device
 from funasr.torch_utils.recursive_op import recursive_average
 from funasr.torch_utils.set_all_random_seed import set_all_random_seed
 from funasr.train.abs_espnet_model import AbsESPnetModel
+from funasr.train.checkpoint_writer import AsyncCheckpointWriter
+from funasr.train.checkpoint_writer import cpu_snapshot
+from funasr.train.checkpoint_writer import remove_epoch_models
 from funasr.train.distributed_utils import DistributedOption
 from funasr.train.reporter import Reporter
 from funasr.train.reporter import SubReporter
@@ -73,6 +77,7 @@ class TrainerOptions:
     train_dtype: str
     grad_noise: bool
     accum_grad: int
+    accum_grad_no_sync: bool
     grad_clip: float
     grad_clip_type: float
     log_interval: Optional[int]
@@ -87,6 +92,8 @@ class TrainerOptions:
     patience: Optional[int]
     keep_nbest_models: Union[int, List[int]]
     nbest_averaging_interval: int
+    async_checkpoint: bool
+    keep_recent_checkpoints: int
     early_stopping_criterion: Sequence[str]
     best_model_criterion: Sequence[Sequence[str]]
     val_scheduler_criterion: Sequence[str]
@@ -262,6 +269,13 @@ class Trainer:
         else:
             train_summary_writer = None
 
+        if trainer_options.async_checkpoint and not trainer_options.use_pai and (
+            not distributed_option.distributed or distributed_option.dist_rank == 0
+        ):
+            checkpoint_writer = AsyncCheckpointWriter(keep_recent=trainer_options.keep_recent_checkpoints)
+        else:
+            checkpoint_writer = None
+
         start_time = time.perf_counter()
         for iepoch in range(start_epoch, trainer_options.max_epoch + 1):
             if iepoch != start_epoch:
@@ -362,6 +376,21 @@ class Trainer:
                         buffer,
                     )
                     trainer_options.oss_bucket.put_object(os.path.join(trainer_options.output_dir, "checkpoint.pth"), buffer.getvalue())
+                elif checkpoint_writer is not None:
+                    # Only the copy to CPU memory blocks, the files are written in the background
+                    states = cpu_snapshot(
+                        {
+                            "model": model.state_dict(),
+                            "reporter": reporter.state_dict(),
+                            "optimizers": [o.state_dict() for o in optimizers],
+                            "schedulers": [
+                                s.state_dict() if s is not None else None
+                                for s in schedulers
+                            ],
+                            "scaler": scaler.state_dict() if scaler is not None else None,
+                        }
+                    )
+                    checkpoint_writer.save_checkpoint(states, output_dir, iepoch, copy=False)
                 else:
                     torch.save(
                         {
@@ -383,6 +412,8 @@ class Trainer:
                     torch.save(model.state_dict(), buffer)
                     trainer_options.oss_bucket.put_object(os.path.join(trainer_options.output_dir,
                                                                        f"{iepoch}epoch.pth"),buffer.getvalue())
+                elif checkpoint_writer is not None:
+                    checkpoint_writer.save(states["model"], output_dir / f"{iepoch}epoch.pth", copy=False)
                 else:
                     torch.save(model.state_dict(), output_dir / f"{iepoch}epoch.pth")
 
@@ -438,6 +469,8 @@ class Trainer:
                         type="model",
                         metadata={"improved": _improved},
                     )
+                    if checkpoint_writer is not None:
+                        checkpoint_writer.wait()
                     artifact.add_file(str(output_dir / f"{iepoch}epoch.pth"))
                     aliases = [
                         f"epoch-{iepoch}",
@@ -461,6 +494,8 @@ class Trainer:
                     trainer_options.nbest_averaging_interval > 0
                     and iepoch % trainer_options.nbest_averaging_interval == 0
                 ):
+                    if checkpoint_writer is not None:
+                        checkpoint_writer.wait()
                     average_nbest_models(
                         reporter=reporter,
                         output_dir=output_dir,
@@ -471,17 +506,23 @@ class Trainer:
                         pai_output_dir=trainer_options.output_dir,
                     )
 
-                for e in range(1, iepoch):
-                    if trainer_options.use_pai:
-                        p = os.path.join(trainer_options.output_dir, f"{e}epoch.pth")
-                        if trainer_options.oss_bucket.object_exists(p) and e not in nbests:
-                            trainer_options.oss_bucket.delete_object(p)
-                            _removed.append(str(p))
-                    else:
-                        p = output_dir / f"{e}epoch.pth"
-                        if p.exists() and e not in nbests:
-                            p.unlink()
-                            _removed.append(str(p))
+                if checkpoint_writer is not None:
+                    # Removed after the pending model files are written
+                    checkpoint_writer.submit(
+                        lambda _iepoch=iepoch, _nbests=nbests: remove_epoch_models(output_dir, _iepoch, _nbests)
+                    )
+                else:
+                    for e in range(1, iepoch):
+                        if trainer_options.use_pai:
+                            p = os.path.join(trainer_options.output_dir, f"{e}epoch.pth")
+                            if trainer_options.oss_bucket.object_exists(p) and e not in nbests:
+                                trainer_options.oss_bucket.delete_object(p)
+                                _removed.append(str(p))
+                        else:
+                            p = output_dir / f"{e}epoch.pth"
+                            if p.exists() and e not in nbests:
+                                p.unlink()
+                                _removed.append(str(p))
                 if len(_removed) != 0:
                     logging.info("The model files were removed: " + ", ".join(_removed))
 
@@ -512,6 +553,9 @@ class Trainer:
                 f"The training was finished at {trainer_options.max_epoch} epochs "
             )
 
+        if checkpoint_writer is not None:
+            checkpoint_writer.close()
+
         # Generated n-best averaged model
         if not distributed_option.distributed or distributed_option.dist_rank == 0:
             average_nbest_models(
@@ -547,12 +591,17 @@ class Trainer:
         ngpu = options.ngpu
         use_wandb = options.use_wandb
         distributed = distributed_option.distributed
+        # [For distributed] Synchronize gradients, stats and the stop-flag only at the accumulation boundaries
+        no_sync = distributed and options.accum_grad_no_sync
 
         if log_interval is None:
             try:
                 log_interval = max(len(iterator) // 20, 10)
             except TypeError:
                 log_interval = 100
+        if no_sync:
+            # Log at the accumulation boundaries, after the gradients are synchronized
+            log_interval = (log_interval + accum_grad - 1) // accum_grad * accum_grad
 
         model.train()
         all_steps_are_invalid = True
@@ -567,7 +616,14 @@ class Trainer:
         ):
             assert isinstance(batch, dict), type(batch)
 
-            if distributed:
+            # NOTE: With no_sync, a worker which has finished its iterator sends the stop-flag
+            # before the next collective call of the others, i.e. the one at the accumulation boundary,
+            # or the buffer broadcast of DistributedDataParallel in the first forward after the boundary
+            if distributed and (
+                not no_sync
+                or iiter % accum_grad == 0
+                or (iiter % accum_grad == 1 and getattr(model, "broadcast_buffers", False))
+            ):
                 torch.distributed.all_reduce(iterator_stop, ReduceOp.SUM)
                 if iterator_stop > 0:
                     break
@@ -577,7 +633,12 @@ class Trainer:
                 all_steps_are_invalid = False
                 continue
 
-            with autocast(scaler is not None):
+            sync_context = nullcontext
+            if no_sync and iiter % accum_grad != 0 and hasattr(model, "no_sync"):
+                # Skip the all-reduce of gradients inside the accumulation
+                sync_context = model.no_sync
+
+            with sync_context(), autocast(scaler is not None):
                 with reporter.measure_time("forward_time"):
                     retval = model(**batch)
 
@@ -622,11 +683,13 @@ class Trainer:
                     loss = (loss * weight.type(loss.dtype)).sum()
 
                     # if distributed, this method can also apply all_reduce()
-                    stats, weight = recursive_average(stats, weight, distributed)
+                    # with no_sync, the stats are reduced once per log interval instead
+                    stats, weight = recursive_average(stats, weight, distributed and not no_sync)
 
-                    # Now weight is summation over all workers
+                    # Now weight is summation over all workers, or over this worker with no_sync,
+                    # then DistributedDataParallel averages the per-worker losses
                     loss /= weight
-                if distributed:
+                if distributed and not no_sync:
                     # NOTE(kamo): Multiply world_size because DistributedDataParallel
                     # automatically normalizes the gradient by world_size.
                     loss *= torch.distributed.get_world_size()
@@ -635,7 +698,7 @@ class Trainer:
 
             reporter.register(stats, weight)
 
-            with reporter.measure_time("backward_time"):
+            with sync_context(), reporter.measure_time("backward_time"):
                 if scaler is not None:
                     # Scales loss.  Calls backward() on scaled loss
                     # to create scaled gradients.
@@ -747,6 +810,8 @@ class Trainer:
             # NOTE(kamo): Call log_message() after next()
             reporter.next()
             if iiter % log_interval == 0:
+                if no_sync:
+                    reporter.all_reduce_stats(stats.keys(), -log_interval, "cuda" if ngpu > 0 else "cpu")
                 num_updates = options.num_updates if hasattr(options, "num_updates") else None
                 logging.info(reporter.log_message(-log_interval, num_updates=num_updates))
                 if summary_writer is not None:
@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List
+from typing import Optional
+from typing import Union
+
+import numpy as np
+import torch
+
+try:
+    import fcntl
+except ImportError:
+    # no inter-process locking on windows
+    fcntl = None
+
+
+def model_identity(*items) -> str:
+    """Identity of a model built from its files and options, files are identified by path, size and mtime."""
+    parts = []
+    for item in items:
+        if isinstance(item, (str, os.PathLike)) and os.path.isfile(item):
+            stat = os.stat(item)
+            parts.append("{}:{}:{}".format(os.path.abspath(item), stat.st_size, stat.st_mtime_ns))
+        else:
+            parts.append(str(item))
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def audio_hash(speech: Union[np.ndarray, torch.Tensor]) -> str:
+    if isinstance(speech, torch.Tensor):
+        speech = speech.detach().cpu().numpy()
+    speech = np.ascontiguousarray(speech)
+    sha1 = hashlib.sha1("{}:{}".format(speech.dtype.str, speech.shape).encode("utf-8"))
+    sha1.update(speech.tobytes())
+    return sha1.hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed cache of speaker embeddings
+
+    Embeddings are keyed by the hash of the waveform, under the identity of the model which computed them.
+    Recently used embeddings are kept in an in-memory LRU, and all of them can be stored on disk as one
+    float32 matrix per model, which is read through a memory map:
+        cache_dir/<model_id>/embeddings.f32  rows of the embeddings
+        cache_dir/<model_id>/index.txt       "dim <dim>", then "<audio hash> <byte offset of the row>" per line
+    Appends are serialized by a lock file among processes. A row is indexed only after it is written, so
+    an interrupted append leaves unreferenced bytes at most, and a partial index line is dropped on load.
+
+    Examples:
+        >>> cache = EmbeddingCache(model_identity("sv.yaml", "sv.pth", "resnet1_dense"), "exp/xvector_cache")
+        >>> key = audio_hash(speech)
+        >>> embedding = cache.get(key)
+        >>> if embedding is None:
+        ...     embedding = compute_embedding(speech)
+        ...     cache.put(key, embedding)
+
+    """
+
+    def __init__(
+            self,
+            model_id: str,
+            cache_dir: Optional[str] = None,
+            max_memory_items: int = 10000,
+    ):
+        self.model_id = model_id
+        self.max_memory_items = max_memory_items
+        self.memory = OrderedDict()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        self.cache_dir = None
+        self.rows = {}
+        self.dim = None
+        self.matrix = None
+        if cache_dir is not None:
+            self.cache_dir = os.path.join(cache_dir, model_id)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.matrix_path = os.path.join(self.cache_dir, "embeddings.f32")
+            self.index_path = os.path.join(self.cache_dir, "index.txt")
+            self._load_index()
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.cache_dir, "lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_index(self, lines: List[str]):
+        tmp_path = "{}.tmp-{}".format(self.index_path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(tmp_path, self.index_path)
+
+    def _reset(self):
+        for path in (self.index_path, self.matrix_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.dim = None
+        self.rows = {}
+        self.matrix = None
+
+    def _load_index(self):
+        with self._locked():
+            if not os.path.exists(self.index_path):
+                return
+            with open(self.index_path, "r") as f:
+                content = f.read()
+            # the last line is empty, or partial if an append was interrupted
+            lines = content.split("\n")[:-1]
+            header = lines[0].split() if len(lines) > 0 else []
+            if len(header) != 2 or header[0] != "dim" or not header[1].isdigit():
+                logging.warning("Embedding cache {} has no valid header, rebuild it.".format(self.cache_dir))
+                self._reset()
+                return
+            dim = int(header[1])
+            matrix_size = os.path.getsize(self.matrix_path) if os.path.exists(self.matrix_path) else 0
+            rows, valid_lines = {}, lines[:1]
+            for line in lines[1:]:
+                fields = line.split()
+                if len(fields) == 2 and fields[1].isdigit() and int(fields[1]) % 4 == 0 \
+                        and int(fields[1]) + dim * 4 <= matrix_size:
+                    rows[fields[0]] = int(fields[1])
+                    valid_lines.append(line)
+            num_dropped = len(lines) - len(valid_lines) + (0 if content.endswith("\n") else 1)
+            if num_dropped > 0:
+                logging.warning("Embedding cache {} is inconsistent, drop {} entries.".format(
+                    self.cache_dir, num_dropped))
+                self._write_index(valid_lines)
+            self.dim = dim
+            self.rows = rows
+
+    def _read_row(self, offset):
+        start = offset // 4
+        if self.matrix is None or start + self.dim > self.matrix.shape[0]:
+            # the memory map is reopened after new rows are appended
+            num_values = os.path.getsize(self.matrix_path) // 4
+            self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(num_values,))
+        return np.array(self.matrix[start:start + self.dim])
+
+    def _remember(self, key, embedding):
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits_memory += 1
+            return self.memory[key]
+        if key in self.rows:
+            embedding = self._read_row(self.rows[key])
+            self._remember(key, embedding)
+            self.hits_disk += 1
+            return embedding
+        self.misses += 1
+        return None
+
+    def put(self, key: str, embedding: np.ndarray):
+        embedding = np.ascontiguousarray(embedding, dtype=np.float32).reshape(-1)
+        self._remember(key, embedding)
+        if self.cache_dir is None or key in self.rows:
+            return
+        with self._locked():
+            if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) == 0:
+                self.dim = embedding.shape[0]
+                self._write_index(["dim {}".format(self.dim)])
+            elif self.dim is None:
+                # created by another process
+                with open(self.index_path, "r") as f:
+                    self.dim = int(f.readline().split()[1])
+            assert embedding.shape[0] == self.dim, \
+                "Embedding dim {} doesn't match the cached dim {}.".format(embedding.shape[0], self.dim)
+            with open(self.matrix_path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                if offset % 4 != 0:
+                    # bytes of an interrupted append
+                    offset -= offset % 4
+                    f.truncate(offset)
+                f.write(embedding.tobytes())
+            # one short write, the row is referenced only once it is complete
+            with open(self.index_path, "a") as f:
+                f.write("{} {}\n".format(key, offset))
+        self.rows[key] = offset
+
+    def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups > 0 else 0.0,
+            "memory_items": len(self.memory),
+            "disk_items": len(self.rows),
+        }
@@ -0,0 +1,215 @@
+import codecs
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Callable
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+import torch
+
+
+class _TrieNode:
+    __slots__ = ("token", "parent", "depth", "children", "num_words", "state")
+
+    def __init__(self, token: Optional[int], parent: Optional["_TrieNode"]):
+        self.token = token
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.children = {}
+        # number of hotwords passing through this node
+        self.num_words = 0
+        # (h, c) of the bias encoder after the prefix ending at this node, each (num_layers, dim)
+        self.state = None
+
+
+class HotwordSet:
+    """Set of hotwords with cached bias encoder outputs for ContextualParaformer
+
+    Hotwords are tokenized once and stored in a trie of token ids. Every trie node keeps the state of the
+    bias encoder LSTM after its prefix, so hotwords sharing a prefix share its computation, adding hotwords
+    only encodes their new nodes, and removing them only prunes the trie. The bias encoder output of a
+    hotword is the hidden state of the last layer at its last node, which is what
+    ContextualParaformer.cal_decoder_with_predictor gets from the packed LSTM. The <s> entry that the model
+    always attends to is kept last, as in Speech2Text.generate_hotwords_list.
+
+    The cached states belong to the weights of asr_model, call clear_states() after changing them.
+    A HotwordSet can be shared by the requests and the Speech2Text instances of the same model.
+
+    Examples:
+        >>> hotword_set = HotwordSet(asr_model, lambda hw: converter.tokens2ids([i for i in hw]))
+        >>> hotword_set.update(["魔搭", "达摩院"])
+        >>> decoder_out, _ = asr_model.cal_decoder_with_predictor(enc, enc_len, embeds, lens, hw_list=hotword_set)
+
+    """
+
+    def __init__(
+            self,
+            asr_model: torch.nn.Module,
+            tokenize: Callable[[str], List[int]],
+    ):
+        self.asr_model = asr_model
+        self.tokenize = tokenize
+        self.root = _TrieNode(None, None)
+        # hotword -> token ids, in insertion order
+        self.hotwords = OrderedDict()
+        # trie nodes whose states are not computed yet
+        self._pending = []
+        self.sos_ids = (asr_model.sos,)
+        self._add_ids(self.sos_ids)
+        self._embeddings = None
+
+    def __len__(self):
+        return len(self.hotwords)
+
+    def __contains__(self, hotword: str):
+        return hotword in self.hotwords
+
+    def __iter__(self):
+        return iter(self.token_ids())
+
+    def token_ids(self) -> List[List[int]]:
+        """Token ids of the hotwords followed by <s>, like Speech2Text.generate_hotwords_list"""
+        return [list(ids) for ids in self.hotwords.values()] + [list(self.sos_ids)]
+
+    def _add_ids(self, ids):
+        node = self.root
+        node.num_words += 1
+        for token in ids:
+            child = node.children.get(token)
+            if child is None:
+                child = node.children[token] = _TrieNode(token, node)
+                self._pending.append(child)
+            child.num_words += 1
+            node = child
+
+    def _remove_ids(self, ids):
+        node = self.root
+        node.num_words -= 1
+        for token in ids:
+            child = node.children[token]
+            child.num_words -= 1
+            if child.num_words == 0:
+                del node.children[token]
+                return
+            node = child
+
+    def _find(self, ids) -> _TrieNode:
+        node = self.root
+        for token in ids:
+            node = node.children[token]
+        return node
+
+    def add(self, hotwords: Iterable[str]):
+        for hotword in hotwords:
+            if hotword in self.hotwords:
+                continue
+            ids = tuple(self.tokenize(hotword))
+            if len(ids) == 0:
+                continue
+            self.hotwords[hotword] = ids
+            self._add_ids(ids)
+            self._embeddings = None
+
+    def remove(self, hotwords: Iterable[str]):
+        for hotword in hotwords:
+            ids = self.hotwords.pop(hotword, None)
+            if ids is not None:
+                self._remove_ids(ids)
+                self._embeddings = None
+
+    def update(self, hotwords: Iterable[str]):
+        """Makes the set equal to hotwords, keeping the cached states of the hotwords in both"""
+        hotwords = list(OrderedDict.fromkeys(hotwords))
+        keep = set(hotwords)
+        self.remove([hotword for hotword in self.hotwords if hotword not in keep])
+        self.add(hotwords)
+
+    def clear_states(self):
+        self._pending = []
+        nodes = list(self.root.children.values())
+        while nodes:
+            node = nodes.pop()
+            node.state = None
+            self._pending.append(node)
+            nodes.extend(node.children.values())
+        self._embeddings = None
+
+    @staticmethod
+    def _is_live(node: _TrieNode) -> bool:
+        # pruned nodes are no longer reachable from the root
+        while node.parent is not None:
+            if node.parent.children.get(node.token) is not node:
+                return False
+            node = node.parent
+        return True
+
+    @torch.no_grad()
+    def _encode_pending(self):
+        """Runs the bias encoder over the new trie nodes, one batched step per depth"""
+        model = self.asr_model
+        lstm = model.bias_encoder
+        weight = next(lstm.parameters())
+        pending = [node for node in self._pending if self._is_live(node)]
+        self._pending = []
+        for depth in sorted(set(node.depth for node in pending)):
+            nodes = [node for node in pending if node.depth == depth]
+            tokens = torch.tensor([node.token for node in nodes], dtype=torch.long, device=weight.device)
+            embeds = model.bias_embed(tokens).unsqueeze(1)
+            if depth == 1:
+                _, (h, c) = lstm(embeds)
+            else:
+                h0 = torch.stack([node.parent.state[0] for node in nodes], dim=1)
+                c0 = torch.stack([node.parent.state[1] for node in nodes], dim=1)
+                _, (h, c) = lstm(embeds, (h0, c0))
+            for i, node in enumerate(nodes):
+                node.state = (h[:, i], c[:, i])
+
+    def embeddings(self) -> torch.Tensor:
+        """Bias encoder outputs of the hotwords followed by <s>, (num_hotwords + 1, dim)"""
+        if self._embeddings is None:
+            self._encode_pending()
+            ids_list = list(self.hotwords.values()) + [self.sos_ids]
+            self._embeddings = torch.stack([self._find(ids).state[0][-1] for ids in ids_list], dim=0)
+        return self._embeddings
+
+    def contextual_info(self, batch_size: int) -> torch.Tensor:
+        """Contextual info of the decoder, (batch_size, num_hotwords + 1, dim)"""
+        return self.embeddings().unsqueeze(0).repeat(batch_size, 1, 1)
+
+
+def load_hotwords(hotword_list_or_file: Optional[str]) -> Optional[List[str]]:
+    """Hotwords from a str separated by spaces, a local txt file or the url of a txt file, one per line"""
+    # for None
+    if hotword_list_or_file is None:
+        hotword_str_list = None
+    # for local txt inputs
+    elif os.path.exists(hotword_list_or_file) and hotword_list_or_file.endswith('.txt'):
+        logging.info("Attempting to parse hotwords from local txt...")
+        with codecs.open(hotword_list_or_file, 'r') as fin:
+            hotword_str_list = [line.strip() for line in fin.readlines()]
+        logging.info("Initialized hotword list from file: {}.".format(hotword_list_or_file))
+    # for url, download and generate txt
+    elif hotword_list_or_file.startswith('http'):
+        logging.info("Attempting to parse hotwords from url...")
+        import requests
+
+        work_dir = tempfile.TemporaryDirectory().name
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+        text_file_path = os.path.join(work_dir, os.path.basename(hotword_list_or_file))
+        local_file = requests.get(hotword_list_or_file)
+        open(text_file_path, "wb").write(local_file.content)
+        hotword_list_or_file = text_file_path
+        with codecs.open(hotword_list_or_file, 'r') as fin:
+            hotword_str_list = [line.strip() for line in fin.readlines()]
+        logging.info("Initialized hotword list from file: {}.".format(hotword_list_or_file))
+    # for text str input
+    elif not hotword_list_or_file.endswith('.txt'):
+        logging.info("Attempting to parse hotwords as str...")
+        hotword_str_list = hotword_list_or_file.strip().split()
+    else:
+        hotword_str_list = None
+    return hotword_str_list
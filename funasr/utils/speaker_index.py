@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# Copyright FunASR (https://github.com/alibaba-damo-academy/FunASR). All Rights Reserved.
+#  MIT License  (https://opensource.org/licenses/MIT)
+
+import argparse
+import logging
+import os
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from kaldiio import ReadHelper
+
+
+def l2_normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norm = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norm, 1e-12)
+
+
+def spherical_kmeans(x: np.ndarray, num_clusters: int, num_iters: int = 10, seed: int = 0) -> np.ndarray:
+    """Centroids of normalized vectors, assigned by the largest cosine similarity."""
+    rng = np.random.RandomState(seed)
+    centroids = x[rng.choice(x.shape[0], num_clusters, replace=False)]
+    for _ in range(num_iters):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        # empty clusters keep their previous centroid
+        empty = np.bincount(assign, minlength=num_clusters) == 0
+        sums[empty] = centroids[empty]
+        centroids = l2_normalize(sums)
+    return centroids
+
+
+def merge_topk(scores, indices, new_scores, new_indices, top_k):
+    scores = np.concatenate([scores, new_scores], axis=1)
+    indices = np.concatenate([indices, new_indices], axis=1)
+    if scores.shape[1] > top_k:
+        part = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        indices = np.take_along_axis(indices, part, axis=1)
+    return scores, indices
+
+
+class SpeakerIndex:
+    """Index of enrolled speaker embeddings for 1:N identification
+
+    The l2 normalized embeddings are stored in one contiguous float32 matrix on disk and searched through a
+    memory map, so the index of a large population is not loaded into memory at once:
+        index_dir/embeddings.f32  (N, D) normalized embeddings
+        index_dir/keys.txt        speaker key of each row
+        index_dir/centroids.npy   (P, D) partition centroids, only for the partitioned index
+        index_dir/offsets.npy     (P + 1,) first row of each partition, rows are sorted by partition
+
+    Exact search scores all embeddings with blocked matrix multiplication. With partitions, only the rows of
+    the num_probe partitions closest to a query are scored, which is approximate but much faster.
+
+    Examples:
+        >>> SpeakerIndex.build("exp/xvector/xvector.scp", "exp/spk_index", num_partitions=256)
+        >>> index = SpeakerIndex("exp/spk_index")
+        >>> scores, keys = index.search(embeddings, top_k=5)
+
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "keys.txt"), "r") as f:
+            self.keys = [line.strip() for line in f if line.strip()]
+        self.embeddings = np.memmap(os.path.join(index_dir, "embeddings.f32"), dtype=np.float32, mode="r")
+        self.embeddings = self.embeddings.reshape(len(self.keys), -1)
+        self.centroids, self.offsets = None, None
+        if os.path.exists(os.path.join(index_dir, "centroids.npy")):
+            self.centroids = np.load(os.path.join(index_dir, "centroids.npy"))
+            self.offsets = np.load(os.path.join(index_dir, "offsets.npy"))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def write(
+            keys: List[str],
+            embeddings: np.ndarray,
+            index_dir: str,
+            num_partitions: int = 0,
+            seed: int = 0,
+    ):
+        os.makedirs(index_dir, exist_ok=True)
+        embeddings = l2_normalize(embeddings)
+        if num_partitions > 0:
+            num_partitions = min(num_partitions, embeddings.shape[0])
+            # the centroids are trained on a sample, large populations are only assigned
+            rng = np.random.RandomState(seed)
+            sample = embeddings[rng.choice(embeddings.shape[0], min(embeddings.shape[0], num_partitions * 256),
+                                           replace=False)]
+            centroids = spherical_kmeans(sample, num_partitions, seed=seed)
+            assign = np.concatenate([np.argmax(embeddings[i:i + 65536] @ centroids.T, axis=1)
+                                     for i in range(0, embeddings.shape[0], 65536)])
+            order = np.argsort(assign, kind="stable")
+            embeddings, keys = embeddings[order], [keys[i] for i in order]
+            offsets = np.searchsorted(assign[order], np.arange(num_partitions + 1))
+            np.save(os.path.join(index_dir, "centroids.npy"), centroids)
+            np.save(os.path.join(index_dir, "offsets.npy"), offsets)
+        else:
+            for name in ("centroids.npy", "offsets.npy"):
+                if os.path.exists(os.path.join(index_dir, name)):
+                    os.remove(os.path.join(index_dir, name))
+        embeddings.astype(np.float32).tofile(os.path.join(index_dir, "embeddings.f32"))
+        with open(os.path.join(index_dir, "keys.txt"), "w") as f:
+            for key in keys:
+                f.write(key + "\n")
+
+    @staticmethod
+    def build(xvector_scp: str, index_dir: str, num_partitions: int = 0, seed: int = 0):
+        """Build the index from the xvector.scp written by sv_inference."""
+        keys, embeddings = [], []
+        with ReadHelper("scp:{}".format(xvector_scp)) as reader:
+            for key, embedding in reader:
+                keys.append(key)
+                embeddings.append(np.asarray(embedding, dtype=np.float32).reshape(-1))
+        logging.info("Building speaker index of {} embeddings in {}".format(len(keys), index_dir))
+        SpeakerIndex.write(keys, np.stack(embeddings), index_dir, num_partitions, seed)
+
+    def _search_rows(self, queries, beg, end, top_k, block_size, scores, indices):
+        for block_beg in range(beg, end, block_size):
+            block_end = min(end, block_beg + block_size)
+            block_scores = queries @ np.asarray(self.embeddings[block_beg:block_end]).T
+            block_indices = np.broadcast_to(np.arange(block_beg, block_end), block_scores.shape)
+            scores, indices = merge_topk(scores, indices, block_scores, block_indices, top_k)
+        return scores, indices
+
+    def search(
+            self,
+            queries: np.ndarray,
+            top_k: int = 5,
+            block_size: int = 65536,
+            num_probe: Optional[int] = None,
+    ) -> Tuple[np.ndarray, List[List[str]]]:
+        """Top-k speakers by cosine similarity
+
+        Args:
+            queries: embeddings (Q, D) or (D,)
+            top_k: number of speakers returned for each query
+            block_size: number of enrolled embeddings scored at once
+            num_probe: number of partitions searched for each query, all embeddings are searched if None
+                or if the index is not partitioned
+        Returns:
+            scores (Q, top_k) in descending order, and the keys of the speakers
+
+        """
+        queries = l2_normalize(queries)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        top_k = min(top_k, len(self.keys))
+        num_queries = queries.shape[0]
+        if num_probe is None or self.centroids is None:
+            scores, indices = self._search_rows(
+                queries, 0, len(self.keys), top_k, block_size,
+                np.zeros((num_queries, 0), dtype=np.float32), np.zeros((num_queries, 0), dtype=np.int64))
+        else:
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :num_probe]
+            scores = np.full((num_queries, top_k), -np.inf, dtype=np.float32)
+            indices = np.zeros((num_queries, top_k), dtype=np.int64)
+            for q in range(num_queries):
+                q_scores, q_indices = scores[q:q + 1, :0], indices[q:q + 1, :0]
+                for p in probes[q]:
+                    q_scores, q_indices = self._search_rows(
+                        queries[q:q + 1], self.offsets[p], self.offsets[p + 1], top_k, block_size, q_scores, q_indices)
+                num_found = q_scores.shape[1]
+                scores[q, :num_found], indices[q, :num_found] = q_scores[0], q_indices[0]
+
+        order = np.argsort(-scores, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        keys = [[self.keys[i] for i, score in zip(row, row_scores) if score > -np.inf]
+                for row, row_scores in zip(indices, scores)]
+        return scores, keys
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Build a speaker index from x-vectors",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--xvector_scp", type=str, required=True, help="xvector.scp written by sv_inference")
+    parser.add_argument("--index_dir", type=str, required=True, help="The directory of the index")
+    parser.add_argument("--num_partitions", type=int, default=0,
+                        help="The number of partitions for approximate search, 0 for exact search only")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the partitioning")
+    return parser
+
+
+def main(cmd=None):
+    logging.basicConfig(level="INFO", format="%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s")
+    args = get_parser().parse_args(cmd)
+    SpeakerIndex.build(args.xvector_scp, args.index_dir, args.num_partitions, args.seed)
+
+
+if __name__ == "__main__":
+    main()
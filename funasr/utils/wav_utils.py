@@ -1,8 +1,14 @@
 # Copyright (c) Alibaba, Inc. and its affiliates.
 
+import glob
+import hashlib
 import math
 import os
 import shutil
+import threading
+import time
+import wave
+from collections import OrderedDict
 from multiprocessing import Pool
 from typing import Any, Dict, Union
 
@@ -23,13 +29,40 @@ def ndarray_resample(audio_in: np.ndarray,
     return audio_out
 
 
+MAX_RESAMPLERS = 16
+_resamplers = OrderedDict()
+_resamplers_lock = threading.Lock()
+
+
+def get_resampler(orig_freq: int,
+                  new_freq: int,
+                  dtype: torch.dtype = torch.float32,
+                  device: Union[str, torch.device] = "cpu") -> torchaudio.transforms.Resample:
+    """Process-wide Resample transform, so that its sinc kernel is computed once per rate pair.
+
+    The MAX_RESAMPLERS most recently used transforms are kept.
+    """
+    key = (int(orig_freq), int(new_freq), dtype, str(device))
+    with _resamplers_lock:
+        resampler = _resamplers.get(key)
+        if resampler is not None:
+            _resamplers.move_to_end(key)
+            return resampler
+    resampler = torchaudio.transforms.Resample(orig_freq=int(orig_freq), new_freq=int(new_freq)).to(
+        device=device, dtype=dtype)
+    with _resamplers_lock:
+        _resamplers[key] = resampler
+        while len(_resamplers) > MAX_RESAMPLERS:
+            _resamplers.popitem(last=False)
+    return resampler
+
+
 def torch_resample(audio_in: torch.Tensor,
                    fs_in: int = 16000,
                    fs_out: int = 16000) -> torch.Tensor:
     audio_out = audio_in
     if fs_in != fs_out:
-        audio_out = torchaudio.transforms.Resample(orig_freq=fs_in,
-                                                   new_freq=fs_out)(audio_in)
+        audio_out = get_resampler(fs_in, fs_out, audio_in.dtype, audio_in.device)(audio_in)
     return audio_out
 
 
@@ -180,23 +213,66 @@ def compute_fbank(wav_file,
     return input_feats
 
 
-def wav2num_frame(wav_path, frontend_conf):
+def audio_num_samples(wav_path):
+    """Number of samples and sampling rate of an audio file, read from its header when possible.
+
+    PCM wav files are read with the wave module, other containers with torchaudio.info, and files whose header
+    has no length, e.g. some mp3 files, or torchaudio versions without info are decoded as a fallback.
+    """
+    if wav_path.endswith(".wav"):
+        try:
+            with wave.open(wav_path, "rb") as f:
+                return f.getnframes(), f.getframerate()
+        except (wave.Error, EOFError):
+            # e.g. float or extensible wav files
+            pass
+    try:
+        info = torchaudio.info(wav_path)
+        if info.num_frames > 0:
+            return info.num_frames, info.sample_rate
+    except (RuntimeError, AttributeError, OSError):
+        # torchaudio>=2.9 has no info(), and a missing backend fails with OSError
+        pass
     waveform, sampling_rate = torchaudio.load(wav_path)
-    speech_length = (waveform.shape[1] / sampling_rate) * 1000.
-    n_frames = (waveform.shape[1] * 1000.0) / (sampling_rate * frontend_conf["frame_shift"] * frontend_conf["lfr_n"])
+    return waveform.shape[1], sampling_rate
+
+
+def wav2num_frame(wav_path, frontend_conf):
+    num_samples, sampling_rate = audio_num_samples(wav_path)
+    speech_length = (num_samples / sampling_rate) * 1000.
+    n_frames = (num_samples * 1000.0) / (sampling_rate * frontend_conf["frame_shift"] * frontend_conf["lfr_n"])
     feature_dim = frontend_conf["n_mels"] * frontend_conf["lfr_m"]
     return n_frames, feature_dim, speech_length
 
 
+def read_finished_shapes(shape_file):
+    """Keys of the complete lines of a partially written shape file, dropping a truncated last line."""
+    if not os.path.exists(shape_file):
+        return set()
+    with open(shape_file) as f:
+        lines = f.readlines()
+    if lines and not lines[-1].endswith("\n"):
+        lines = lines[:-1]
+        with open(shape_file, "w") as f:
+            f.writelines(lines)
+    return set(line.split()[0] for line in lines if line.strip())
+
+
 def calc_shape_core(root_path, frontend_conf, speech_length_min, speech_length_max, idx):
     wav_scp_file = os.path.join(root_path, "wav.scp.{}".format(idx))
     shape_file = os.path.join(root_path, "speech_shape.{}".format(idx))
     with open(wav_scp_file) as f:
         lines = f.readlines()
-    with open(shape_file, "w") as f:
+    # resume from the shapes written by an interrupted run
+    finished = read_finished_shapes(shape_file)
+    num_files = 0
+    with open(shape_file, "a") as f:
         for line in lines:
             sample_name, wav_path = line.strip().split()
+            if sample_name in finished:
+                continue
             n_frames, feature_dim, speech_length = wav2num_frame(wav_path, frontend_conf)
+            num_files += 1
             write_flag = True
             if speech_length_min > 0 and speech_length < speech_length_min:
                 write_flag = False
@@ -205,49 +281,84 @@ def calc_shape_core(root_path, frontend_conf, speech_length_min, speech_length_m
             if write_flag:
                 f.write("{} {},{}\n".format(sample_name, str(int(np.ceil(n_frames))), str(int(feature_dim))))
                 f.flush()
+    return num_files
+
+
+def read_split_info(split_info_file):
+    """Reads the number of jobs and the wav.scp hash the job files of shape_files were split with."""
+    split_info = {}
+    if os.path.exists(split_info_file):
+        with open(split_info_file) as f:
+            for line in f:
+                parts = line.strip().split()
+                if len(parts) == 2:
+                    split_info[parts[0]] = parts[1]
+    return split_info
 
 
 def calc_shape(data_dir, dataset, frontend_conf, speech_length_min=-1, speech_length_max=-1, nj=32):
     shape_path = os.path.join(data_dir, dataset, "shape_files")
-    if os.path.exists(shape_path):
-        assert os.path.exists(os.path.join(data_dir, dataset, "speech_shape"))
+    if os.path.exists(os.path.join(data_dir, dataset, "speech_shape")):
         print('Shape file for small dataset already exists.')
         return
-    os.makedirs(shape_path, exist_ok=True)
-
-    # split
     wav_scp_file = os.path.join(data_dir, dataset, "wav.scp")
-    with open(wav_scp_file) as f:
-        lines = f.readlines()
-        num_lines = len(lines)
-        num_job_lines = num_lines // nj
-    start = 0
-    for i in range(nj):
-        end = start + num_job_lines
-        file = os.path.join(shape_path, "wav.scp.{}".format(str(i + 1)))
-        with open(file, "w") as f:
-            if i == nj - 1:
-                f.writelines(lines[start:])
-            else:
-                f.writelines(lines[start:end])
-        start = end
-
+    with open(wav_scp_file, "rb") as f:
+        wav_scp_hash = hashlib.sha1(f.read()).hexdigest()
+    split_info_file = os.path.join(shape_path, "split_info")
+    if read_split_info(split_info_file) == {"nj": str(nj), "wav_scp_sha1": wav_scp_hash}:
+        # resume the jobs of an interrupted run
+        print('Resuming shape files in {}.'.format(shape_path))
+    else:
+        os.makedirs(shape_path, exist_ok=True)
+        # the job files of a run with another nj or wav.scp are stale
+        if os.path.exists(split_info_file):
+            os.remove(split_info_file)
+        for file in glob.glob(os.path.join(shape_path, "wav.scp.*")) + \
+                glob.glob(os.path.join(shape_path, "speech_shape.*")):
+            os.remove(file)
+
+        # split
+        with open(wav_scp_file) as f:
+            lines = f.readlines()
+            num_lines = len(lines)
+            num_job_lines = num_lines // nj
+        start = 0
+        for i in range(nj):
+            end = start + num_job_lines
+            file = os.path.join(shape_path, "wav.scp.{}".format(str(i + 1)))
+            with open(file, "w") as f:
+                if i == nj - 1:
+                    f.writelines(lines[start:])
+                else:
+                    f.writelines(lines[start:end])
+            start = end
+        # written last, so that an interrupted split is redone
+        with open(split_info_file, "w") as f:
+            f.write("nj {}\nwav_scp_sha1 {}\n".format(nj, wav_scp_hash))
+
+    start_time = time.time()
     p = Pool(nj)
+    jobs = []
     for i in range(nj):
-        p.apply_async(calc_shape_core,
-                      args=(shape_path, frontend_conf, speech_length_min, speech_length_max, str(i + 1)))
+        jobs.append(p.apply_async(calc_shape_core,
+                                  args=(shape_path, frontend_conf, speech_length_min, speech_length_max, str(i + 1))))
     print('Generating shape files, please wait a few minutes...')
     p.close()
+    # raises the error of a failed job instead of combining incomplete shape files
+    num_files = sum(job.get() for job in jobs)
     p.join()
+    elapsed = max(time.time() - start_time, 1e-6)
+    print('Scanned {} files in {:.1f}s, {:.1f} files/sec.'.format(num_files, elapsed, num_files / elapsed))
 
     # combine
     file = os.path.join(data_dir, dataset, "speech_shape")
-    with open(file, "w") as f:
+    with open(file + ".tmp", "w") as f:
         for i in range(nj):
             job_file = os.path.join(shape_path, "speech_shape.{}".format(str(i + 1)))
             with open(job_file) as job_f:
                 lines = job_f.readlines()
                 f.writelines(lines)
+    os.replace(file + ".tmp", file)
     print('Generating shape files done.')
 
 
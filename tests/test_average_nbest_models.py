@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import torch
+
+from funasr.main_funcs.average_nbest_models import average_nbest_models
+from funasr.train.reporter import Reporter
+
+
+def build_reporter(losses, accs):
+    reporter = Reporter()
+    for epoch, (loss, acc) in enumerate(zip(losses, accs), 1):
+        reporter.set_epoch(epoch)
+        with reporter.observe("valid") as sub_reporter:
+            sub_reporter.register({"loss": loss, "acc": acc})
+            sub_reporter.next()
+    return reporter
+
+
+def save_models(output_dir, num_epochs, dim=32):
+    models = []
+    for epoch in range(1, num_epochs + 1):
+        torch.manual_seed(epoch)
+        model = torch.nn.Sequential(torch.nn.Linear(dim, dim), torch.nn.BatchNorm1d(dim))
+        model.train()(torch.randn(8, dim))
+        states = model.state_dict()
+        torch.save(states, output_dir / f"{epoch}epoch.pth")
+        models.append(states)
+    return models
+
+
+def reference_average(models):
+    avg = {}
+    for k in models[0]:
+        if str(models[0][k].dtype).startswith("torch.int"):
+            avg[k] = sum(m[k] for m in models)
+        else:
+            avg[k] = sum(m[k] for m in models) / len(models)
+    return avg
+
+
+class TestAverageNbestModels(unittest.TestCase):
+    def test_average(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_dir = Path(tmp_dir)
+            models = save_models(output_dir, 5)
+            # the best 3 epochs are the same for loss and acc, but not the best 2
+            reporter = build_reporter([0.5, 0.3, 0.1, 0.2, 0.4], [0.1, 0.8, 0.7, 0.9, 0.2])
+            average_nbest_models(
+                output_dir=output_dir,
+                reporter=reporter,
+                best_model_criterion=[("valid", "loss", "min"), ("valid", "acc", "max")],
+                nbest=[1, 2, 3],
+            )
+            for name, epochs in [
+                ("valid.loss.ave_2best.pth", [3, 4]),
+                ("valid.loss.ave_3best.pth", [3, 4, 2]),
+                ("valid.acc.ave_2best.pth", [4, 2]),
+                ("valid.acc.ave_3best.pth", [4, 2, 3]),
+            ]:
+                avg = torch.load(output_dir / name)
+                expected = reference_average([models[e - 1] for e in epochs])
+                for k, v in expected.items():
+                    self.assertEqual(avg[k].dtype, v.dtype)
+                    self.assertTrue(torch.allclose(avg[k], v, atol=1e-6), (name, k))
+            self.assertEqual(os.readlink(output_dir / "valid.loss.ave_1best.pth"), "3epoch.pth")
+            self.assertEqual(os.readlink(output_dir / "valid.acc.ave_3best.pth"), "valid.loss.ave_3best.pth")
+            self.assertEqual(os.readlink(output_dir / "valid.acc.ave.pth"), "valid.acc.ave_3best.pth")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import importlib.util
+import os
+import sys
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "funasr", "runtime", "python")
+# the grpc server and the onnxruntime package import their modules from their own directories
+sys.path.insert(0, os.path.join(RUNTIME_DIR, "grpc"))
+sys.path.insert(0, os.path.join(RUNTIME_DIR, "onnxruntime"))
+
+from batch_scheduler import BatchScheduler
+
+
+class RecordingDecoder:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, audio_list):
+        self.batches.append(list(audio_list))
+        time.sleep(self.delay)
+        return [audio * 10 for audio in audio_list]
+
+
+class TestBatchScheduler(unittest.TestCase):
+    def test_max_batch_size(self):
+        decoder = RecordingDecoder()
+        scheduler = BatchScheduler(decoder, max_batch_size=4, max_wait_ms=200, log_interval=0)
+        futures = [scheduler.submit(i) for i in range(10)]
+        # each stream gets the result of its own utterance
+        self.assertEqual([future.result(timeout=5) for future in futures], [i * 10 for i in range(10)])
+        self.assertEqual([len(batch) for batch in decoder.batches], [4, 4, 2])
+        self.assertEqual(sum(decoder.batches, []), list(range(10)))
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics["batches"], 3)
+        self.assertEqual(metrics["utterances"], 10)
+        scheduler.close()
+
+    def test_max_wait(self):
+        decoder = RecordingDecoder()
+        scheduler = BatchScheduler(decoder, max_batch_size=8, max_wait_ms=100, log_interval=0)
+        tic = time.time()
+        self.assertEqual(scheduler.submit(1).result(timeout=5), 10)
+        # a lone utterance is decoded after max_wait_ms, without waiting for a full batch
+        self.assertGreaterEqual(time.time() - tic, 0.09)
+        self.assertEqual(decoder.batches, [[1]])
+        scheduler.close()
+
+    def test_decode_error(self):
+        def failing_decode(audio_list):
+            raise ValueError("decoding failed")
+
+        scheduler = BatchScheduler(failing_decode, max_batch_size=4, max_wait_ms=50, log_interval=0)
+        futures = [scheduler.submit(i) for i in range(3)]
+        for future in futures:
+            self.assertIsInstance(future.exception(timeout=5), ValueError)
+        scheduler.close()
+
+        scheduler = BatchScheduler(lambda audio_list: audio_list[:1], max_batch_size=4, max_wait_ms=50,
+                                   log_interval=0)
+        futures = [scheduler.submit(i) for i in range(2)]
+        for future in futures:
+            self.assertIsInstance(future.exception(timeout=5), RuntimeError)
+        scheduler.close()
+
+    def test_close(self):
+        decoder = RecordingDecoder(delay=0.05)
+        scheduler = BatchScheduler(decoder, max_batch_size=2, max_wait_ms=10, log_interval=0)
+        futures = [scheduler.submit(i) for i in range(5)]
+        scheduler.close()
+        # the utterances submitted before close are decoded
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual([future.result() for future in futures], [i * 10 for i in range(5)])
+        self.assertFalse(scheduler.worker.is_alive())
+        with self.assertRaises(RuntimeError):
+            scheduler.submit(5)
+        scheduler.close()
+
+    def test_concurrent_streams(self):
+        decoder = RecordingDecoder(delay=0.01)
+        scheduler = BatchScheduler(decoder, max_batch_size=8, max_wait_ms=5, log_interval=0)
+        results = {}
+
+        def stream(n):
+            results[n] = [scheduler.submit(n * 100 + i).result(timeout=5) for i in range(10)]
+
+        threads = [threading.Thread(target=stream, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        scheduler.close()
+        for n in range(8):
+            self.assertEqual(results[n], [(n * 100 + i) * 10 for i in range(10)])
+        self.assertTrue(all(len(batch) <= 8 for batch in decoder.batches))
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("onnxruntime") and importlib.util.find_spec("kaldi_native_fbank"),
+    "onnxruntime and kaldi_native_fbank are required",
+)
+class TestParaformerBatchRetry(unittest.TestCase):
+    def build_paraformer(self, batch_size):
+        from rapid_paraformer.paraformer_onnx import Paraformer
+        from rapid_paraformer.utils.utils import ONNXRuntimeError
+
+        def infer_batch(waveform_list):
+            self.batches.append(len(waveform_list))
+            # an empty waveform fails the whole batch
+            if any(len(waveform) == 0 for waveform in waveform_list):
+                raise ONNXRuntimeError("empty input")
+            return [{'preds': str(len(waveform))} for waveform in waveform_list]
+
+        self.batches = []
+        paraformer = Paraformer.__new__(Paraformer)
+        paraformer.batch_size = batch_size
+        paraformer.frontend = SimpleNamespace(opts=SimpleNamespace(frame_opts=SimpleNamespace(samp_freq=16000)))
+        paraformer.infer_batch = infer_batch
+        return paraformer
+
+    def test_retry_one_by_one(self):
+        paraformer = self.build_paraformer(batch_size=4)
+        waveforms = [np.zeros(n, dtype=np.float32) for n in [3, 0, 5, 7, 11]]
+        results = paraformer(waveforms)
+        self.assertEqual([result['preds'] for result in results], ['3', '', '5', '7', '11'])
+        # the failed batch is retried utterance by utterance, the next batch is not affected
+        self.assertEqual(self.batches, [4, 1, 1, 1, 1, 1])
+
+    def test_single_failure(self):
+        paraformer = self.build_paraformer(batch_size=1)
+        results = paraformer([np.zeros(0, dtype=np.float32), np.zeros(2, dtype=np.float32)])
+        self.assertEqual([result['preds'] for result in results], ['', '2'])
+        self.assertEqual(self.batches, [1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
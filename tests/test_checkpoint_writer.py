@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import torch
+
+from funasr.train.checkpoint_writer import AsyncCheckpointWriter, cpu_snapshot, remove_epoch_models
+from funasr.train.reporter import Reporter
+from funasr.train.trainer import Trainer
+
+
+def build_states(model, optimizer, reporter):
+    return {
+        "model": model.state_dict(),
+        "reporter": reporter.state_dict(),
+        "optimizers": [optimizer.state_dict()],
+        "schedulers": [None],
+        "scaler": None,
+    }
+
+
+def train_step(model, optimizer):
+    optimizer.zero_grad()
+    model(torch.randn(4, model.in_features)).sum().backward()
+    optimizer.step()
+
+
+class TestAsyncCheckpointWriter(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = torch.nn.Linear(64, 64)
+        self.optimizer = torch.optim.Adam(self.model.parameters())
+        train_step(self.model, self.optimizer)
+        self.reporter = Reporter()
+        self.reporter.set_epoch(1)
+
+    def test_snapshot(self):
+        states = build_states(self.model, self.optimizer, self.reporter)
+        snapshot = cpu_snapshot(states)
+        train_step(self.model, self.optimizer)
+        self.assertFalse(torch.equal(snapshot["model"]["weight"], self.model.weight))
+        self.assertFalse(torch.equal(snapshot["optimizers"][0]["state"][0]["exp_avg"],
+                                     self.optimizer.state[self.model.weight]["exp_avg"]))
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            writer = AsyncCheckpointWriter(keep_recent=2)
+            for iepoch in range(1, 5):
+                self.reporter.set_epoch(iepoch)
+                writer.save_checkpoint(build_states(self.model, self.optimizer, self.reporter), output_dir, iepoch)
+                writer.save(self.model.state_dict(), os.path.join(output_dir, f"{iepoch}epoch.pth"))
+                writer.submit(lambda _iepoch=iepoch: remove_epoch_models(output_dir, _iepoch, [1]))
+                expected = {k: v.clone() for k, v in self.model.state_dict().items()}
+                # the training goes on while the checkpoint is written
+                train_step(self.model, self.optimizer)
+            writer.close()
+            self.assertEqual(
+                sorted(os.listdir(output_dir)),
+                ["1epoch.pth", "4epoch.pth", "checkpoint.3.pth", "checkpoint.4.pth", "checkpoint.pth"],
+            )
+            self.assertEqual(os.readlink(os.path.join(output_dir, "checkpoint.pth")), "checkpoint.4.pth")
+
+            model = torch.nn.Linear(64, 64)
+            optimizer = torch.optim.Adam(model.parameters())
+            reporter = Reporter()
+            Trainer.resume(os.path.join(output_dir, "checkpoint.pth"), model, reporter, [optimizer], [None], None)
+            self.assertEqual(reporter.get_epoch(), 4)
+            for k, v in model.state_dict().items():
+                self.assertTrue(torch.equal(v, expected[k]))
+            self.assertEqual(optimizer.state_dict()["state"][0]["step"], 4)
+
+    def test_error(self):
+        writer = AsyncCheckpointWriter()
+        writer.save({"a": torch.zeros(1)}, os.path.join(tempfile.gettempdir(), "no_such_dir", "a.pth"))
+        # torch.save raises RuntimeError for a missing parent directory
+        with self.assertRaises((OSError, RuntimeError)):
+            writer.wait()
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
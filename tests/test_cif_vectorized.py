@@ -0,0 +1,61 @@
+import unittest
+
+import torch
+
+from funasr.models.predictor.cif import cif, cif_wo_hidden, cif_vectorized, cif_wo_hidden_vectorized
+from funasr.models.predictor.cif import CifPredictorV2
+
+
+class TestCifVectorized(unittest.TestCase):
+    def _random_inputs(self, batch_size, len_time, hidden_size=16):
+        torch.manual_seed(0)
+        hidden = torch.randn(batch_size, len_time, hidden_size)
+        alphas = torch.rand(batch_size, len_time) * 0.6
+        lengths = torch.randint(len_time // 2, len_time + 1, (batch_size,))
+        lengths[0] = len_time
+        mask = torch.arange(len_time)[None, :] < lengths[:, None]
+        return hidden, alphas * mask
+
+    def test_cif_equivalence(self):
+        for batch_size, len_time in [(1, 50), (4, 200), (8, 731)]:
+            hidden, alphas = self._random_inputs(batch_size, len_time)
+            embeds, fires = cif(hidden, alphas, 1.0)
+            embeds_vec, fires_vec = cif_vectorized(hidden, alphas, 1.0)
+            self.assertEqual(embeds.shape, embeds_vec.shape)
+            self.assertTrue(torch.allclose(embeds, embeds_vec, atol=1e-4))
+            self.assertTrue(torch.allclose(fires, fires_vec, atol=1e-4))
+
+    def test_alphas_over_threshold(self):
+        # e.g. the ds_alphas of CifPredictorV3, which sum several upsampled alphas
+        hidden, alphas = self._random_inputs(4, 100)
+        alphas = alphas * 2.5
+        self.assertGreaterEqual(alphas.max().item(), 1.0)
+        embeds, fires = cif(hidden, alphas, 1.0)
+        embeds_vec, fires_vec = cif_vectorized(hidden, alphas, 1.0)
+        self.assertTrue(torch.allclose(embeds, embeds_vec, atol=1e-4))
+        self.assertTrue(torch.allclose(fires, fires_vec, atol=1e-4))
+        fires = cif_wo_hidden(alphas, 1.0 - 1e-4)
+        fires_vec = cif_wo_hidden_vectorized(alphas, 1.0 - 1e-4)
+        self.assertTrue(torch.allclose(fires, fires_vec, atol=1e-4))
+
+    def test_cif_wo_hidden_equivalence(self):
+        _, alphas = self._random_inputs(4, 500)
+        fires = cif_wo_hidden(alphas, 1.0 - 1e-4)
+        fires_vec = cif_wo_hidden_vectorized(alphas, 1.0 - 1e-4)
+        self.assertTrue(torch.allclose(fires, fires_vec, atol=1e-4))
+
+    def test_predictor_switch(self):
+        hidden, _ = self._random_inputs(2, 120)
+        mask = torch.ones(2, 1, 120)
+        predictor = CifPredictorV2(16, 1, 1, tail_threshold=0.45).eval()
+        predictor_vec = CifPredictorV2(16, 1, 1, tail_threshold=0.45, vectorized_cif=True).eval()
+        predictor_vec.load_state_dict(predictor.state_dict())
+        with torch.no_grad():
+            outs = predictor(hidden, mask=mask)
+            outs_vec = predictor_vec(hidden, mask=mask)
+        self.assertTrue(torch.allclose(outs[0], outs_vec[0], atol=1e-4))
+        self.assertTrue(torch.allclose(outs[3], outs_vec[3], atol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
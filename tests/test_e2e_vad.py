@@ -0,0 +1,81 @@
+import math
+import unittest
+
+import torch
+
+from funasr.models.e2e_vad import E2EVadModel
+from funasr.models.encoder.fsmn_encoder import FSMN
+
+
+def build_vad_model():
+    torch.manual_seed(0)
+    encoder = FSMN(input_dim=400, input_affine_dim=140, fsmn_layers=4, linear_dim=250, proj_dim=128,
+                   lorder=20, rorder=0, lstride=1, rstride=0, output_affine_dim=140, output_dim=248)
+    return E2EVadModel(encoder, dict(sample_rate=16000, max_end_silence_time=800)).eval()
+
+
+def synthetic_chunks(seconds, chunk_frames=600):
+    # bursts of loud noise separated by quiet gaps, 10 ms frames with 400 dim lfr features
+    torch.manual_seed(1)
+    num_frames = seconds * 100
+    waveform = torch.randn(num_frames * 160 + 240) * 0.01
+    for start in range(0, num_frames, 500):
+        waveform[start * 160:(start + 300) * 160] *= 100
+    feats = torch.randn(1, num_frames, 400)
+    for t_offset in range(0, num_frames, chunk_frames):
+        step = min(chunk_frames, num_frames - t_offset)
+        is_final = t_offset + step >= num_frames
+        yield (feats[:, t_offset:t_offset + step, :],
+               waveform[None, t_offset * 160:(t_offset + step - 1) * 160 + 400],
+               is_final)
+
+
+def frame_states_loop(waveform, scores, opts):
+    # per-frame decibel and speech/noise decision as computed before vectorization
+    frame_sample_length = int(opts.frame_length_ms * opts.sample_rate / 1000)
+    frame_shift_length = int(opts.frame_in_ms * opts.sample_rate / 1000)
+    decibel, speech_frames = [], []
+    for offset in range(0, waveform.shape[1] - frame_sample_length + 1, frame_shift_length):
+        decibel.append(10 * math.log10((waveform[0][offset: offset + frame_sample_length]).square().sum() + 0.000001))
+    for t in range(scores.shape[1]):
+        sum_score = sum([scores[0][t][sil_pdf_id] for sil_pdf_id in opts.sil_pdf_ids])
+        noise_prob = math.log(sum_score) * opts.speech_2_noise_ratio
+        speech_prob = math.log(1.0 - sum_score)
+        speech_frames.append(math.exp(speech_prob) >= math.exp(noise_prob) + opts.speech_noise_thres)
+    return decibel, speech_frames
+
+
+class TestE2EVad(unittest.TestCase):
+    def test_frame_states(self):
+        model = build_vad_model()
+        feats, waveform, _ = next(synthetic_chunks(10))
+        with torch.no_grad():
+            scores = model.encoder(feats, dict())
+        decibel, speech_frames = frame_states_loop(waveform, scores, model.vad_opts)
+        stream_state = model.NewStreamState()
+        stream_state.ComputeDecibel(waveform)
+        stream_state.ComputeScores(scores)
+        self.assertEqual(len(decibel), len(stream_state.decibel))
+        for x, y in zip(decibel, stream_state.decibel):
+            self.assertAlmostEqual(x, y, places=3)
+        self.assertEqual(speech_frames, stream_state.speech_frames)
+
+    def test_bounded_buffers(self):
+        model = build_vad_model()
+        stream_state = model.NewStreamState()
+        max_capacity = 0
+        with torch.no_grad():
+            for feats, waveform, is_final in synthetic_chunks(600):
+                if is_final:
+                    break
+                scores = model.encoder(feats, stream_state.in_cache)
+                model.DetectStream(stream_state, scores, waveform, is_final)
+                max_capacity = max(max_capacity, stream_state.data_buf.buffer.shape[0])
+                self.assertLessEqual(len(stream_state.output_data_buf), 1)
+                self.assertEqual(len(stream_state.decibel), feats.shape[1])
+        # bursts are 3s long, the kept samples never reach the stream length
+        self.assertLess(max_capacity, 30 * 16000)
+
+
+if __name__ == '__main__':
+    unittest.main()
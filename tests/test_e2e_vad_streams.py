@@ -0,0 +1,68 @@
+import unittest
+
+import torch
+
+from funasr.models.e2e_vad import E2EVadModel
+from funasr.models.encoder.fsmn_encoder import FSMN
+
+
+def build_vad_model():
+    torch.manual_seed(0)
+    encoder = FSMN(input_dim=400, input_affine_dim=140, fsmn_layers=4, linear_dim=250, proj_dim=128,
+                   lorder=20, rorder=0, lstride=1, rstride=0, output_affine_dim=140, output_dim=248)
+    return E2EVadModel(encoder, dict(sample_rate=16000, max_end_silence_time=800)).eval()
+
+
+def stream_chunks(seconds, seed, chunk_frames=600):
+    # bursts of loud noise separated by quiet gaps, 10 ms frames with 400 dim lfr features
+    generator = torch.Generator().manual_seed(seed)
+    num_frames = seconds * 100
+    waveform = torch.randn(num_frames * 160 + 240, generator=generator) * 0.01
+    for start in range(seed * 100, num_frames, 500):
+        waveform[start * 160:(start + 300) * 160] *= 100
+    feats = torch.randn(1, num_frames, 400, generator=generator)
+    chunks = []
+    for t_offset in range(0, num_frames, chunk_frames):
+        step = min(chunk_frames, num_frames - t_offset)
+        chunks.append((feats[:, t_offset:t_offset + step, :],
+                       waveform[None, t_offset * 160:(t_offset + step - 1) * 160 + 400],
+                       t_offset + step >= num_frames))
+    return chunks
+
+
+def forward_segments(model, chunks):
+    segments = []
+    in_cache = dict()
+    for feats, waveform, is_final in chunks:
+        segments_part, in_cache = model(feats, waveform, in_cache, is_final)
+        if segments_part:
+            segments += segments_part[0]
+    return segments
+
+
+class TestE2EVadStreams(unittest.TestCase):
+    def test_same_as_forward(self):
+        model = build_vad_model()
+        # the third stream starts two chunks after the others, with an empty encoder cache
+        streams = [stream_chunks(30, 1), stream_chunks(30, 2), stream_chunks(18, 3)]
+        offsets = [0, 0, 2]
+        with torch.no_grad():
+            expected = [forward_segments(model, chunks) for chunks in streams]
+
+            stream_states = [model.NewStreamState() for _ in streams]
+            results = [[] for _ in streams]
+            for i in range(len(streams[0])):
+                active = [n for n in range(len(streams)) if 0 <= i - offsets[n] < len(streams[n])]
+                chunks = [streams[n][i - offsets[n]] for n in active]
+                segments = model.forward_streams(torch.cat([chunk[0] for chunk in chunks]),
+                                                 [chunk[1] for chunk in chunks],
+                                                 [stream_states[n] for n in active],
+                                                 [chunk[2] for chunk in chunks])
+                for n, segments_part in zip(active, segments):
+                    results[n] += segments_part
+        self.assertTrue(all(len(segments) > 0 for segments in expected))
+        self.assertEqual(expected, results)
+
+
+if __name__ == '__main__':
+    unittest.main()
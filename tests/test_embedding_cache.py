@@ -0,0 +1,71 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from funasr.utils.embedding_cache import EmbeddingCache, audio_hash
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_memory_lru(self):
+        cache = EmbeddingCache("model", max_memory_items=2)
+        for i in range(3):
+            cache.put(str(i), np.full(4, i, dtype=np.float32))
+        self.assertIsNone(cache.get("0"))
+        self.assertTrue(np.array_equal(cache.get("2"), np.full(4, 2, dtype=np.float32)))
+        stats = cache.stats()
+        self.assertEqual((stats["hits_memory"], stats["misses"]), (1, 1))
+
+    def test_disk(self):
+        speech = [np.random.randn(16000).astype(np.float32) for _ in range(5)]
+        embeddings = np.random.randn(5, 8).astype(np.float32)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = EmbeddingCache("model", cache_dir, max_memory_items=0)
+            for x, embedding in zip(speech, embeddings):
+                cache.put(audio_hash(x), embedding)
+            self.assertTrue(np.array_equal(cache.get(audio_hash(speech[4])), embeddings[4]))
+
+            # a new process finds the embeddings of the same model only
+            cache = EmbeddingCache("model", cache_dir, max_memory_items=10)
+            for x, embedding in zip(speech, embeddings):
+                self.assertTrue(np.array_equal(cache.get(audio_hash(x)), embedding))
+            self.assertEqual(cache.stats()["hits_disk"], 5)
+            self.assertIsNone(EmbeddingCache("other_model", cache_dir).get(audio_hash(speech[0])))
+
+    def test_interrupted_append(self):
+        embeddings = np.random.randn(4, 8).astype(np.float32)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = EmbeddingCache("model", cache_dir, max_memory_items=0)
+            for i in range(2):
+                cache.put(str(i), embeddings[i])
+            # a process dies after writing a row and part of the next one, before indexing them
+            with open(cache.matrix_path, "ab") as f:
+                f.write(embeddings[3].tobytes() + b"\x00\x01")
+            with open(cache.index_path, "a") as f:
+                f.write("3 ")
+
+            cache = EmbeddingCache("model", cache_dir, max_memory_items=0)
+            self.assertEqual(cache.stats()["disk_items"], 2)
+            self.assertIsNone(cache.get("3"))
+            cache.put("2", embeddings[2])
+            cache = EmbeddingCache("model", cache_dir, max_memory_items=0)
+            for i in range(3):
+                self.assertTrue(np.array_equal(cache.get(str(i)), embeddings[i]))
+
+    def test_invalid_index(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = EmbeddingCache("model", cache_dir)
+            # an index without the dim header is rebuilt
+            with open(cache.index_path, "w") as f:
+                f.write("0\n1\n")
+            with open(cache.matrix_path, "wb") as f:
+                f.write(np.zeros(16, dtype=np.float32).tobytes())
+            cache = EmbeddingCache("model", cache_dir, max_memory_items=0)
+            self.assertIsNone(cache.get("0"))
+            cache.put("0", np.ones(4, dtype=np.float32))
+            cache = EmbeddingCache("model", cache_dir, max_memory_items=0)
+            self.assertTrue(np.array_equal(cache.get("0"), np.ones(4, dtype=np.float32)))
+
+
+if __name__ == '__main__':
+    unittest.main()
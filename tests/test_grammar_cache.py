@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from fun_text_processing.text_normalization.grammar_cache import GrammarCache
+
+
+class FakeGrammars:
+    def __init__(self):
+        self.num_builds = 0
+
+    def __call__(self, cache_dir, overwrite_cache):
+        far_file = os.path.join(cache_dir, "_zh_itn.far")
+        if overwrite_cache or not os.path.exists(far_file):
+            self.num_builds += 1
+            with open(far_file, "w") as f:
+                f.write("tokenize_and_classify")
+        with open(far_file) as f:
+            return f.read()
+
+
+class TestGrammarCache(unittest.TestCase):
+    def test_warm_start(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            build_fn = FakeGrammars()
+            cache = GrammarCache("inverse_text_normalization", "zh", cache_dir=cache_dir)
+            self.assertFalse(cache.is_valid())
+            self.assertEqual(cache.load_or_build(build_fn), "tokenize_and_classify")
+            self.assertTrue(cache.is_valid())
+            self.assertEqual(cache.load_or_build(build_fn), "tokenize_and_classify")
+            self.assertEqual(build_fn.num_builds, 1)
+            # no temporary dirs are left behind
+            self.assertEqual(os.listdir(cache_dir), [os.path.basename(cache.path)])
+
+    def test_key(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            kind = "inverse_text_normalization"
+            paths = {
+                GrammarCache(kind, "ja", {"enable_0_to_9": True}, cache_dir).path,
+                GrammarCache(kind, "ja", {"enable_0_to_9": False}, cache_dir).path,
+                GrammarCache(kind, "zh", {"enable_0_to_9": True}, cache_dir).path,
+            }
+            self.assertEqual(len(paths), 3)
+            self.assertIn(GrammarCache(kind, "ja", {"enable_0_to_9": True}, cache_dir).path, paths)
+
+    def test_corrupted_cache_is_rebuilt(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            build_fn = FakeGrammars()
+            cache = GrammarCache("inverse_text_normalization", "zh", cache_dir=cache_dir)
+            cache.load_or_build(build_fn)
+            with open(os.path.join(cache.path, "_zh_itn.far"), "w") as f:
+                f.write("truncated")
+            self.assertFalse(cache.is_valid())
+            self.assertEqual(cache.load_or_build(build_fn), "tokenize_and_classify")
+            self.assertEqual(build_fn.num_builds, 2)
+            self.assertTrue(cache.is_valid())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+import torch
+
+from funasr.modules.nets_utils import pad_list
+from funasr.utils.hotword_set import HotwordSet
+
+
+class BiasModel(torch.nn.Module):
+    def __init__(self, vocab_size=100, dim=16):
+        super().__init__()
+        self.sos = vocab_size - 1
+        self.bias_encoder = torch.nn.LSTM(dim, dim, 1, batch_first=True, dropout=0)
+        self.bias_embed = torch.nn.Embedding(vocab_size, dim)
+
+
+def tokenize(hotword):
+    return [ord(c) % 90 for c in hotword]
+
+
+def reference_embeddings(model, hw_list):
+    # the packed LSTM of ContextualParaformer.cal_decoder_with_predictor
+    hw_lengths = [len(i) for i in hw_list]
+    hw_list_pad = pad_list([torch.Tensor(i).long() for i in hw_list], 0)
+    hw_embed = model.bias_embed(hw_list_pad)
+    hw_embed = torch.nn.utils.rnn.pack_padded_sequence(hw_embed, hw_lengths, batch_first=True,
+                                                       enforce_sorted=False)
+    _, (h_n, _) = model.bias_encoder(hw_embed)
+    return h_n.squeeze(0)
+
+
+class TestHotwordSet(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = BiasModel().eval()
+
+    def assert_matches_reference(self, hotword_set):
+        with torch.no_grad():
+            expected = reference_embeddings(self.model, hotword_set.token_ids())
+        self.assertTrue(torch.allclose(hotword_set.embeddings(), expected, atol=1e-5))
+
+    def test_embeddings(self):
+        hotword_set = HotwordSet(self.model, tokenize)
+        self.assert_matches_reference(hotword_set)
+        hotword_set.update(["abc", "abd", "ab", "xyz", "b"])
+        self.assertEqual(hotword_set.token_ids()[-1], [self.model.sos])
+        self.assert_matches_reference(hotword_set)
+        contextual_info = hotword_set.contextual_info(3)
+        self.assertEqual(contextual_info.shape, (3, 6, 16))
+
+    def test_incremental_update(self):
+        hotword_set = HotwordSet(self.model, tokenize)
+        hotword_set.update(["abc", "abd", "xyz"])
+        hotword_set.embeddings()
+        hotword_set.remove(["abc", "xyz"])
+        hotword_set.add(["abce", "xy"])
+        self.assertEqual(list(hotword_set.hotwords.keys()), ["abd", "abce", "xy"])
+        self.assert_matches_reference(hotword_set)
+        hotword_set.update(["xy", "q"])
+        self.assertEqual(list(hotword_set.hotwords.keys()), ["xy", "q"])
+        self.assert_matches_reference(hotword_set)
+        self.assertEqual(sorted(hotword_set.root.children.keys()), sorted([tokenize("x")[0], tokenize("q")[0],
+                                                                           self.model.sos]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import importlib.util
+import random
+import unittest
+
+
+@unittest.skipUnless(importlib.util.find_spec("pynini"), "pynini is required")
+class TestMemoizedInverseNormalization(unittest.TestCase):
+    sentences = [
+        "it is twelve thirty now",
+        "hello world",
+        "hello, world",
+        "i paid twenty dollars on january first twenty twenty",
+        "call me at two three four five",
+        "hello world",
+        "it is twelve thirty now",
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        from fun_text_processing.inverse_text_normalization.inverse_normalize import InverseNormalizer
+
+        cls.normalizer = InverseNormalizer(lang="en")
+
+    def test_memo_matches_full_normalization(self):
+        expected = [self.normalizer.normalize(text) for text in self.sentences]
+        self.normalizer.init_memo(1000)
+        try:
+            self.assertEqual([self.normalizer.normalize(text) for text in self.sentences], expected)
+            self.assertGreater(self.normalizer.memo_hits, 0)
+        finally:
+            self.normalizer.init_memo(0)
+
+    def test_semiotic_spans_of_plain_words(self):
+        # whitelist and electronic spans made of words which are plain on their own
+        sentences = ["for", "example", "for example", "a t m", "a", "write to abc at gmail dot com", "gmail dot com"]
+        expected = [self.normalizer.normalize(text) for text in sentences]
+        self.normalizer.init_memo(1000)
+        try:
+            self.assertEqual([self.normalizer.normalize(text) for text in sentences], expected)
+        finally:
+            self.normalizer.init_memo(0)
+
+    def test_may_join(self):
+        self.assertFalse(self.normalizer._may_join("hello", " ", "world"))
+        self.assertFalse(self.normalizer._may_join("the", " ", "meeting"))
+        self.assertTrue(self.normalizer._may_join("twenty", " ", "dollars"))
+        self.assertTrue(self.normalizer._may_join("for", " ", "example"))
+        self.assertTrue(self.normalizer._may_join("gmail", " ", "dot"))
+        self.assertTrue(self.normalizer._may_join("a", " ", "t"))
+
+    def test_spans_of_new_sentences(self):
+        # sentences which are not repeated verbatim reuse the tagged spans of the previous ones
+        words = ("we will meet on january first at twelve thirty and it costs twenty dollars "
+                 "please write to abc at gmail dot com for example hello world").split()
+        rng = random.Random(0)
+        sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 12))) for _ in range(100)]
+        expected = [self.normalizer.normalize(text) for text in sentences]
+        self.normalizer.init_memo(10000)
+        try:
+            self.assertEqual([self.normalizer.normalize(text) for text in sentences], expected)
+            self.assertGreater(self.normalizer.memo_hits, self.normalizer.memo_misses)
+        finally:
+            self.normalizer.init_memo(0)
+
+    def test_memo_is_bounded(self):
+        self.normalizer.init_memo(4)
+        try:
+            for text in self.sentences:
+                self.normalizer.normalize(text)
+            self.assertLessEqual(len(self.normalizer._memo), 4)
+        finally:
+            self.normalizer.init_memo(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
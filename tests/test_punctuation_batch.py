@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+import torch
+
+from funasr.bin.punctuation_infer import Text2Punc
+
+
+class WordPreprocessor:
+    def __init__(self, vocab_size=1000):
+        self.vocab_size = vocab_size
+
+    def __call__(self, data, uid):
+        words = data["text"].split() if isinstance(data["text"], str) else data["text"]
+        data["split_text"] = list(words)
+        data["text"] = np.array([sum(map(ord, word)) % (self.vocab_size - 1) + 1 for word in words], dtype="int32")
+        return data
+
+    @staticmethod
+    def pop_split_text_data(data):
+        return data.pop("split_text")
+
+
+class ContextPuncModel(torch.nn.Module):
+    """Punctuation of each word from the word and its previous one, garbage on the padding"""
+
+    def __init__(self, num_punc):
+        super().__init__()
+        self.num_punc = num_punc
+
+    def forward(self, text, text_lengths):
+        text = text.long()
+        prev = torch.nn.functional.pad(text[:, :-1], (1, 0))
+        punc = (text * 7 + prev * 3) % self.num_punc
+        pad = torch.arange(text.shape[1])[None, :] >= text_lengths[:, None]
+        punc = punc.masked_fill(pad, 0)
+        y = torch.nn.functional.one_hot(punc, self.num_punc).float()
+        return y.masked_fill(pad[:, :, None], 1e4), None
+
+
+def build_text2punc():
+    text2punc = Text2Punc.__new__(Text2Punc)
+    text2punc.device = "cpu"
+    text2punc.punc_list = ["<unk>", "_", "，", "。", "？", "、", "_", "_"]
+    text2punc.period = 3
+    text2punc.wrapped_model = ContextPuncModel(len(text2punc.punc_list))
+    text2punc.preprocessor = WordPreprocessor()
+    return text2punc
+
+
+class TestPunctuationBatch(unittest.TestCase):
+    def test_batch_same_as_one_by_one(self):
+        rng = np.random.RandomState(0)
+        texts = []
+        for num_words in [1, 5, 19, 20, 21, 57, 130, 260]:
+            texts.append(" ".join("w{}".format(rng.randint(0, 500)) for _ in range(num_words)))
+        # words as a list
+        texts.append(["词{}".format(rng.randint(0, 500)) for _ in range(45)])
+        text2punc = build_text2punc()
+        expected = [text2punc(text) for text in texts]
+        self.assertEqual(text2punc.punctuate_batch(texts), expected)
+        self.assertEqual(text2punc.punctuate_batch(texts[::-1]), expected[::-1])
+        self.assertEqual(text2punc.punctuate_batch([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import types
+import unittest
+
+import numpy as np
+import torch
+
+from funasr.bin.punctuation_infer import PuncStreamingSession, Text2Punc
+from funasr.punctuation.vad_realtime_transformer import VadRealtimeTransformer
+
+
+class WordPreprocessor:
+    def __call__(self, data, uid):
+        words = data["text"].split() if isinstance(data["text"], str) else data["text"]
+        data["split_text"] = list(words)
+        data["text"] = np.array([int(word[1:]) for word in words], dtype="int32")
+        return data
+
+    @staticmethod
+    def pop_split_text_data(data):
+        return data.pop("split_text")
+
+
+def build_model(seed=0):
+    torch.manual_seed(seed)
+    model = VadRealtimeTransformer(vocab_size=100, punc_size=6, pos_enc="sinusoidal", embed_unit=16, att_unit=32,
+                                   head=2, unit=64, layer=3, dropout_rate=0.0, kernel_size=5)
+    return model.eval()
+
+
+class TestIncrementalEncoder(unittest.TestCase):
+    def test_same_as_forward(self):
+        model = build_model()
+        tokens = torch.randint(1, 100, (1, 40))
+        with torch.no_grad():
+            expected, _ = model(tokens, torch.tensor([40]), torch.tensor([0]))
+            cache, num_fed = None, 0
+            for chunk_size in [1, 3, 0, 7, 2, 11, 16]:
+                y, cache = model.forward_incremental(tokens[:, num_fed:num_fed + chunk_size], cache,
+                                                     is_final=num_fed + chunk_size >= 40)
+                num_fed += chunk_size
+                # the causal layers have encoded all tokens but their look-ahead
+                self.assertEqual(y.shape[1], max(min(num_fed, 40) - 2 * 2, 0) if num_fed < 40 else 40)
+        self.assertTrue(torch.allclose(y, expected, atol=1e-5))
+
+
+def build_session(max_context=200):
+    text2punc = Text2Punc.__new__(Text2Punc)
+    text2punc.device = "cpu"
+    text2punc.punc_list = ["_", "_", "，", "。", "？", "、"]
+    text2punc.period = 3
+    text2punc.wrapped_model = types.SimpleNamespace(module=types.SimpleNamespace(punc_model=build_model()))
+    text2punc.preprocessor = WordPreprocessor()
+    return PuncStreamingSession(text2punc, max_context=max_context)
+
+
+class TestPuncStreamingSession(unittest.TestCase):
+    def test_stream(self):
+        session = build_session(max_context=30)
+        self.assertEqual(session.look_ahead, 6)
+        rng = np.random.RandomState(0)
+        words = ["w{}".format(x) for x in rng.randint(1, 100, 500)]
+        texts, punctuations = [], []
+        for beg in range(0, len(words), 4):
+            text, punc_ids = session.feed(words[beg:beg + 4])
+            texts.append(text)
+            punctuations += punc_ids
+            # the context is bounded whatever the length of the text
+            self.assertLessEqual(len(session.ids), 30 + session.look_ahead + 4)
+        text, punc_ids = session.finish()
+        texts.append(text)
+        punctuations += punc_ids
+        self.assertEqual(len(punctuations), len(words))
+        self.assertTrue(texts[-1].endswith("。"))
+        self.assertEqual("".join(texts).replace("，", " ").replace("。", " ").replace("？", " ").replace("、", " ")
+                         .split(), words)
+        self.assertEqual(len(session.latencies), 125)
+
+
+if __name__ == "__main__":
+    unittest.main()
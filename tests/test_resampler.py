@@ -0,0 +1,31 @@
+import unittest
+
+import torch
+import torchaudio
+
+from funasr.utils import wav_utils
+from funasr.utils.wav_utils import get_resampler, torch_resample
+
+
+class TestResamplerCache(unittest.TestCase):
+    def test_matches_fresh_resampler(self):
+        torch.manual_seed(0)
+        audio = torch.randn(1, 8000 * 3)
+        expected = torchaudio.transforms.Resample(orig_freq=8000, new_freq=16000)(audio)
+        self.assertTrue(torch.allclose(torch_resample(audio, 8000, 16000), expected))
+        self.assertTrue(torch.allclose(torch_resample(audio, 8000, 16000), expected))
+        self.assertIs(torch_resample(audio, 16000, 16000), audio)
+        audio64 = audio.double()
+        self.assertEqual(torch_resample(audio64, 8000, 16000).dtype, torch.float64)
+
+    def test_registry(self):
+        self.assertIs(get_resampler(8000, 16000), get_resampler(8000, 16000))
+        self.assertIsNot(get_resampler(8000, 16000), get_resampler(8000, 16000, torch.float64))
+        for fs in range(wav_utils.MAX_RESAMPLERS + 4):
+            # rates with a large gcd keep the resampling kernels small
+            get_resampler(8000 + 1000 * fs, 16000)
+        self.assertEqual(len(wav_utils._resamplers), wav_utils.MAX_RESAMPLERS)
+
+
+if __name__ == "__main__":
+    unittest.main()
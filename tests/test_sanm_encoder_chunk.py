@@ -0,0 +1,40 @@
+import unittest
+
+import torch
+
+from funasr.models.encoder.sanm_encoder import SANMEncoderChunkOpt
+from funasr.modules.embedding import SinusoidalPositionEncoder
+
+
+class TestSANMEncoderChunkOpt(unittest.TestCase):
+    def _check_streaming(self, num_frames, chunk_sizes, input_size=40, input_layer="pe", **kwargs):
+        torch.manual_seed(0)
+        encoder = SANMEncoderChunkOpt(input_size=input_size, output_size=32, attention_heads=4, linear_units=64,
+                                      num_blocks=3, input_layer=input_layer, **kwargs).eval()
+        xs = torch.randn(2, num_frames, input_size)
+        with torch.no_grad():
+            expected, expected_lens, _ = encoder(xs.clone(), torch.tensor([num_frames, num_frames]))
+            outs, cache, offset = [], None, 0
+            for i, size in enumerate(chunk_sizes):
+                is_final = i == len(chunk_sizes) - 1
+                encoder_out, cache = encoder.forward_chunk(xs[:, offset:offset + size], cache, is_final)
+                outs.append(encoder_out)
+                offset += size
+        outs = torch.cat(outs, dim=1)
+        self.assertEqual(outs.shape[1], expected_lens[0].item())
+        self.assertTrue(torch.allclose(outs, expected[:, :outs.shape[1]], atol=1e-4))
+
+    def test_forward_chunk(self):
+        self._check_streaming(95, [10] * 9 + [5], chunk_size=(16,), stride=(10,))
+        self._check_streaming(95, [3, 40, 1, 51], chunk_size=(16,), stride=(10,), pad_left=(2,),
+                              encoder_att_look_back_factor=(2,))
+        self._check_streaming(64, [30, 30, 4], chunk_size=(12,), stride=(8,), sanm_shfit=2)
+
+    def test_forward_chunk_linear(self):
+        # the first encoder layer takes input_size, so the linear embedding keeps the size
+        self._check_streaming(95, [7, 33, 55], input_size=32, input_layer="linear", chunk_size=(16,), stride=(10,),
+                              pos_enc_class=lambda size, dropout_rate: SinusoidalPositionEncoder())
+
+
+if __name__ == '__main__':
+    unittest.main()
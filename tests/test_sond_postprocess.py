@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+import torch
+from scipy.ndimage import median_filter
+
+from funasr.bin.sond_inference import Speech2Diarization
+
+
+def reference_post_processing(logits_idx, token_list, spk_num, smooth_size, dur_threshold):
+    """The frame-by-frame post-processing which the vectorized one replaces"""
+    pse_labels = [token_list[x] for x in np.repeat(logits_idx, 8).tolist()]
+    multi_labels = np.row_stack([
+        (np.array(list(("{:0" + str(spk_num) + "b}").format(int(x)))[::-1]) == "1").astype(int) for x in pse_labels
+    ])[:, :spk_num]
+    multi_labels = median_filter(multi_labels, (smooth_size, 1), mode="constant", cval=0.0).astype(int)
+    results = {}
+    for k in range(spk_num):
+        spk, in_utt, start = "spk{}".format(k + 1), False, 0
+        for i in range(multi_labels.shape[0]):
+            if multi_labels[i, k] == 1 and in_utt is False:
+                start, in_utt = i, True
+            if multi_labels[i, k] == 0 and in_utt is True:
+                results.setdefault(spk, []).append((start, i))
+                in_utt = False
+        if in_utt:
+            results.setdefault(spk, []).append((start, multi_labels.shape[0]))
+    results = {spk: [(st, ed) for st, ed in turns if ed - st > dur_threshold] for spk, turns in results.items()}
+    return results, pse_labels
+
+
+def build_speech2diar(token_list, smooth_size=83, dur_threshold=10):
+    speech2diar = Speech2Diarization.__new__(Speech2Diarization)
+    speech2diar.diar_model = torch.nn.Module()
+    speech2diar.diar_model.encoder = torch.nn.Module()
+    speech2diar.diar_model.encoder.time_ds_ratio = 8
+    speech2diar.token_list = token_list
+    speech2diar.smooth_size = smooth_size
+    speech2diar.dur_threshold = dur_threshold
+    return speech2diar
+
+
+def random_logits(num_frames, vocab_size, seed=0):
+    rng = np.random.RandomState(seed)
+    # runs of the same token, as the model outputs
+    run_tokens = rng.randint(0, vocab_size, num_frames // 20 + 1)
+    logits_idx = np.repeat(run_tokens, rng.randint(1, 40, len(run_tokens)))[:num_frames]
+    return logits_idx, torch.nn.functional.one_hot(torch.tensor(logits_idx)[None], vocab_size).float()
+
+
+class TestDiarizationPostProcessing(unittest.TestCase):
+    def test_same_as_reference(self):
+        for spk_num, vocab_size, smooth_size in [(4, 16, 83), (3, 8, 1), (4, 11, 20)]:
+            token_list = [str(i) for i in range(vocab_size)]
+            logits_idx, logits = random_logits(5000, vocab_size, seed=spk_num)
+            speech2diar = build_speech2diar(token_list, smooth_size=smooth_size)
+            results, pse_labels = speech2diar.post_processing(logits, spk_num)
+            expected, expected_labels = reference_post_processing(
+                logits_idx, token_list, spk_num, smooth_size, speech2diar.dur_threshold)
+            self.assertEqual(dict(results), expected)
+            self.assertEqual(pse_labels, expected_labels)
+
+    def test_padding_speakers(self):
+        # tokens of 2 speakers with profiles of 4 speakers
+        seq = ["0", "1", "2", "3"]
+        arr = Speech2Diarization.seq2arr(seq, 4)
+        self.assertEqual(arr.tolist(), [[0, 0, 0, 0], [1, 0, 0, 0], [0, 1, 0, 0], [1, 1, 0, 0]])
+        self.assertEqual(Speech2Diarization.seq2arr(["5"], 2)[:, :2].tolist(), [[1, 0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
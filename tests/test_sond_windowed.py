@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+import torch
+
+from funasr.bin.sond_inference import Speech2Diarization
+
+
+class FrameLocalDiarModel(torch.nn.Module):
+    """Labels each output frame by the code in the first input dim, like a model without context."""
+
+    def __init__(self, vocab_size):
+        super().__init__()
+        self.vocab_size = vocab_size
+        self.frontend = None
+        self.encoder = torch.nn.Module()
+        self.encoder.time_ds_ratio = 8
+        self.max_frames = 0
+
+    def prediction_forward(self, speech, speech_lengths, profile, profile_lengths):
+        self.max_frames = max(self.max_frames, speech.shape[1])
+        codes = speech[:, ::self.encoder.time_ds_ratio, 0].long()
+        return torch.nn.functional.one_hot(codes, self.vocab_size).float()
+
+
+def build_speech2diar(spk_num, window_size=0, window_shift=0, smooth_size=83, dur_threshold=10):
+    speech2diar = Speech2Diarization.__new__(Speech2Diarization)
+    speech2diar.diar_model = FrameLocalDiarModel(2 ** spk_num)
+    speech2diar.token_list = [str(i) for i in range(2 ** spk_num)]
+    speech2diar.smooth_size = smooth_size
+    speech2diar.dur_threshold = dur_threshold
+    speech2diar.device = "cpu"
+    speech2diar.dtype = "float32"
+    speech2diar.window_size = window_size
+    speech2diar.window_shift = window_shift
+    return speech2diar
+
+
+def random_meeting(num_frames, spk_num, seed=0):
+    rng = np.random.RandomState(seed)
+    codes = np.zeros(num_frames, dtype=np.float32)
+    beg = 0
+    while beg < num_frames:
+        # turns of 0.1s to 10s with overlapped speakers
+        dur = rng.randint(10, 1000)
+        codes[beg: beg + dur] = rng.randint(0, 2 ** spk_num)
+        beg += dur
+    return codes[:, None]
+
+
+class TestSlidingWindowDiarization(unittest.TestCase):
+    def test_windows_match_whole_recording(self):
+        spk_num = 4
+        profile = np.zeros((spk_num, 256), dtype=np.float32)
+        for num_frames, smooth_size in [(20000, 83), (12345, 84), (3001, 1)]:
+            speech = random_meeting(num_frames, spk_num)
+            expected, expected_labels = build_speech2diar(spk_num, smooth_size=smooth_size)(speech, profile)
+            for window_size, window_shift in [(1600, 1200), (800, 400), (1024, 1016)]:
+                speech2diar = build_speech2diar(spk_num, window_size, window_shift, smooth_size=smooth_size)
+                results, pse_labels = speech2diar(speech, profile)
+                self.assertEqual(results, expected)
+                self.assertEqual(list(results.keys()), list(expected.keys()))
+                self.assertEqual(pse_labels, expected_labels)
+                self.assertLessEqual(speech2diar.diar_model.max_frames, window_size)
+
+    def test_turns_are_streamed(self):
+        spk_num = 2
+        profile = np.zeros((spk_num, 256), dtype=np.float32)
+        speech = np.zeros((5000, 1), dtype=np.float32)
+        speech[1000:2000] = 1
+        speech[3000:3496] = 3
+        speech2diar = build_speech2diar(spk_num, window_size=1600, window_shift=1200)
+        turns = [t for window_turns, _ in speech2diar.diarize_windows(speech, profile) for t in window_turns]
+        self.assertEqual(turns, [["spk1", 1000, 1000], ["spk1", 3000, 496], ["spk2", 3000, 496]])
+        # the first turn is finished before the whole recording is decoded
+        first_turns, _ = next(iter(speech2diar.diarize_windows(speech, profile)))
+        self.assertEqual(first_turns, [])
+        windows = speech2diar.diarize_windows(speech, profile)
+        next(windows)
+        self.assertEqual(next(windows)[0], [["spk1", 1000, 1000]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from funasr.utils.speaker_index import SpeakerIndex, l2_normalize
+
+
+def random_speakers(num_speakers, dim=256, seed=0):
+    rng = np.random.RandomState(seed)
+    keys = ["spk{}".format(i) for i in range(num_speakers)]
+    return keys, rng.randn(num_speakers, dim).astype(np.float32)
+
+
+class TestSpeakerIndex(unittest.TestCase):
+    def test_exact_search(self):
+        keys, embeddings = random_speakers(5000)
+        queries = embeddings[[3, 1234, 4999]] + np.random.RandomState(1).randn(3, 256).astype(np.float32) * 0.1
+        with tempfile.TemporaryDirectory() as index_dir:
+            SpeakerIndex.write(keys, embeddings, index_dir)
+            index = SpeakerIndex(index_dir)
+            scores, top_keys = index.search(queries, top_k=4, block_size=1000)
+        expected = l2_normalize(queries) @ l2_normalize(embeddings).T
+        expected_order = np.argsort(-expected, axis=1)[:, :4]
+        self.assertEqual(top_keys, [[keys[i] for i in row] for row in expected_order])
+        self.assertTrue(np.allclose(scores, np.take_along_axis(expected, expected_order, axis=1), atol=1e-5))
+
+    def test_partitioned_search(self):
+        keys, embeddings = random_speakers(5000)
+        queries = embeddings[:20] + np.random.RandomState(1).randn(20, 256).astype(np.float32) * 0.1
+        with tempfile.TemporaryDirectory() as index_dir:
+            SpeakerIndex.write(keys, embeddings, index_dir, num_partitions=16)
+            index = SpeakerIndex(index_dir)
+            exact_scores, exact_keys = index.search(queries, top_k=3)
+            # probing all partitions is exact
+            scores, top_keys = index.search(queries, top_k=3, num_probe=16)
+            self.assertEqual(top_keys, exact_keys)
+            self.assertTrue(np.allclose(scores, exact_scores, atol=1e-5))
+            # the enrolled speaker of each query is found in the closest partitions
+            _, top_keys = index.search(queries, top_k=1, num_probe=4)
+            self.assertEqual([row[0] for row in top_keys], keys[:20])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+
+import torch
+
+from funasr.models.pooling.statistic_pooling import StatisticPooling
+
+
+class TestStatisticPooling(unittest.TestCase):
+    def test_padded_batch(self):
+        torch.manual_seed(0)
+        pooling = StatisticPooling(pooling_dim=(2, 3))
+        lengths = torch.tensor([50, 37, 12])
+        xs_pad = torch.randn(3, 8, 50, 10)
+        outputs = pooling(xs_pad, lengths)
+        for i in range(3):
+            expected = pooling(xs_pad[i:i + 1, :, :lengths[i]])
+            self.assertTrue(torch.allclose(outputs[i:i + 1], expected, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import queue
+import socket
+import time
+import unittest
+
+import torch
+import torch.multiprocessing as mp
+
+from funasr.torch_utils.device_funcs import force_gatherable
+from funasr.train.distributed_utils import DistributedOption
+from funasr.train.reporter import Reporter
+from funasr.train.trainer import Trainer, TrainerOptions
+
+
+class ToyModel(torch.nn.Module):
+    def __init__(self, dim=256, batch_norm=False):
+        super().__init__()
+        self.layers = torch.nn.Sequential(
+            torch.nn.Linear(dim, 1024), torch.nn.ReLU(), torch.nn.Linear(1024, 1024), torch.nn.ReLU(),
+            torch.nn.Linear(1024, dim),
+        )
+        if batch_norm:
+            # DistributedDataParallel broadcasts the buffers in the forward
+            self.layers.append(torch.nn.BatchNorm1d(dim))
+
+    def forward(self, x, y):
+        loss = torch.nn.functional.mse_loss(self.layers(x), y)
+        return force_gatherable((loss, dict(loss=loss.detach()), x.shape[0]), loss.device)
+
+
+def build_options(accum_grad, accum_grad_no_sync):
+    return TrainerOptions(
+        ngpu=0, resume=False, use_amp=False, train_dtype="float32", grad_noise=False, accum_grad=accum_grad,
+        accum_grad_no_sync=accum_grad_no_sync, grad_clip=5.0, grad_clip_type=2.0, log_interval=8,
+        no_forward_run=False, use_tensorboard=False, use_wandb=False, output_dir="exp", max_epoch=1,
+        max_update=10 ** 9, seed=0, sharded_ddp=False, patience=None, keep_nbest_models=1,
+        nbest_averaging_interval=0, async_checkpoint=False, keep_recent_checkpoints=0, early_stopping_criterion=[], best_model_criterion=[],
+        val_scheduler_criterion=[], unused_parameters=False, wandb_model_log_interval=-1, use_pai=False,
+        oss_bucket=None,
+    )
+
+
+def train_worker(rank, world_size, port, accum_grad, accum_grad_no_sync, num_iters, batch_norm, results):
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    torch.distributed.init_process_group("gloo", rank=rank, world_size=world_size)
+    torch.set_num_threads(1)
+    torch.manual_seed(0)
+    model = torch.nn.parallel.DistributedDataParallel(ToyModel(batch_norm=batch_norm))
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01)
+    generator = torch.Generator().manual_seed(rank)
+    iterator = [
+        (["utt{}".format(i)], dict(x=torch.randn(8, 256, generator=generator),
+                                   y=torch.randn(8, 256, generator=generator)))
+        for i in range(num_iters[rank])
+    ]
+    reporter = Reporter()
+    with reporter.observe("train", 1) as sub_reporter:
+        tic = time.perf_counter()
+        Trainer.train_one_epoch(
+            model=model, iterator=iterator, optimizers=[optimizer], schedulers=[None], scaler=None,
+            reporter=sub_reporter, summary_writer=None, options=build_options(accum_grad, accum_grad_no_sync),
+            distributed_option=DistributedOption(distributed=True, dist_backend="gloo"),
+        )
+        elapsed = time.perf_counter() - tic
+    # the epoch summary, the iteration stats of a worker stopped by the others are uneven
+    message = reporter.log_message()
+    # plain data, the tensors shared with the parent are gone once the worker exits
+    results.put((rank, elapsed, [p.detach().numpy().tolist() for p in model.module.parameters()], message))
+    torch.distributed.barrier()
+    torch.distributed.destroy_process_group()
+
+
+def run(accum_grad, accum_grad_no_sync, world_size=2, num_iters=(64, 64), batch_norm=False, timeout=300):
+    """Trains one epoch in world_size workers and returns their (elapsed, parameters, log message) by rank."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    context = mp.spawn(
+        train_worker,
+        args=(world_size, port, accum_grad, accum_grad_no_sync, list(num_iters), batch_norm, results),
+        nprocs=world_size,
+        join=False,
+    )
+    # drain the results before joining, a worker exits only once its result is read
+    deadline = time.perf_counter() + timeout
+    outputs = {}
+    while len(outputs) < world_size:
+        try:
+            rank, elapsed, params, message = results.get(timeout=1)
+        except queue.Empty:
+            # raises the error of a failed worker
+            context.join(timeout=0)
+            if time.perf_counter() > deadline:
+                for process in context.processes:
+                    process.terminate()
+                raise AssertionError("the workers didn't finish in {}s".format(timeout))
+            continue
+        outputs[rank] = (elapsed, [torch.tensor(p) for p in params], message)
+    while not context.join():
+        pass
+    return [outputs[rank] for rank in range(world_size)]
+
+
+class TestAccumGradNoSync(unittest.TestCase):
+    def assertSameParams(self, params1, params2):
+        for p1, p2 in zip(params1, params2):
+            self.assertTrue(torch.allclose(p1, p2, atol=1e-5))
+
+    def test_same_update(self):
+        accum_grad = 4
+        _, params_sync, _ = run(accum_grad, False)[0]
+        _, params_no_sync, message = run(accum_grad, True)[0]
+        self.assertSameParams(params_sync, params_no_sync)
+        self.assertIn("loss=", message)
+
+    def test_uneven_iterators(self):
+        # rank 0 stops at an accumulation boundary, right before the buffer broadcast of the next forward
+        accum_grad = 4
+        outputs_sync = run(accum_grad, False, num_iters=(8, 13), batch_norm=True)
+        outputs_no_sync = run(accum_grad, True, num_iters=(8, 13), batch_norm=True)
+        self.assertSameParams(outputs_no_sync[0][1], outputs_no_sync[1][1])
+        self.assertSameParams(outputs_sync[0][1], outputs_no_sync[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import random
+import unittest
+
+from funasr.bin.asr_inference_paraformer_vad_punc import split_to_mini_batch
+
+
+class TestSplitToMiniBatch(unittest.TestCase):
+    def test_boundaries(self):
+        # sorted: 1(50) 3(80) 0(100) 4(120) 2(300)
+        segments_len = [100, 50, 300, 80, 120]
+        self.assertEqual(split_to_mini_batch(segments_len, 250), [[1, 3], [0, 4], [2]])
+        self.assertEqual(split_to_mini_batch(segments_len, 10 ** 6), [[1, 3, 0, 4, 2]])
+        self.assertEqual(split_to_mini_batch(segments_len, 1), [[1], [3], [0], [4], [2]])
+        self.assertEqual(split_to_mini_batch([], 250), [])
+
+    def test_same_segments_as_sequential(self):
+        rng = random.Random(0)
+        for _ in range(100):
+            segments_len = [rng.randint(1, 500) for _ in range(rng.randint(1, 30))]
+            batch_size_token = rng.randint(1, 2000)
+            mini_batches = split_to_mini_batch(segments_len, batch_size_token)
+            # every segment is decoded exactly once, in length order
+            flat = [k for mini_batch in mini_batches for k in mini_batch]
+            self.assertEqual(sorted(flat), list(range(len(segments_len))))
+            self.assertEqual([segments_len[k] for k in flat], sorted(segments_len))
+            for i, mini_batch in enumerate(mini_batches):
+                padded = max(segments_len[k] for k in mini_batch) * len(mini_batch)
+                if len(mini_batch) > 1:
+                    self.assertLessEqual(padded, batch_size_token)
+                if i + 1 < len(mini_batches):
+                    # a mini-batch is closed only when the next segment doesn't fit
+                    next_len = segments_len[mini_batches[i + 1][0]]
+                    self.assertGreater(next_len * (len(mini_batch) + 1), batch_size_token)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+import torch
+import torchaudio.compliance.kaldi as kaldi
+
+from funasr.models.frontend.wav_frontend import apply_lfr, apply_lfr_batch
+from funasr.models.frontend.wav_frontend import OnlineWavFrontend, WavFrontend
+
+
+def apply_lfr_loop(inputs, lfr_m, lfr_n):
+    # frame by frame stacking as implemented before vectorization
+    LFR_inputs = []
+    T = inputs.shape[0]
+    T_lfr = int(np.ceil(T / lfr_n))
+    left_padding = inputs[0].repeat((lfr_m - 1) // 2, 1)
+    inputs = torch.vstack((left_padding, inputs))
+    T = T + (lfr_m - 1) // 2
+    for i in range(T_lfr):
+        if lfr_m <= T - i * lfr_n:
+            LFR_inputs.append((inputs[i * lfr_n:i * lfr_n + lfr_m]).view(1, -1))
+        else:
+            num_padding = lfr_m - (T - i * lfr_n)
+            frame = (inputs[i * lfr_n:]).view(-1)
+            for _ in range(num_padding):
+                frame = torch.hstack((frame, inputs[-1]))
+            LFR_inputs.append(frame)
+    return torch.vstack(LFR_inputs).type(torch.float32)
+
+
+class TestWavFrontend(unittest.TestCase):
+    def test_apply_lfr(self):
+        torch.manual_seed(0)
+        for T in (1, 2, 6, 7, 97, 600):
+            for lfr_m, lfr_n in ((7, 6), (5, 1)):
+                inputs = torch.randn(T, 80)
+                self.assertTrue(torch.equal(apply_lfr_loop(inputs, lfr_m, lfr_n), apply_lfr(inputs, lfr_m, lfr_n)))
+
+    def test_apply_lfr_batch(self):
+        torch.manual_seed(0)
+        lengths = torch.tensor([97, 600, 13])
+        inputs = torch.randn(3, 600, 80)
+        outputs, output_lengths = apply_lfr_batch(inputs, lengths, 7, 6)
+        for i in range(3):
+            expected = apply_lfr_loop(inputs[i, :lengths[i]], 7, 6)
+            self.assertEqual(output_lengths[i].item(), expected.shape[0])
+            self.assertTrue(torch.equal(outputs[i, :expected.shape[0]], expected))
+            self.assertEqual(outputs[i, expected.shape[0]:].abs().sum().item(), 0.0)
+
+    def test_fbank_batch(self):
+        torch.manual_seed(0)
+        lengths = torch.tensor([16000, 3210, 401, 40000])
+        waveforms = torch.randn(4, 40000) * 0.1
+        for window in ('hamming', 'povey'):
+            frontend = WavFrontend(window=window, dither=0.0)
+            feats, feats_lens = frontend.forward_fbank(waveforms, lengths)
+            for i in range(4):
+                expected = kaldi.fbank(waveforms[i:i + 1, :lengths[i]] * (1 << 15), num_mel_bins=80, frame_length=25,
+                                       frame_shift=10, dither=0.0, energy_floor=0.0, window_type=window,
+                                       sample_frequency=16000)
+                self.assertEqual(feats_lens[i].item(), expected.shape[0])
+                self.assertTrue(torch.allclose(feats[i, :expected.shape[0]], expected, atol=1e-3))
+                self.assertEqual(feats[i, expected.shape[0]:].abs().sum().item(), 0.0)
+
+    def test_online_frontend(self):
+        torch.manual_seed(0)
+        waveform = torch.randn(16000 * 3 + 123) * 0.1
+        cmvn = torch.stack((-torch.randn(560) * 0.1, torch.rand(560) + 0.5))
+        for lfr_m, lfr_n in ((7, 6), (1, 1)):
+            frontend = WavFrontend(lfr_m=lfr_m, lfr_n=lfr_n, dither=0.0)
+            online_frontend = OnlineWavFrontend(lfr_m=lfr_m, lfr_n=lfr_n, dither=0.0)
+            frontend.cmvn = online_frontend.cmvn = cmvn[:, :80 * lfr_m]
+            expected, expected_lens = frontend(waveform[None, :], torch.tensor([waveform.shape[0]]))
+            for chunk_size in (100, 960, 4321):
+                feats = []
+                for offset in range(0, waveform.shape[0], chunk_size):
+                    is_final = offset + chunk_size >= waveform.shape[0]
+                    feats_chunk, feats_chunk_lens = online_frontend.forward_chunk(
+                        waveform[offset:offset + chunk_size], is_final)
+                    self.assertEqual(feats_chunk.shape[1], feats_chunk_lens[0].item())
+                    feats.append(feats_chunk[0])
+                feats = torch.cat(feats)
+                self.assertEqual(feats.shape[0], expected_lens[0].item())
+                self.assertTrue(torch.allclose(feats, expected[0], atol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+import wave
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import torchaudio
+
+from funasr.utils import wav_utils
+from funasr.utils.wav_utils import audio_num_samples, calc_shape, calc_shape_core, wav2num_frame
+
+FRONTEND_CONF = {"frame_shift": 10, "lfr_n": 6, "n_mels": 80, "lfr_m": 7}
+
+
+def write_wav(path, num_samples, fs=16000):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(fs)
+        f.writeframes(np.zeros(num_samples, dtype=np.int16).tobytes())
+
+
+class TestWavShape(unittest.TestCase):
+    def test_header_matches_decoding(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "a.wav")
+            write_wav(path, 12345, fs=8000)
+            waveform, fs = torchaudio.load(path)
+            n_frames, feature_dim, speech_length = wav2num_frame(path, FRONTEND_CONF)
+            self.assertAlmostEqual(speech_length, waveform.shape[1] / fs * 1000.)
+            self.assertAlmostEqual(n_frames, waveform.shape[1] * 1000.0 / (fs * 10 * 6))
+            self.assertEqual(feature_dim, 560)
+
+    def test_decoding_fallback(self):
+        def load(path):
+            return np.zeros((1, 4000)), 8000
+
+        # a torchaudio without info(), the length is decoded
+        with mock.patch.object(wav_utils, "torchaudio", SimpleNamespace(load=load)):
+            self.assertEqual(audio_num_samples("a.flac"), (4000, 8000))
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dataset_dir = os.path.join(tmp_dir, "train")
+            os.makedirs(dataset_dir)
+            with open(os.path.join(dataset_dir, "wav.scp"), "w") as f:
+                for i in range(6):
+                    path = os.path.join(tmp_dir, "{}.wav".format(i))
+                    write_wav(path, 16000 * (i + 1))
+                    f.write("utt{} {}\n".format(i, path))
+            calc_shape(tmp_dir, "train", FRONTEND_CONF, nj=2)
+            with open(os.path.join(dataset_dir, "speech_shape")) as f:
+                expected = f.readlines()
+            self.assertEqual(len(expected), 6)
+
+            # an interrupted job with a truncated last line
+            shape_path = os.path.join(dataset_dir, "shape_files")
+            with open(os.path.join(shape_path, "speech_shape.1"), "w") as f:
+                f.write(expected[0] + expected[1][:5])
+            self.assertEqual(calc_shape_core(shape_path, FRONTEND_CONF, -1, -1, "1"), 2)
+            with open(os.path.join(shape_path, "speech_shape.1")) as f:
+                self.assertEqual(f.readlines(), expected[:3])
+
+    def test_resplit(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dataset_dir = os.path.join(tmp_dir, "train")
+            os.makedirs(dataset_dir)
+            lines = []
+            for i in range(6):
+                path = os.path.join(tmp_dir, "{}.wav".format(i))
+                write_wav(path, 16000 * (i + 1))
+                lines.append("utt{} {}\n".format(i, path))
+            with open(os.path.join(dataset_dir, "wav.scp"), "w") as f:
+                f.writelines(lines)
+            calc_shape(tmp_dir, "train", FRONTEND_CONF, nj=3)
+            shape_path = os.path.join(dataset_dir, "shape_files")
+
+            # another nj and wav.scp, the job files of the previous run are removed
+            os.remove(os.path.join(dataset_dir, "speech_shape"))
+            with open(os.path.join(dataset_dir, "wav.scp"), "w") as f:
+                f.writelines(lines[1:])
+            calc_shape(tmp_dir, "train", FRONTEND_CONF, nj=2)
+            with open(os.path.join(dataset_dir, "speech_shape")) as f:
+                self.assertEqual([line.split()[0] for line in f], ["utt{}".format(i) for i in range(1, 6)])
+            self.assertEqual(
+                sorted(os.listdir(shape_path)),
+                ["speech_shape.1", "speech_shape.2", "split_info", "wav.scp.1", "wav.scp.2"],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()